@@ -4,11 +4,71 @@ Clean dark mode with dotted background and Space Grotesk font
 """
 
 import streamlit as st
-import pickle
-import pandas as pd
 from datetime import datetime
-import io
+import functools
 import os
+import re
+import tempfile
+import time
+
+from applicability import INDIAN_STATES, applies_in
+from artifact_reloader import ArtifactReloader
+from artifact_store import diff_snapshots, list_snapshots, load_type
+from artifacts import RowRecords, StaleArtifactError, artifacts_present, wait_for_version
+from exporter import EXPORT_FORMATS, ExportFileCache, available_formats, export_all_types, export_records
+from instrumentation import count, registry, timed, timer, trace
+from facet_index import FACET_FIELDS
+from query_api import ComplianceQuery, search_compliances
+from result_cache import ResultCache
+from training_job import TrainingJob
+
+# Start of this script run, for the first paint timing
+SCRIPT_STARTED_AT = time.perf_counter()
+
+# How often the artifact watcher checks for a new build
+RELOAD_INTERVAL_SECONDS = 5
+
+# COMPLIANCE_SHARED_ARTIFACTS=1 memory-maps the indexes and metadata read-only, so several
+# server processes on one host share a single copy of them
+SHARED_ARTIFACTS = os.environ.get('COMPLIANCE_SHARED_ARTIFACTS') == '1'
+
+# Source the background training job builds the artifacts from, and how often its progress is redrawn
+SOURCE_FILE = 'mop_updated.xlsx'
+PROGRESS_POLL_SECONDS = 0.5
+
+# Compliance list pagination
+PAGE_SIZES = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = 25
+PAGE_CACHE_ENTRIES = 512
+
+# Data export
+PREVIEW_ROWS = 1000
+
+# Snapshot diffs and company type contents kept for the change history tab
+HISTORY_CACHE_ENTRIES = 64
+
+# Facet filter labels, in FACET_FIELDS order
+FACET_LABELS = {
+    'authority': "Authority",
+    'regulation_type': "Regulation Type",
+    'jurisdiction': "Jurisdiction",
+    'state': "State",
+    'mandatory': "Mandatory",
+}
+
+# Multi company type combination modes offered in the sidebar
+COMBINE_MODES = {
+    "Union": 'union',
+    "Shared by all": 'intersection',
+    "Unique to each type": 'diff',
+}
+
+# Portfolio formats accepted by the change impact tab, as read by batch_score.read_entities
+PORTFOLIO_TYPES = ['csv', 'parquet']
+
+# Typeahead matches listed under "Jump To", and company types offered per matching regulation
+JUMP_MATCHES = 8
+JUMP_REGULATION_TYPES = 4
 
 # Page configuration
 st.set_page_config(
@@ -18,7 +78,7 @@ st.set_page_config(
 )
 
 # Custom CSS for Minimal Dark UI with Dotted Background
-st.markdown("""
+APP_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@300;400;500;600;700&display=swap');
     
@@ -234,32 +294,142 @@ st.markdown("""
         letter-spacing: 0.1em;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource(show_spinner=False)
+def minified_css():
+    """APP_CSS without comments and redundant whitespace, computed once per process"""
+    css = re.sub(r'/\*.*?\*/', '', APP_CSS, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).strip()
+
+# Streamlit drops elements a rerun doesn't emit again, so the styles can't be sent once per
+# session; sending them minified keeps the per-rerun cost down
+st.markdown(minified_css(), unsafe_allow_html=True)
 
 @st.cache_resource
+def get_training_job():
+    """Background build of the artifacts, shared by every session so only one runs at a time"""
+    return TrainingJob(SOURCE_FILE)
+
+def follow_training(job, placeholder):
+    """Redraw the job's progress in a placeholder until it finishes; returns its final status"""
+    while True:
+        status = job.status()
+        if status['state'] != 'running':
+            return status
+        placeholder.progress(status['progress'], text=status['label'])
+        time.sleep(PROGRESS_POLL_SECONDS)
+
+def show_training_error(status):
+    """Explain a failed build and stop the script"""
+    st.error(f"Initialization Error: {status['error']}")
+    st.info(f"Ensure '{SOURCE_FILE}' and 'train_model.py' are present in the repository.")
+    st.stop()
+
+def wait_for_artifacts():
+    """Build missing artifacts in the background, showing its progress until they are ready"""
+    if artifacts_present():
+        return
+    # Every session waiting here follows the same build instead of starting its own
+    job = get_training_job().start(only_if_missing=True)
+    notice = st.empty()
+    with notice.container():
+        st.markdown("<p style='color: #94a3b8; margin: 2rem 0 1rem 0;'>Initializing data matrix... this may take a moment.</p>", unsafe_allow_html=True)
+        progress = st.empty()
+    status = follow_training(job, progress)
+    notice.empty()
+    if status['state'] == 'failed':
+        show_training_error(status)
+
+@st.cache_resource
+@timed('load_model')
 def load_model():
-    """Load the trained model and metadata, or train if missing"""
+    """Open the trained model and metadata and start watching them for new builds"""
     try:
-        required_files = ['compliance_model.pkl', 'company_metadata.pkl', 'company_types.pkl']
-        if not all(os.path.exists(f) for f in required_files):
-            with st.spinner("Initializing data matrix... this may take a moment."):
-                from train_model import load_and_preprocess_data, create_company_compliance_mapping, save_model_artifacts
-                df = load_and_preprocess_data('mop_updated.xlsx')
-                mapping = create_company_compliance_mapping(df)
-                save_model_artifacts(mapping, df)
-        
-        with open('compliance_model.pkl', 'rb') as f:
-            model = pickle.load(f)
-        with open('company_metadata.pkl', 'rb') as f:
-            metadata = pickle.load(f)
-        with open('company_types.pkl', 'rb') as f:
-            company_types = pickle.load(f)
-        return model, metadata, company_types
+        # Open lazily for a fast first paint; the watcher thread loads the rest in the background
+        loader = functools.partial(ComplianceQuery, shared=SHARED_ARTIFACTS)
+        return ArtifactReloader(interval=RELOAD_INTERVAL_SECONDS, loader=loader, lazy=True).start()
     except Exception as e:
         st.error(f"Initialization Error: {str(e)}")
-        st.info("Ensure 'mop_updated.xlsx' and 'train_model.py' are present in the repository.")
+        st.info(f"Ensure '{SOURCE_FILE}' and 'train_model.py' are present in the repository.")
         st.stop()
 
+@st.cache_resource
+def get_startup_metrics(_started_at):
+    """Cold start timings of this server process, recorded by its first script run"""
+    return {'started_at': _started_at, 'first_paint_seconds': None}
+
+@st.cache_resource
+def get_result_cache():
+    """Query result cache shared by every session"""
+    return ResultCache()
+
+def cached_result(query, key, compute):
+    """Result of compute() for a query key, reused across reruns and sessions until the artifacts change"""
+    return get_result_cache().get_or_compute(query.version, key, compute)
+
+def display_artifact_metrics(metrics, cache_stats, startup):
+    """Display artifact version, load latency, first paint and result cache counters in the sidebar"""
+    last_reload = metrics['last_reload_seconds']
+    first_paint = startup['first_paint_seconds']
+    with st.expander("Artifacts"):
+        st.markdown(f"""
+        <p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>Version: <span style='color: #ffffff; font-weight: 600;'>{metrics['version']}</span></p>
+        <p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>Startup load: <span style='color: #ffffff; font-weight: 600;'>{metrics['startup_seconds'] * 1000:.1f} ms</span></p>
+        <p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>First paint: <span style='color: #ffffff; font-weight: 600;'>{f"{first_paint * 1000:.1f} ms" if first_paint is not None else "-"}</span></p>
+        <p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>Reloads: <span style='color: #ffffff; font-weight: 600;'>{metrics['reload_count']}</span></p>
+        <p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>Last reload: <span style='color: #ffffff; font-weight: 600;'>{f"{last_reload * 1000:.1f} ms" if last_reload is not None else "-"}</span></p>
+        <p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>Result cache: <span style='color: #ffffff; font-weight: 600;'>{cache_stats['hits']} hits / {cache_stats['misses']} misses, {cache_stats['entries']} entries</span></p>
+        """, unsafe_allow_html=True)
+        if metrics['last_reload_error']:
+            st.warning(f"Last reload failed: {metrics['last_reload_error']}")
+
+def display_rebuild(job):
+    """Rebuild button and the outcome of the last build; returns a placeholder for a running build's progress"""
+    # Started from the click callback, so the rerun after the build can't start it again
+    status = job.status()
+    st.button("Rebuild Artifacts", on_click=job.start, disabled=status['state'] == 'running',
+              help="Retrain from the source workbook in the background; the current artifacts stay in use until it finishes")
+    if status['state'] == 'done':
+        st.caption(f"Last build finished in {status['seconds']:.1f}s")
+    elif status['state'] == 'failed':
+        st.warning(f"Last build failed: {status['error']}")
+    return st.empty()
+
+def display_diagnostics():
+    """Display stage timings of the last rerun and totals since startup in the sidebar"""
+    with st.expander("Diagnostics"):
+        last = registry.last_trace('rerun')
+        if last is not None:
+            st.markdown(f"<p style='color: #64748b; font-size: 0.75rem; margin-bottom: 0.5rem; font-weight: 600;'>LAST RERUN: {last['seconds'] * 1000:.1f} MS</p>", unsafe_allow_html=True)
+            for stage in last['stages']:
+                st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>{stage['stage']}: <span style='color: #ffffff; font-weight: 600;'>{stage['seconds'] * 1000:.1f} ms</span></p>", unsafe_allow_html=True)
+        
+        stats = registry.stage_stats()
+        if stats:
+            import pandas as pd
+
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        'stage': stage,
+                        'count': s['count'],
+                        'mean ms': s['total_seconds'] / s['count'] * 1000,
+                        'max ms': s['max_seconds'] * 1000,
+                    }
+                    for stage, s in sorted(stats.items())
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
+        st.download_button(
+            label="Prometheus Metrics",
+            data=registry.prometheus_text(),
+            file_name="compliance_metrics.prom",
+            mime="text/plain"
+        )
+
 def display_header():
     """Display the app header"""
     st.markdown("""
@@ -298,9 +468,9 @@ def display_stats(total_compliances, regulation_types):
         </div>
         """, unsafe_allow_html=True)
 
-def display_compliance_item(compliance):
-    """Display a single compliance item"""
-    st.markdown(f"""
+def compliance_item_html(compliance):
+    """HTML for a single compliance item"""
+    return f"""
     <div class="compliance-item">
         <span class="compliance-id">{compliance['obligation_id']}</span>
         <div class="compliance-title">{compliance['title']}</div>
@@ -312,17 +482,312 @@ def display_compliance_item(compliance):
             <span class="info-badge mandatory-badge">{compliance['mandatory']}</span>
         </div>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+def display_compliance_item(compliance):
+    """Display a single compliance item"""
+    st.markdown(compliance_item_html(compliance), unsafe_allow_html=True)
+
+def jump_to(company_type, row=None):
+    """Button callback: select a company type, and the obligation row to show first if any"""
+    st.session_state['company_type'] = company_type
+    st.session_state['jump_target'] = (company_type, row)
+
+def display_jump_matches(query, text):
+    """Typeahead matches for the "Jump To" box, each a button selecting its company type"""
+    with timer('typeahead'):
+        matches = cached_result(query, ('typeahead', text), lambda: query.typeahead(text, JUMP_MATCHES))
+    if not matches:
+        st.caption("No matching types, regulations or obligations")
+    for match in matches:
+        kind = match['kind'].replace('_', ' ')
+        hint = f"{kind}, {match['distance']} typo{'s' if match['distance'] > 1 else ''} away" if match['distance'] else kind
+        key = f"jump_{match['kind']}_{match['label']}"
+        if match['kind'] == 'regulation':
+            company_types = match['company_types']
+            st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.5rem 0 0.2rem 0;'>{match['label']} <span style='color: #64748b;'>· {hint}, {len(company_types)} types</span></p>", unsafe_allow_html=True)
+            for column, company_type in zip(st.columns(JUMP_REGULATION_TYPES), company_types[:JUMP_REGULATION_TYPES]):
+                with column:
+                    st.button(company_type, key=f"{key}_{company_type}", on_click=jump_to, args=(company_type,))
+        else:
+            st.button(f"{match['label']} · {hint}", key=key, on_click=jump_to, args=(match['company_types'][0], match['row']))
+
+@st.cache_data(max_entries=PAGE_CACHE_ENTRIES, show_spinner=False)
+def render_page_html(version, result_key, page, page_size, _compliances):
+    """One HTML payload for a page of results, cached per artifact version and query"""
+    count('page_cache_misses')
+    page_items = _compliances[page * page_size:(page + 1) * page_size]
+    return '<div class="matrix-card">' + ''.join(compliance_item_html(c) for c in page_items) + '</div>'
+
+def display_compliance_page(compliances, version, result_key):
+    """Display one page of the compliance list with page controls"""
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        page_size = st.selectbox("Per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE))
+    page_count = max(1, -(-len(compliances) // page_size))
+    with col1:
+        # Keyed by the result set so a new search starts again from the first page
+        page = st.number_input(
+            f"Page (of {page_count})",
+            min_value=1,
+            max_value=page_count,
+            value=1,
+            key=f"page_{hash((result_key, page_size))}"
+        ) - 1
+    
+    first = page * page_size
+    last = min(first + page_size, len(compliances))
+    st.markdown(f"<p style='color: #64748b; font-size: 0.8rem; margin: 1.5rem 0;'>Showing {first + 1}-{last} of {len(compliances)} records</p>", unsafe_allow_html=True)
+    with timer('render_page'):
+        st.markdown(render_page_html(version, result_key, page, page_size, compliances), unsafe_allow_html=True)
+
+def display_facet_filters(query, base_key, row_range=None, rows=None):
+    """Multi-facet filter controls with live counts; returns the selected values per field"""
+    # Widgets are keyed by the base result, so a new type or search clears the filters
+    keys = {field: f"facet_{field}_{hash(base_key)}" for field in FACET_FIELDS}
+    selections = {field: st.session_state.get(key, []) for field, key in keys.items()}
+    with timer('facet_counts'):
+        counts = cached_result(
+            query,
+            ('facet_counts', base_key, tuple((field, tuple(selected)) for field, selected in selections.items())),
+            lambda: query.facets.counts(selections, row_range, rows)
+        )
+    
+    for column, field in zip(st.columns(len(FACET_FIELDS)), FACET_FIELDS):
+        field_counts = counts[field]
+        options = list(field_counts) + [v for v in selections[field] if v not in field_counts]
+        with column:
+            st.multiselect(
+                FACET_LABELS[field],
+                options,
+                key=keys[field],
+                format_func=lambda value, c=field_counts: f"{value} ({c.get(value, 0)})"
+            )
+    return {field: selected for field, selected in selections.items() if selected}
+
+def scope_to_states(query, compliances, states):
+    """The compliances that apply in any of the operating states, all of them when none are given"""
+    if not states:
+        return compliances
+    if isinstance(compliances, RowRecords) and query.applicability is not None:
+        return RowRecords(compliances.model, query.applicability.restrict(compliances.rows, states))
+    return [c for c in compliances if applies_in(c, states)]
+
+def combined_compliances(query, company_types, mode, search_term=None, states=()):
+    """Compliances of several company types combined by set operation, as one list"""
+    def combine():
+        combined = query.combine(company_types, mode, search_term)
+        if isinstance(combined, dict):
+            combined = [c for compliances in combined.values() for c in compliances]
+        return scope_to_states(query, combined, states)
+    
+    with timer('combine'):
+        return cached_result(query, ('combine', tuple(company_types), mode, search_term, states), combine)
+
+@st.cache_resource
+def get_export_files():
+    """Prepared export files on disk, shared by every session"""
+    return ExportFileCache()
+
+def open_export(version, result_key, fmt, compliances):
+    """Export file of a result set, written on first request per artifact version, query and format"""
+    def write(out):
+        with timer(f'export_{fmt}'):
+            export_records(compliances, fmt, out)
+    return get_export_files().open(version, ('results', result_key, fmt), EXPORT_FORMATS[fmt][1], write)
+
+def open_archive(version, fmt, query):
+    """Zip archive file with every company type, written on first request per artifact version and format"""
+    def write(out):
+        with timer(f'export_archive_{fmt}'):
+            export_all_types(query, fmt, out)
+    return get_export_files().open(version, ('archive', fmt), 'zip', write)
+
+@st.cache_data(max_entries=HISTORY_CACHE_ENTRIES, show_spinner=False)
+def snapshot_diff(old_id, new_id):
+    """Diff of two snapshots; snapshots are immutable, so it is cached by their ids alone"""
+    with timer('snapshot_diff'):
+        return diff_snapshots(old_id, new_id)
 
-def get_csv_buffer(df):
-    """Convert dataframe to CSV buffer for download"""
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    return csv_buffer.getvalue()
+@st.cache_data(max_entries=HISTORY_CACHE_ENTRIES, show_spinner=False)
+def snapshot_titles(digest):
+    """obligation_id -> title of a stored company type content"""
+    return {str(c['obligation_id']): c.get('title', '') for c in load_type(digest)['compliances']}
+
+def display_history_tab(selected_types):
+    """Obligations added, removed or modified between two training snapshots"""
+    history = list_snapshots()
+    if len(history) < 2:
+        st.info("Change history appears once the model has been trained on two different data snapshots.")
+        return
+    
+    labels = {
+        entry['id']: f"{entry['id']} · {entry['created'].replace('T', ' ')}" + (f" · {entry['label']}" if entry.get('label') else '')
+        for entry in history
+    }
+    newest_first = list(dict.fromkeys(entry['id'] for entry in reversed(history)))
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        old_id = st.selectbox("From snapshot", newest_first, index=min(1, len(newest_first) - 1), format_func=labels.get)
+    with col2:
+        new_id = st.selectbox("To snapshot", newest_first, format_func=labels.get)
+    
+    diff = snapshot_diff(old_id, new_id)
+    changed = diff['changed']
+    st.markdown(f"<p style='color: #64748b; font-size: 0.8rem; margin: 1.5rem 0;'>{len(changed)} company types changed, {len(diff['added_types'])} added, {len(diff['removed_types'])} removed</p>", unsafe_allow_html=True)
+    
+    show_all = st.checkbox("Show all changed company types")
+    shown = list(changed) if show_all else [ct for ct in selected_types if ct in changed]
+    if not shown:
+        st.info("No changes to the selected company types between these snapshots.")
+    for company_type in shown:
+        changes = changed[company_type]
+        st.markdown(f"<h3 style='margin: 1.5rem 0 0.5rem 0; font-weight: 600;'>{company_type} <span style='color: #64748b; font-size: 0.8rem; font-weight: 400;'>+{len(changes['added'])} -{len(changes['removed'])} ~{len(changes['modified'])}</span></h3>", unsafe_allow_html=True)
+        # Titles come from the stored contents of the changed types only
+        new_titles = snapshot_titles(changes['after']) if changes['after'] else {}
+        old_titles = snapshot_titles(changes['before']) if changes['before'] else {}
+        for marker, key, titles in (('+', 'added', new_titles), ('-', 'removed', old_titles), ('~', 'modified', new_titles)):
+            for obligation_id in changes[key]:
+                st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>{marker} <span style='color: #ffffff; font-weight: 600;'>{obligation_id}</span> {titles.get(obligation_id, '')}</p>", unsafe_allow_html=True)
+
+def count_affected_entities(query, regulations, authorities, upload):
+    """Impact report over an uploaded portfolio of entities"""
+    from batch_score import read_entities
+
+    # read_entities reads from a path, so the upload is spooled to a file of the same format
+    suffix = os.path.splitext(upload.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        f.write(upload.getvalue())
+        f.flush()
+        return query.impact(regulations, authorities, read_entities(f.name))
+
+def display_impact_tab(query, selected_types):
+    """Company types and portfolio entities affected by amended regulations or authorities"""
+    if not query.has_artifact('impact_index'):
+        st.info("Change impact analysis needs the impact index; retrain the model with train_model.py.")
+        return
+    index = query.impact_index
+    
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        regulations = st.multiselect("Amended regulations", index.names('regulation'))
+    with col2:
+        authorities = st.multiselect("Issuing authorities", index.names('authority'))
+    pasted = st.text_area("Or paste a list of amended regulations, one per line", height=100)
+    regulations = list(dict.fromkeys(regulations + [line.strip() for line in pasted.splitlines() if line.strip()]))
+    upload = st.file_uploader("Entity portfolio (optional)", type=PORTFOLIO_TYPES,
+                              help="Columns entity_id, company_types and optionally states, as for batch_score.py")
+    if not regulations and not authorities:
+        st.info("Choose or paste the amended regulations or authorities to see what they affect.")
+        return
+    
+    key = ('impact', tuple(regulations), tuple(authorities), upload.file_id if upload else None)
+    try:
+        with timer('impact'):
+            if upload is None:
+                report = cached_result(query, key, lambda: query.impact(regulations, authorities))
+            else:
+                report = cached_result(query, key, lambda: count_affected_entities(query, regulations, authorities, upload))
+    except ValueError as e:
+        st.error(f"✗ {e}")
+        return
+    
+    summary = f"{len(report['company_types'])} company types affected"
+    if 'entities' in report:
+        summary += f", {report['entities']:,} of {report['entities_read']:,} entities"
+    st.markdown(f"<p style='color: #64748b; font-size: 0.8rem; margin: 1.5rem 0;'>{summary}</p>", unsafe_allow_html=True)
+    selected = [ct for ct in selected_types if ct in report['company_types']]
+    if selected:
+        st.warning(f"⚠ Affects the selected {', '.join(selected)}")
+    
+    # Deferred like the export preview
+    import pandas as pd
+
+    st.dataframe(
+        pd.DataFrame([
+            {
+                'Kind': result['kind'].title(),
+                'Name': result['name'] or f"{result['query']} (no obligations)",
+                'Obligations': result['obligations'],
+                'Company Types': len(result['company_types']),
+                **({'Entities': result['entities']} if 'entities' in result else {}),
+            }
+            for result in report['results']
+        ]),
+        use_container_width=True,
+        hide_index=True
+    )
+    for result in report['results']:
+        if result['company_types']:
+            types = ', '.join(f"{ct} ({n})" for ct, n in result['company_types'].items())
+            st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'><span style='color: #ffffff; font-weight: 600;'>{result['name']}</span> {types}</p>", unsafe_allow_html=True)
+
+def display_export_tab(query, compliances, result_key, selected_types):
+    """Data preview plus on-demand exports of the current results and of all company types"""
+    st.markdown("<h2 style='margin: 2rem 0 1rem 0; font-weight: 600;'>Data Preview</h2>", unsafe_allow_html=True)
+    
+    if compliances:
+        # Deferred so pages that never preview data don't pay for the import
+        import pandas as pd
+
+        st.dataframe(
+            pd.DataFrame(list(compliances[:PREVIEW_ROWS])),
+            use_container_width=True,
+            hide_index=True
+        )
+        if len(compliances) > PREVIEW_ROWS:
+            st.caption(f"Previewing the first {PREVIEW_ROWS:,} of {len(compliances):,} records")
+        
+        st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            fmt = st.selectbox("Format", [f.upper() for f in available_formats()]).lower()
+        export_key = (query.version, result_key, fmt)
+        with col2:
+            st.markdown("<div style='margin-top: 1.7rem;'></div>", unsafe_allow_html=True)
+            if st.button("Prepare Export"):
+                st.session_state['prepared_export'] = export_key
+        
+        # Exports are only written once asked for, then served from their file on disk
+        if st.session_state.get('prepared_export') == export_key:
+            mime, extension = EXPORT_FORMATS[fmt]
+            with open_export(query.version, result_key, fmt, compliances) as export_file:
+                st.download_button(
+                    label=f"Download {fmt.upper()}",
+                    data=export_file,
+                    file_name=f"compliance_matrix_{'_'.join(selected_types)}.{extension}",
+                    mime=mime
+                )
+    else:
+        st.info("No data available to export.")
+    
+    st.markdown("<h2 style='margin: 3rem 0 1rem 0; font-weight: 600;'>All Company Types</h2>", unsafe_allow_html=True)
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        archive_fmt = st.selectbox("Archive format", [f.upper() for f in available_formats()]).lower()
+    archive_key = (query.version, archive_fmt)
+    with col2:
+        st.markdown("<div style='margin-top: 1.7rem;'></div>", unsafe_allow_html=True)
+        if st.button("Prepare Archive"):
+            st.session_state['prepared_archive'] = archive_key
+    if st.session_state.get('prepared_archive') == archive_key:
+        with open_archive(query.version, archive_fmt, query) as archive_file:
+            st.download_button(
+                label="Download ZIP",
+                data=archive_file,
+                file_name=f"compliance_matrix_all_{archive_fmt}.zip",
+                mime="application/zip"
+            )
 
 def main():
     """Main application function"""
-    model, metadata, company_types = load_model()
+    wait_for_artifacts()
+    reloader = load_model()
+    training_job = get_training_job()
+    # One snapshot per rerun, so a background reload never mixes artifact versions
+    query = reloader.snapshot()
+    # Only the company types are needed for the welcome screen; everything else loads on first use
+    company_types = query.company_types
     
     display_header()
     
@@ -330,15 +795,33 @@ def main():
     with st.sidebar:
         st.markdown("<p style='font-weight: 600; color: #ffffff; margin-bottom: 1.5rem; letter-spacing: 0.05em;'>CONFIGURATION</p>", unsafe_allow_html=True)
         
+        if query.has_artifact('lookup_index'):
+            jump_text = st.text_input("Jump To", placeholder="Type code, regulation or obligation ID")
+            if jump_text:
+                display_jump_matches(query, jump_text)
+        
         selected_company = st.selectbox(
             "Company Type",
             options=[""] + company_types,
-            format_func=lambda x: "Select Type" if x == "" else x
+            format_func=lambda x: "Select Type" if x == "" else x,
+            key='company_type'
         )
-        
-        if selected_company and selected_company in metadata:
+
+        if query.has_artifact('similarity'):
+            description = st.text_input("Describe Your Company", placeholder="e.g. biomass co-firing plant")
+            if description:
+                with timer('predict_company_types'):
+                    suggestions = query.predict_company_types(description)
+                if suggestions:
+                    st.markdown("<p style='color: #64748b; font-size: 0.75rem; margin-bottom: 0.5rem; font-weight: 600;'>LIKELY TYPES</p>", unsafe_allow_html=True)
+                    for suggestion in suggestions:
+                        st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>{suggestion['company_type']}: <span style='color: #ffffff; font-weight: 600;'>{suggestion['score']:.2f}</span></p>", unsafe_allow_html=True)
+                else:
+                    st.caption("No matching company types")
+
+        if selected_company and selected_company in query.metadata:
             st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
-            meta = metadata[selected_company]
+            meta = query.metadata[selected_company]
             
             st.markdown(f"""
             <div class="matrix-card">
@@ -348,68 +831,152 @@ def main():
             """, unsafe_allow_html=True)
             
             st.markdown("<p style='color: #64748b; font-size: 0.75rem; margin-bottom: 0.5rem; font-weight: 600;'>DISTRIBUTION</p>", unsafe_allow_html=True)
-            for reg_type, count in sorted(meta['regulation_types'].items(), key=lambda x: x[1], reverse=True)[:3]:
-                st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>{reg_type}: <span style='color: #ffffff; font-weight: 600;'>{count}</span></p>", unsafe_allow_html=True)
+            for reg_type, n in sorted(meta['regulation_types'].items(), key=lambda x: x[1], reverse=True)[:3]:
+                st.markdown(f"<p style='color: #94a3b8; font-size: 0.8rem; margin: 0.2rem 0;'>{reg_type}: <span style='color: #ffffff; font-weight: 600;'>{n}</span></p>", unsafe_allow_html=True)
+        
+        operating_states = []
+        if selected_company and query.applicability is not None:
+            st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
+            operating_states = st.multiselect(
+                "Operating States",
+                options=sorted(set(INDIAN_STATES) | set(query.applicability.states)),
+                help="Show nationwide obligations plus those of these states; leave empty for all states"
+            )
+        
+        combine_with = []
+        if selected_company and query.obligation_sets is not None:
+            st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
+            combine_with = st.multiselect(
+                "Combine With",
+                options=[ct for ct in company_types if ct != selected_company]
+            )
+            if combine_with:
+                combine_mode = COMBINE_MODES[st.radio("Combination", list(COMBINE_MODES))]
+        
+        st.markdown("<div style='margin-top: 2rem;'></div>", unsafe_allow_html=True)
+        display_artifact_metrics(reloader.metrics, get_result_cache().stats(), get_startup_metrics(SCRIPT_STARTED_AT))
+        training_progress = display_rebuild(training_job)
+        if registry.enabled:
+            display_diagnostics()
     
     # Main content
     if selected_company and selected_company != "":
+        model, metadata = query.model, query.metadata
         if selected_company in model:
-            compliances = model[selected_company]
+            selected_types = [selected_company] + combine_with
             
-            display_stats(
-                len(compliances),
-                metadata[selected_company]['regulation_types']
-            )
+            states = tuple(operating_states)
+            if combine_with:
+                compliances = combined_compliances(query, selected_types, combine_mode, states=states)
+                display_stats(
+                    len(compliances),
+                    cached_result(
+                        query,
+                        ('regulation_types', tuple(selected_types), combine_mode, states),
+                        lambda: {c['regulation_type'] for c in compliances}
+                    )
+                )
+            elif states:
+                with timer('applicable'):
+                    compliances = cached_result(
+                        query,
+                        ('applicable', selected_company, states),
+                        lambda: RowRecords(model, query.applicability.applicable_rows([selected_company], states))
+                    )
+                display_stats(
+                    len(compliances),
+                    cached_result(
+                        query,
+                        ('regulation_types', selected_company, states),
+                        lambda: {c['regulation_type'] for c in compliances[:]}
+                    )
+                )
+            else:
+                with timer('lookup'):
+                    compliances = cached_result(query, ('lookup', selected_company), lambda: model[selected_company])
+                display_stats(
+                    len(compliances),
+                    metadata[selected_company]['regulation_types']
+                )
+            
+            # Obligation picked under "Jump To", shown until another type is selected
+            jump_type, jump_row = st.session_state.get('jump_target') or (None, None)
+            if jump_type == selected_company and jump_row is not None:
+                st.markdown("<p style='color: #64748b; font-size: 0.75rem; margin: 1.5rem 0 0.5rem 0; font-weight: 600;'>JUMPED TO</p>", unsafe_allow_html=True)
+                display_compliance_item(RowRecords(model, [jump_row])[0])
             
             # Search
             search_term = st.text_input("Search Matrix", placeholder="Filter by keyword...")
             
-            if search_term:
-                filtered_compliances = [
-                    c for c in compliances 
-                    if search_term.lower() in c['title'].lower() 
-                    or search_term.lower() in c['description'].lower()
-                ]
+            search_all = False
+            facet_selections = {}
+            if combine_with:
+                filtered_compliances = (
+                    combined_compliances(query, selected_types, combine_mode, search_term, states)
+                    if search_term else compliances
+                )
             else:
-                filtered_compliances = compliances
+                search_all = st.checkbox("Search across all company types")
+                if search_term:
+                    with timer('search'):
+                        search_type = None if search_all else selected_company
+                        filtered_compliances = cached_result(
+                            query,
+                            ('search', search_type, search_term, states),
+                            lambda: scope_to_states(
+                                query,
+                                search_compliances(model, query.search_index, search_term, company_type=search_type, lazy=True),
+                                states
+                            )
+                        )
+                else:
+                    filtered_compliances = compliances
+                
+                # Facet filters over the type's rows, or over the indexed search results
+                facet_rows = filtered_compliances.rows if isinstance(filtered_compliances, RowRecords) else None
+                if query.facets is not None and (facet_rows is not None or not search_term):
+                    row_range = None if search_all else query.facets.row_range(selected_company)
+                    facet_selections = display_facet_filters(
+                        query, (selected_company, search_term, search_all, states), row_range, facet_rows
+                    )
+                    if facet_selections:
+                        facet_key = (
+                            'facet_filter', selected_company, search_term, search_all, states,
+                            tuple((field, tuple(values)) for field, values in facet_selections.items())
+                        )
+                        with timer('facet_filter'):
+                            filtered_compliances = cached_result(
+                                query,
+                                facet_key,
+                                lambda: RowRecords(model, query.facets.filter(facet_selections, row_range, facet_rows))
+                            )
             
             # Tabs
-            tab1, tab2 = st.tabs(["Compliance List", "Data Export"])
+            tab1, tab2, tab3, tab4 = st.tabs(["Compliance List", "Data Export", "Change History", "Change Impact"])
+            result_key = (
+                tuple(selected_types),
+                combine_mode if combine_with else None,
+                search_term,
+                search_all,
+                states,
+                tuple((field, tuple(values)) for field, values in facet_selections.items())
+            )
             
             with tab1:
-                st.markdown(f"<p style='color: #64748b; font-size: 0.8rem; margin: 1.5rem 0;'>Showing {len(filtered_compliances)} records</p>", unsafe_allow_html=True)
-                
                 if filtered_compliances:
-                    st.markdown('<div class="matrix-card">', unsafe_allow_html=True)
-                    for compliance in filtered_compliances:
-                        display_compliance_item(compliance)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                    display_compliance_page(filtered_compliances, query.version, result_key)
                 else:
+                    st.markdown("<p style='color: #64748b; font-size: 0.8rem; margin: 1.5rem 0;'>Showing 0 records</p>", unsafe_allow_html=True)
                     st.info("No records match your search.")
             
             with tab2:
-                st.markdown("<h2 style='margin: 2rem 0 1rem 0; font-weight: 600;'>Data Preview</h2>", unsafe_allow_html=True)
-                
-                if filtered_compliances:
-                    export_df = pd.DataFrame(filtered_compliances)
-                    
-                    st.dataframe(
-                        export_df,
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                    
-                    st.markdown("<div style='margin-top: 2rem; text-align: center;'>", unsafe_allow_html=True)
-                    csv_data = get_csv_buffer(export_df)
-                    st.download_button(
-                        label="Download CSV",
-                        data=csv_data,
-                        file_name=f"compliance_matrix_{selected_company}.csv",
-                        mime="text/csv"
-                    )
-                    st.markdown("</div>", unsafe_allow_html=True)
-                else:
-                    st.info("No data available to export.")
+                display_export_tab(query, filtered_compliances, result_key, selected_types)
+            
+            with tab3:
+                display_history_tab(selected_types)
+            
+            with tab4:
+                display_impact_tab(query, selected_types)
         else:
             st.warning(f"No data for {selected_company}")
     else:
@@ -429,6 +996,22 @@ def main():
         COMPLIANCE MATRIX // PROFESSIONAL DATA EXPORT // 2026
     </div>
     """, unsafe_allow_html=True)
+    
+    # The page above is served from the current artifacts while a rebuild runs; swap once it's published
+    if training_job.running():
+        follow_training(training_job, training_progress)
+        reloader.check()
+        st.rerun()
 
 if __name__ == "__main__":
-    main()
+    startup = get_startup_metrics(SCRIPT_STARTED_AT)
+    with trace('rerun'):
+        try:
+            main()
+        except StaleArtifactError:
+            # A new build was published while this rerun loaded the old one; switch to it and render again
+            wait_for_version()
+            load_model().check()
+            st.rerun()
+    if startup['first_paint_seconds'] is None:
+        startup['first_paint_seconds'] = time.perf_counter() - startup['started_at']
@@ -0,0 +1,193 @@
+"""
+Compliance Applicability Engine
+Precomputed (company type, state) index of the obligations that apply to companies operating in given states
+"""
+
+import re
+
+import numpy as np
+
+from artifacts import (
+    CompanyTypeRows, company_type_offsets, concatenate, is_missing, load_index, merge_vocabularies, save_index
+)
+
+APPLICABILITY_FILE = 'applicability.npz'
+APPLICABILITY_VERSION = 1
+
+# State values meaning an obligation applies everywhere (compared after normalize_state)
+NATIONWIDE_STATES = {'all india', 'all states'}
+STATE_SEPARATOR = re.compile(r'[,;]')
+
+# States and union territories offered as operating locations, whether or not they have state-level obligations yet
+INDIAN_STATES = [
+    'Andaman and Nicobar Islands', 'Andhra Pradesh', 'Arunachal Pradesh', 'Assam', 'Bihar',
+    'Chandigarh', 'Chhattisgarh', 'Dadra and Nagar Haveli and Daman and Diu', 'Delhi', 'Goa',
+    'Gujarat', 'Haryana', 'Himachal Pradesh', 'Jammu and Kashmir', 'Jharkhand', 'Karnataka',
+    'Kerala', 'Ladakh', 'Lakshadweep', 'Madhya Pradesh', 'Maharashtra', 'Manipur', 'Meghalaya',
+    'Mizoram', 'Nagaland', 'Odisha', 'Puducherry', 'Punjab', 'Rajasthan', 'Sikkim', 'Tamil Nadu',
+    'Telangana', 'Tripura', 'Uttar Pradesh', 'Uttarakhand', 'West Bengal',
+]
+
+def normalize_state(name):
+    """Case- and whitespace-insensitive form of a state name"""
+    return ' '.join(str(name).split()).casefold()
+
+def obligation_states(value):
+    """Normalized states an obligation is limited to, or None when it applies nationwide.
+
+    Missing states count as nationwide, like the 'All India' default of the training data;
+    several states may be listed separated by commas or semicolons.
+    """
+    if is_missing(value):
+        return None
+    states = {normalize_state(part) for part in STATE_SEPARATOR.split(str(value)) if part.strip()}
+    if not states or states & NATIONWIDE_STATES:
+        return None
+    return states
+
+def applies_in(compliance, states):
+    """Whether a compliance applies to a company operating in any of the given states"""
+    scope = obligation_states(compliance.get('state'))
+    return scope is None or not scope.isdisjoint(normalize_state(state) for state in states)
+
+class ApplicabilityIndex(CompanyTypeRows):
+    """Nationwide flag per global row plus one sorted posting list per (state, company type) pair.
+
+    Rows are numbered like the columnar model, so a company type is a contiguous
+    row range and its nationwide rows are one slice of the nationwide postings.
+    Resolving a site is a dictionary lookup and a slice per company type.
+    """
+
+    def __init__(self, company_types, type_offsets, states, national, pair_keys, pair_offsets, pair_rows):
+        super().__init__(company_types, type_offsets)
+        self.states = list(states)
+        self.national = national
+        self.pair_keys = pair_keys
+        self.pair_offsets = pair_offsets
+        self.pair_rows = pair_rows
+        self._state_ids = {normalize_state(state): i for i, state in enumerate(self.states)}
+        self._pairs = {key: i for i, key in enumerate(pair_keys.tolist())}
+        self.national_rows = np.flatnonzero(national)
+        self._national_bounds = np.searchsorted(self.national_rows, type_offsets)
+
+    def _state_ids_for(self, states):
+        """Ids of the given states that have state-level obligations; others have none to add"""
+        ids = {self._state_ids.get(normalize_state(state)) for state in states}
+        ids.discard(None)
+        return sorted(ids)
+
+    def _pair_rows(self, type_id, state_id):
+        i = self._pairs.get(state_id * len(self.company_types) + type_id)
+        if i is None:
+            return self.pair_rows[:0]
+        return self.pair_rows[self.pair_offsets[i]:self.pair_offsets[i + 1]]
+
+    def applicable_rows(self, company_types, states):
+        """Sorted global rows of the company types' obligations that apply in any of the states.
+
+        Nationwide obligations always apply; raises KeyError for unknown company types.
+        """
+        state_ids = self._state_ids_for(states)
+        parts = []
+        for company_type in company_types:
+            t = self._type_index[company_type]
+            parts.append(self.national_rows[self._national_bounds[t]:self._national_bounds[t + 1]])
+            parts.extend(self._pair_rows(t, s) for s in state_ids)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        # An obligation listing several states appears under each of them
+        return np.unique(np.concatenate(parts)).astype(np.int64)
+
+    def restrict(self, rows, states):
+        """The given rows that apply in any of the states, keeping their order"""
+        rows = np.asarray(rows, dtype=np.int64)
+        mask = self.national[rows].astype(bool)
+        state_ids = self._state_ids_for(states)
+        if state_ids:
+            types = len(self.company_types)
+            # Pair keys are sorted by state, so each state's pairs are one contiguous run
+            bounds = np.searchsorted(self.pair_keys, [(s * types, (s + 1) * types) for s in state_ids])
+            state_rows = np.concatenate([
+                self.pair_rows[self.pair_offsets[lo]:self.pair_offsets[hi]] for lo, hi in bounds
+            ])
+            mask |= np.isin(rows, state_rows)
+        return rows[mask]
+
+def applicability_segment(compliances):
+    """One company type's nationwide flags, its state names and (state, row) pairs, states numbered by name.
+
+    Names map each normalized state to its first spelling, in order of first appearance.
+    """
+    scopes = [obligation_states(c.get('state')) for c in compliances]
+    # Display names: the first spelling seen of each normalized state
+    names = {}
+    for c, scope in zip(compliances, scopes):
+        if scope is not None:
+            for part in STATE_SEPARATOR.split(str(c['state'])):
+                if part.strip():
+                    names.setdefault(normalize_state(part), ' '.join(part.split()))
+    state_ids = {state: i for i, state in enumerate(names)}
+    pairs = [(state_ids[state], row) for row, scope in enumerate(scopes) if scope is not None for state in scope]
+    return (
+        np.array([scope is None for scope in scopes], dtype=bool),
+        names,
+        np.array([state for state, _ in pairs], dtype=np.int64),
+        np.array([row for _, row in pairs], dtype=np.int64),
+    )
+
+def build_applicability_index(company_compliance_map, segments=None):
+    """Build the nationwide flags and (state, company type) postings from the mapping.
+
+    segments, the applicability_segment of each company type in mapping order,
+    are computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [applicability_segment(company_compliance_map[ct]) for ct in company_types]
+    type_offsets = company_type_offsets(company_compliance_map)
+
+    names = {}
+    for _, type_names, _, _ in segments:
+        for state, name in type_names.items():
+            names.setdefault(state, name)
+    normalized, state_maps = merge_vocabularies([list(segment[1]) for segment in segments])
+
+    keys = concatenate([
+        state_map[states] * len(company_types) + i
+        for i, ((_, _, states, _), state_map) in enumerate(zip(segments, state_maps))
+    ], np.int64)
+    rows = concatenate([segment[3] + type_offsets[i] for i, segment in enumerate(segments)], np.int64)
+    order = np.lexsort((rows, keys))
+    keys = keys[order]
+    pair_keys, starts = np.unique(keys, return_index=True)
+    pair_offsets = np.append(starts, len(keys)).astype(np.int64)
+    return ApplicabilityIndex(
+        company_types, type_offsets, [names[state] for state in normalized],
+        concatenate([segment[0] for segment in segments], bool), pair_keys, pair_offsets, rows[order]
+    )
+
+def save_applicability_index(index, path=APPLICABILITY_FILE):
+    """Save the nationwide flags and (state, company type) postings"""
+    save_index(
+        path,
+        APPLICABILITY_VERSION,
+        company_types=np.array(index.company_types, dtype=str),
+        type_offsets=index.type_offsets,
+        states=np.array(index.states, dtype=str),
+        national=index.national,
+        pair_keys=index.pair_keys,
+        pair_offsets=index.pair_offsets,
+        pair_rows=index.pair_rows,
+    )
+
+def load_applicability_index(path=APPLICABILITY_FILE, mmap=False):
+    """Load a saved applicability index, or None to rebuild it (see artifacts.load_index)"""
+    return load_index(path, APPLICABILITY_VERSION, lambda data: ApplicabilityIndex(
+        data['company_types'].tolist(),
+        data['type_offsets'],
+        data['states'].tolist(),
+        data['national'],
+        data['pair_keys'],
+        data['pair_offsets'],
+        data['pair_rows'],
+    ), mmap)
@@ -0,0 +1,99 @@
+"""
+Artifact Hot Reloading
+Watches the model artifacts and swaps in new builds without restarting the process
+"""
+
+import threading
+import time
+
+from artifacts import artifact_version
+from instrumentation import count, timer
+from query_api import ComplianceQuery
+
+class ArtifactReloader:
+    """Hold the current ComplianceQuery snapshot and replace it when the artifacts change.
+
+    New builds are loaded on a background thread and swapped in with a single
+    reference assignment; callers that took a snapshot keep using it unchanged.
+    With lazy=True the first snapshot is opened lazily for a fast first paint
+    and the watcher thread loads its remaining artifacts before polling.
+    """
+
+    def __init__(self, artifact_dir='.', interval=5.0, loader=ComplianceQuery, lazy=False):
+        self.artifact_dir = artifact_dir
+        self.interval = interval
+        self.loader = loader
+        self.lazy = lazy
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        start = time.perf_counter()
+        self._snapshot = loader(artifact_dir, lazy=True) if lazy else loader(artifact_dir)
+        self.metrics = {
+            'version': self._snapshot.version,
+            'startup_seconds': time.perf_counter() - start,
+            'loaded_at': time.time(),
+            'reload_count': 0,
+            'last_reload_seconds': None,
+            'last_reload_error': None,
+        }
+
+    def snapshot(self):
+        """The current artifacts; use one snapshot for a whole request or rerun"""
+        return self._snapshot
+
+    def check(self):
+        """Reload if the artifact version changed; returns True when a new build was swapped in"""
+        version = artifact_version(self.artifact_dir)
+        # None while a build is being published: nothing consistent to load yet
+        if version is None or version == self._snapshot.version:
+            return False
+
+        with self._lock:
+            if version == self._snapshot.version:
+                return False
+            start = time.perf_counter()
+            try:
+                with timer('artifact_reload'):
+                    snapshot = self.loader(self.artifact_dir)
+            except Exception as e:
+                self.metrics['last_reload_error'] = f"{type(e).__name__}: {e}"
+                count('artifact_reload_errors')
+                return False
+            if snapshot.version != version or artifact_version(self.artifact_dir) != version:
+                # Another build landed while loading; pick it up on the next check
+                return False
+            self._snapshot = snapshot
+            self.metrics.update({
+                'version': version,
+                'loaded_at': time.time(),
+                'reload_count': self.metrics['reload_count'] + 1,
+                'last_reload_seconds': time.perf_counter() - start,
+                'last_reload_error': None,
+            })
+            return True
+
+    def _watch(self):
+        if self.lazy:
+            try:
+                self._snapshot.load_all()
+            except Exception:
+                # Left to load on first use, where the error reaches the caller
+                count('artifact_load_errors')
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Start polling for new artifact versions on a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='artifact-reloader', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the polling thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
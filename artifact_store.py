@@ -0,0 +1,294 @@
+"""
+Versioned Artifact Store
+Content-addressed training snapshots with per company type sharing and hash-based diffs
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from artifacts import is_missing
+
+ARTIFACT_STORE_DIR = 'artifact_store'
+STORE_VERSION = 1
+LOG_FILE = 'log.jsonl'
+# Source fingerprint -> content hash of the company types already stored, so unchanged types aren't rehashed
+FINGERPRINTS_FILE = 'fingerprints.json'
+
+def _write_atomic(path, data):
+    """Write bytes through a temporary file and rename, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _object_path(store_dir, digest, extension):
+    return os.path.join(store_dir, 'objects', digest[:2], f"{digest}.{extension}")
+
+def _snapshot_path(store_dir, snapshot_id):
+    return os.path.join(store_dir, 'snapshots', f"{snapshot_id}.json")
+
+def obligation_hash(compliance):
+    """Content hash of one compliance record; missing (NaN) values hash like None"""
+    normalized = {
+        field: None if is_missing(value) else value
+        for field, value in compliance.items()
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+def obligation_hashes(compliances):
+    """[obligation_id, content hash] pairs of a company type, in record order"""
+    return [[str(c['obligation_id']), obligation_hash(c)] for c in compliances]
+
+def type_hash(hashes):
+    """Address of a company type's content: the hash of its obligation hash list"""
+    return hashlib.sha256(json.dumps(hashes).encode('utf-8')).hexdigest()
+
+def _load_fingerprints(store_dir):
+    path = os.path.join(store_dir, FINGERPRINTS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def commit_snapshot(company_compliance_map, company_metadata, store_dir=ARTIFACT_STORE_DIR, label=None,
+                    fingerprints=None):
+    """Store a training snapshot and return (snapshot id, whether it is new).
+
+    Each company type is written once per distinct content, so a snapshot that
+    changes a few types only adds objects for those types. Committing the same
+    content as the latest snapshot adds nothing. With the build's per company
+    type source fingerprints, types seen before are not hashed again.
+    """
+    known = _load_fingerprints(store_dir) if fingerprints else {}
+    learned = {}
+    types = {}
+    for company_type, compliances in company_compliance_map.items():
+        fingerprint = fingerprints.get(company_type) if fingerprints else None
+        digest = known.get(fingerprint)
+        if digest is not None and os.path.exists(_object_path(store_dir, digest, 'pkl')):
+            types[company_type] = [digest, len(compliances)]
+            continue
+        hashes = obligation_hashes(compliances)
+        digest = type_hash(hashes)
+        types[company_type] = [digest, len(compliances)]
+        if fingerprint is not None:
+            learned[fingerprint] = digest
+        if not os.path.exists(_object_path(store_dir, digest, 'pkl')):
+            # The hash list is what diffs read; the records are only loaded on checkout
+            _write_atomic(_object_path(store_dir, digest, 'json'), json.dumps(hashes).encode('utf-8'))
+            _write_atomic(_object_path(store_dir, digest, 'pkl'), pickle.dumps({
+                'compliances': compliances,
+                'metadata': company_metadata.get(company_type),
+            }, protocol=pickle.HIGHEST_PROTOCOL))
+
+    if learned:
+        _write_atomic(os.path.join(store_dir, FINGERPRINTS_FILE), json.dumps({**known, **learned}).encode('utf-8'))
+
+    snapshot_id = hashlib.sha256(json.dumps(types, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    history = list_snapshots(store_dir)
+    if history and history[-1]['id'] == snapshot_id:
+        return snapshot_id, False
+
+    if not os.path.exists(_snapshot_path(store_dir, snapshot_id)):
+        snapshot = {'version': STORE_VERSION, 'id': snapshot_id, 'types': types}
+        _write_atomic(_snapshot_path(store_dir, snapshot_id), json.dumps(snapshot).encode('utf-8'))
+    entry = {
+        'id': snapshot_id,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'label': label,
+        'company_types': len(types),
+        'obligations': sum(count for _, count in types.values()),
+    }
+    with open(os.path.join(store_dir, LOG_FILE), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    return snapshot_id, True
+
+def list_snapshots(store_dir=ARTIFACT_STORE_DIR):
+    """Committed snapshots, oldest first; a snapshot committed again appears again"""
+    path = os.path.join(store_dir, LOG_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def resolve_ref(ref, store_dir=ARTIFACT_STORE_DIR):
+    """Snapshot id of a reference: 'latest', 'latest~N' (N commits back) or a unique id prefix"""
+    history = list_snapshots(store_dir)
+    if ref == 'latest' or ref.startswith('latest~'):
+        back = int(ref.partition('~')[2] or 0)
+        if back >= len(history):
+            raise KeyError(f"Only {len(history)} snapshots, can't go back {back}")
+        return history[-1 - back]['id']
+    matches = {entry['id'] for entry in history if entry['id'].startswith(ref)}
+    if len(matches) != 1:
+        raise KeyError(f"{'Ambiguous' if matches else 'Unknown'} snapshot: {ref}")
+    return matches.pop()
+
+def load_snapshot(ref, store_dir=ARTIFACT_STORE_DIR):
+    """A snapshot's company type -> [content hash, obligation count] table"""
+    with open(_snapshot_path(store_dir, resolve_ref(ref, store_dir))) as f:
+        return json.load(f)
+
+def load_type_hashes(digest, store_dir=ARTIFACT_STORE_DIR):
+    """[obligation_id, content hash] pairs stored for a company type's content"""
+    with open(_object_path(store_dir, digest, 'json')) as f:
+        return json.load(f)
+
+def load_type(digest, store_dir=ARTIFACT_STORE_DIR):
+    """{'compliances': [...], 'metadata': {...}} stored for a company type's content"""
+    with open(_object_path(store_dir, digest, 'pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def _group_hashes(pairs):
+    """obligation_id -> its content hashes; an ID may be listed more than once in a company type"""
+    grouped = {}
+    for obligation_id, digest in pairs:
+        grouped.setdefault(obligation_id, []).append(digest)
+    return grouped
+
+def diff_snapshots(old_ref, new_ref, store_dir=ARTIFACT_STORE_DIR):
+    """Obligations added, removed or modified per company type between two snapshots.
+
+    Types with the same content hash are skipped without reading anything else;
+    changed types are compared through their stored obligation hashes only.
+    Returns {'old', 'new', 'added_types', 'removed_types', 'changed': {type: {...}}},
+    where each changed type lists its added, removed and modified obligation IDs
+    and the content hashes it had before and after (None when absent).
+    """
+    old = load_snapshot(old_ref, store_dir)
+    new = load_snapshot(new_ref, store_dir)
+    changed = {}
+    for company_type in list(old['types']) + [ct for ct in new['types'] if ct not in old['types']]:
+        before = old['types'].get(company_type)
+        after = new['types'].get(company_type)
+        if before is not None and after is not None and before[0] == after[0]:
+            continue
+        old_hashes = _group_hashes(load_type_hashes(before[0], store_dir)) if before else {}
+        new_hashes = _group_hashes(load_type_hashes(after[0], store_dir)) if after else {}
+        changed[company_type] = {
+            'before': before[0] if before else None,
+            'after': after[0] if after else None,
+            'added': [oid for oid in new_hashes if oid not in old_hashes],
+            'removed': [oid for oid in old_hashes if oid not in new_hashes],
+            'modified': [oid for oid, h in new_hashes.items() if oid in old_hashes and old_hashes[oid] != h],
+        }
+    return {
+        'old': old['id'],
+        'new': new['id'],
+        'added_types': [ct for ct in new['types'] if ct not in old['types']],
+        'removed_types': [ct for ct in old['types'] if ct not in new['types']],
+        'changed': changed,
+    }
+
+def checkout(ref, store_dir=ARTIFACT_STORE_DIR):
+    """(company type -> compliances mapping, metadata) of a snapshot"""
+    snapshot = load_snapshot(ref, store_dir)
+    company_compliance_map = {}
+    company_metadata = {}
+    for company_type, (digest, _) in snapshot['types'].items():
+        stored = load_type(digest, store_dir)
+        company_compliance_map[company_type] = stored['compliances']
+        company_metadata[company_type] = stored['metadata']
+    return company_compliance_map, company_metadata
+
+def store_size(store_dir=ARTIFACT_STORE_DIR):
+    """(object count, total bytes) of the store's shared company type objects"""
+    objects = total = 0
+    for root, _, files in os.walk(os.path.join(store_dir, 'objects')):
+        for name in files:
+            if name.endswith('.pkl'):
+                objects += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return objects, total
+
+def print_diff(diff):
+    """Print a diff summary and the changed obligation IDs per company type"""
+    print(f"Changes from {diff['old']} to {diff['new']}:")
+    if diff['added_types']:
+        print(f"  + company types: {', '.join(diff['added_types'])}")
+    if diff['removed_types']:
+        print(f"  - company types: {', '.join(diff['removed_types'])}")
+    for company_type, changes in diff['changed'].items():
+        print(f"  {company_type}: +{len(changes['added'])} -{len(changes['removed'])} ~{len(changes['modified'])}")
+        for marker, key in (('+', 'added'), ('-', 'removed'), ('~', 'modified')):
+            for obligation_id in changes[key]:
+                print(f"    {marker} {obligation_id}")
+    if not diff['changed']:
+        print("  no changes")
+
+def main(argv=None):
+    """Inspect, diff and restore training snapshots from the command line"""
+    parser = argparse.ArgumentParser(description="Versioned store of training snapshots")
+    parser.add_argument('--store', default=ARTIFACT_STORE_DIR, help="Store directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('log', help="List snapshots, oldest first")
+    show = commands.add_parser('show', help="Company types and obligation counts of a snapshot")
+    show.add_argument('ref', nargs='?', default='latest')
+    diff = commands.add_parser('diff', help="Obligations added, removed or modified between two snapshots")
+    diff.add_argument('old', nargs='?', default='latest~1')
+    diff.add_argument('new', nargs='?', default='latest')
+    diff.add_argument('--json', action='store_true', help="Print the diff as JSON")
+    commit = commands.add_parser('commit', help="Snapshot the model artifacts in a directory")
+    commit.add_argument('--artifact-dir', default='.')
+    commit.add_argument('--label')
+    restore = commands.add_parser('checkout', help="Rebuild the model artifacts of a snapshot")
+    restore.add_argument('ref')
+    restore.add_argument('--output-dir', default='.')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'log':
+            history = list_snapshots(args.store)
+            for entry in history:
+                label = f"  {entry['label']}" if entry.get('label') else ''
+                print(f"{entry['id']}  {entry['created']}  {entry['company_types']:6} types "
+                      f"{entry['obligations']:8} obligations{label}")
+            objects, total = store_size(args.store)
+            print(f"✓ {len(history)} snapshots sharing {objects} company type objects ({total / 1024 / 1024:.1f} MB)")
+        elif args.command == 'show':
+            snapshot = load_snapshot(args.ref, args.store)
+            for company_type, (digest, count) in snapshot['types'].items():
+                print(f"{company_type:15} {count:6}  {digest[:12]}")
+        elif args.command == 'diff':
+            start = time.perf_counter()
+            result = diff_snapshots(args.old, args.new, args.store)
+            if args.json:
+                print(json.dumps(result, indent=2))
+            else:
+                print_diff(result)
+                print(f"✓ Diffed in {(time.perf_counter() - start) * 1000:.1f} ms")
+        elif args.command == 'commit':
+            with open(os.path.join(args.artifact_dir, 'compliance_model.pkl'), 'rb') as f:
+                company_compliance_map = pickle.load(f)
+            with open(os.path.join(args.artifact_dir, 'company_metadata.pkl'), 'rb') as f:
+                company_metadata = pickle.load(f)
+            snapshot_id, created = commit_snapshot(company_compliance_map, company_metadata, args.store, args.label)
+            print(f"✓ {'Committed' if created else 'Unchanged since'} snapshot {snapshot_id}")
+        elif args.command == 'checkout':
+            from artifacts import INDEX_SEGMENTS_DIR, TrainingLock
+            from train_model import write_model_artifacts
+            from training_job import publish_artifacts, staging_directory
+
+            company_compliance_map, company_metadata = checkout(args.ref, args.store)
+            # Content hashes stand in for the source fingerprints: the artifact version
+            # changes with the snapshot, and the next incremental build regenerates every type
+            fingerprints = {ct: digest for ct, (digest, _) in load_snapshot(args.ref, args.store)['types'].items()}
+            os.makedirs(args.output_dir, exist_ok=True)
+            # Built aside and published in one step, like train_model's builds, so readers never see a mix
+            with TrainingLock(args.output_dir), staging_directory(args.output_dir) as staging_dir:
+                write_model_artifacts(
+                    company_compliance_map, company_metadata, fingerprints, staging_dir,
+                    segment_dir=os.path.join(args.output_dir, INDEX_SEGMENTS_DIR)
+                )
+                publish_artifacts(staging_dir, args.output_dir)
+            print(f"✓ Restored snapshot {resolve_ref(args.ref, args.store)} to {args.output_dir}")
+    except KeyError as e:
+        raise SystemExit(f"✗ {e.args[0]}")
+
+if __name__ == "__main__":
+    main()
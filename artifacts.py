@@ -0,0 +1,646 @@
+"""
+Model Artifact Storage
+Compact columnar format for the compliance model and a shared artifact loader
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import struct
+import threading
+import time
+import zipfile
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COLUMNAR_MODEL_DIR = 'compliance_model.cols'
+COLUMNAR_FORMAT = 'compliance-columnar'
+COLUMNAR_VERSION = 2
+# Version 1 had no typed_fields: every value was stored as a string
+READABLE_COLUMNAR_VERSIONS = (1, 2)
+HEADER_FILE = 'header.json'
+MANIFEST_FILE = 'model_manifest.json'
+# The pickles every artifact directory has, whichever other artifacts it was built with
+ARTIFACT_FILES = ['compliance_model.pkl', 'company_metadata.pkl', 'company_types.pkl']
+TRAINING_LOCK_FILE = '.training.lock'
+# Per company type metadata laid out to be memory-mapped, see SharedMetadata
+SHARED_METADATA_FILE = 'company_metadata.npz'
+SHARED_METADATA_VERSION = 1
+# Cache of the per company type building blocks of the indexes, see IndexSegments
+INDEX_SEGMENTS_DIR = 'index_segments'
+INDEX_SEGMENTS_VERSION = 1
+# Zip local file header: 30 fixed bytes ending with the file name and extra field lengths
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+LOCK_POLL_SECONDS = 0.2
+# Manifest key marking a directory whose new build is being moved into place
+PUBLISHING_KEY = 'publishing'
+# How long a reader waits for a build being published to land
+PUBLISH_WAIT_SECONDS = 30.0
+
+def is_missing(value):
+    """True for the missing markers found in the source data (None / NaN)"""
+    return value is None or (isinstance(value, float) and value != value)
+
+def available_cores():
+    """CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def company_type_offsets(company_compliance_map):
+    """Row offsets of each company type when rows are numbered across the mapping in order.
+
+    offsets[i]:offsets[i + 1] is the global row range of the i-th company type.
+    """
+    offsets = np.zeros(len(company_compliance_map) + 1, dtype=np.int64)
+    np.cumsum([len(compliances) for compliances in company_compliance_map.values()], out=offsets[1:])
+    return offsets
+
+class CompanyTypeRows:
+    """Base for artifacts whose global rows are grouped by company type, numbered like the columnar model"""
+
+    def __init__(self, company_types, type_offsets):
+        self.company_types = list(company_types)
+        self.type_offsets = type_offsets
+        self._type_index = {ct: i for i, ct in enumerate(self.company_types)}
+
+    def row_range(self, company_type):
+        """(start, stop) global row positions of a company type"""
+        i = self._type_index[company_type]
+        return int(self.type_offsets[i]), int(self.type_offsets[i + 1])
+
+def merge_vocabularies(vocabularies):
+    """Sorted union of per company type vocabularies, plus an array per type renumbering its terms into it"""
+    vocabulary = sorted(set().union(*vocabularies))
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    return vocabulary, [np.array([term_ids[term] for term in terms], dtype=np.int64) for terms in vocabularies]
+
+def renumber(codes, numbers):
+    """Codes mapped through an array of new numbers, -1 (missing) staying -1"""
+    return np.append(numbers, -1)[codes]
+
+def concatenate(arrays, dtype):
+    """np.concatenate of per company type arrays, also for no company types"""
+    return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.empty(0, dtype=dtype)
+
+def csr_gather(offsets, rows):
+    """Positions of the given CSR rows' entries in order, and the length of each row"""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0), lengths
+
+def columnar_segment(compliances):
+    """One company type's fields dictionary-encoded: {field: (distinct keys in order of first appearance, codes)}.
+
+    Missing values get code -1. Values other than strings are keyed with their
+    type, so 1, 1.0, True and '1' stay distinct entries.
+    """
+    fields = list(compliances[0]) if compliances else []
+    segment = {}
+    for field in fields:
+        dictionary = {}
+        codes = np.empty(len(compliances), dtype=np.int32)
+        for i, compliance in enumerate(compliances):
+            value = compliance[field]
+            if is_missing(value):
+                codes[i] = -1
+                continue
+            key = value if type(value) is str else (type(value), value)
+            codes[i] = dictionary.setdefault(key, len(dictionary))
+        segment[field] = (list(dictionary), codes)
+    return segment
+
+def _encode_column(segments, field):
+    """Merge one field of the columnar segments into int32 codes plus a blob with offsets.
+
+    Strings are stored as UTF-8. Other values (numbers, dates, ...) are pickled,
+    and for those columns a kinds array marks pickled entries with 1; it is None
+    for a column of strings only.
+    """
+    dictionary = {}
+    codes = []
+    for segment in segments:
+        # A company type without compliances has no fields
+        keys, type_codes = segment[field] if segment else ([], np.empty(0, dtype=np.int32))
+        numbers = np.array([dictionary.setdefault(key, len(dictionary)) for key in keys], dtype=np.int64)
+        codes.append(renumber(type_codes, numbers))
+    codes = concatenate(codes, np.int32)
+
+    encoded = []
+    kinds = np.zeros(len(dictionary), dtype=np.uint8)
+    for i, key in enumerate(dictionary):
+        if type(key) is str:
+            encoded.append(key.encode('utf-8'))
+        else:
+            encoded.append(pickle.dumps(key[1], protocol=pickle.HIGHEST_PROTOCOL))
+            kinds[i] = 1
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return codes, offsets, data, kinds if kinds.any() else None
+
+def _save_array(path, array):
+    """np.save through a temporary file, so readers with the old file mapped are unaffected"""
+    with atomic_path(path) as tmp_path, open(tmp_path, 'wb') as f:
+        np.save(f, array)
+
+def write_columnar_model(company_compliance_map, path=COLUMNAR_MODEL_DIR, segments=None):
+    """Write the company type -> compliances mapping in the columnar format.
+
+    Rows are stored grouped by company type; type_offsets[i]:type_offsets[i + 1]
+    is the row range of the i-th company type. Every field is a dictionary-encoded
+    column (code -1 marks a missing value); fields holding values other than
+    strings are listed in the header's typed_fields and decode to the same types.
+    segments, the columnar_segment of each company type in mapping order, are
+    computed here when not given.
+    """
+    os.makedirs(path, exist_ok=True)
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [columnar_segment(company_compliance_map[ct]) for ct in company_types]
+    type_offsets = company_type_offsets(company_compliance_map)
+    fields = next((list(segment) for segment in segments if segment), [])
+
+    _save_array(os.path.join(path, 'type_offsets.npy'), type_offsets)
+
+    typed_fields = []
+    for field in fields:
+        codes, offsets, data, kinds = _encode_column(segments, field)
+        _save_array(os.path.join(path, f'{field}.codes.npy'), codes)
+        _save_array(os.path.join(path, f'{field}.offsets.npy'), offsets)
+        _save_array(os.path.join(path, f'{field}.data.npy'), data)
+        if kinds is not None:
+            _save_array(os.path.join(path, f'{field}.kinds.npy'), kinds)
+            typed_fields.append(field)
+
+    header = {
+        'format': COLUMNAR_FORMAT,
+        'version': COLUMNAR_VERSION,
+        'rows': int(type_offsets[-1]),
+        'fields': fields,
+        'typed_fields': typed_fields,
+        'company_types': company_types,
+    }
+    # The header is written last so a reader never sees it before the columns
+    with atomic_path(os.path.join(path, HEADER_FILE)) as header_path, open(header_path, 'w') as f:
+        json.dump(header, f)
+
+class ColumnarModel(CompanyTypeRows, Mapping):
+    """Read-only company type -> list of compliance dicts view over a columnar artifact.
+
+    Columns are memory-mapped by default and values are decoded on access, so
+    opening the model costs little more than reading the header.
+    """
+
+    def __init__(self, path=COLUMNAR_MODEL_DIR, mmap=True):
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            header = json.load(f)
+        if header.get('format') != COLUMNAR_FORMAT or header.get('version') not in READABLE_COLUMNAR_VERSIONS:
+            raise ValueError(f"Unsupported model format in {path}: "
+                             f"{header.get('format')} v{header.get('version')}")
+
+        mmap_mode = 'r' if mmap else None
+        self.path = path
+        self.fields = header['fields']
+        self.row_count = header['rows']
+        super().__init__(header['company_types'],
+                         np.load(os.path.join(path, 'type_offsets.npy'), mmap_mode=mmap_mode))
+        self._columns = {
+            field: tuple(
+                np.load(os.path.join(path, f'{field}.{part}.npy'), mmap_mode=mmap_mode)
+                for part in ('codes', 'offsets', 'data')
+            )
+            for field in self.fields
+        }
+        self._kinds = {
+            field: np.load(os.path.join(path, f'{field}.kinds.npy'), mmap_mode=mmap_mode)
+            for field in header.get('typed_fields', [])
+        }
+        self._decoded = {field: {-1: float('nan')} for field in self.fields}
+
+    def _value(self, field, code):
+        """Decode one dictionary code of a field, caching the result"""
+        decoded = self._decoded[field]
+        if code not in decoded:
+            _, offsets, data = self._columns[field]
+            encoded = bytes(data[offsets[code]:offsets[code + 1]])
+            kinds = self._kinds.get(field)
+            if kinds is not None and kinds[code]:
+                decoded[code] = pickle.loads(encoded)
+            else:
+                decoded[code] = encoded.decode('utf-8')
+        return decoded[code]
+
+    def row_range(self, company_type):
+        """Row positions of a company type's compliances"""
+        return range(*super().row_range(company_type))
+
+    def column(self, field, rows):
+        """Decoded values of one field for the given row positions"""
+        codes = self._columns[field][0]
+        if isinstance(rows, range):
+            selected = codes[rows.start:rows.stop]
+        else:
+            selected = codes[np.asarray(rows, dtype=np.int64)]
+        return [self._value(field, code) for code in selected.tolist()]
+
+    def records(self, rows):
+        """Compliance dicts for the given row positions"""
+        columns = [self.column(field, rows) for field in self.fields]
+        return [dict(zip(self.fields, values)) for values in zip(*columns)]
+
+    def __getitem__(self, company_type):
+        return self.records(self.row_range(company_type))
+
+    def __contains__(self, company_type):
+        return company_type in self._type_index
+
+    def __iter__(self):
+        return iter(self.company_types)
+
+    def __len__(self):
+        return len(self.company_types)
+
+class MappedNpz(Mapping):
+    """Read-only arrays of an uncompressed .npz archive, memory-mapped where they are stored.
+
+    np.savez stores each array as a .npy member without compression, so its data
+    can be mapped straight from the archive. Processes mapping the same file share
+    its pages through the OS page cache instead of each holding a private copy.
+    Members are mapped from the file opened here, not reopened by path, so a file
+    replaced meanwhile can't be read with this one's layout. Arrays stay valid
+    after close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._members = {}
+        self._file = f = open(path, 'rb')
+        try:
+            with zipfile.ZipFile(f) as archive:
+                infos = archive.infolist()
+            for info in infos:
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{path} is compressed and can't be memory-mapped")
+                f.seek(info.header_offset)
+                fields = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+                f.seek(info.header_offset + ZIP_LOCAL_HEADER.size + fields[-2] + fields[-1])
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                if dtype.hasobject:
+                    raise ValueError(f"{path} holds object arrays, which can't be memory-mapped")
+                self._members[info.filename.removesuffix('.npy')] = (dtype, shape, fortran_order, f.tell())
+        except Exception:
+            f.close()
+            raise
+
+    def __getitem__(self, name):
+        dtype, shape, fortran_order, offset = self._members[name]
+        if not shape or 0 in shape:
+            # Scalars and empty arrays: nothing worth mapping
+            self._file.seek(offset)
+            count = int(np.prod(shape))
+            return np.fromfile(self._file, dtype=dtype, count=count).reshape(shape)
+        return np.memmap(self._file, dtype=dtype, mode='r', offset=offset, shape=shape,
+                         order='F' if fortran_order else 'C')
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def close(self):
+        """Close the archive; arrays already mapped keep their own mapping"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def open_npz(path, mmap=False):
+    """The arrays of an .npz file: loaded with np.load, or with mmap mapped read-only in place"""
+    return MappedNpz(path) if mmap else np.load(path)
+
+def save_index(path, version, **arrays):
+    """Save an index's arrays as a single uncompressed .npz file tagged with its format version"""
+    np.savez(path, version=np.array(version), **arrays)
+
+def load_index(path, version, build, mmap=False):
+    """build(arrays) over an index saved with save_index (memory-mapped read-only with mmap).
+
+    None if the file is missing or from another format version, so callers rebuild it.
+    """
+    if not os.path.exists(path):
+        return None
+    with open_npz(path, mmap) as data:
+        if int(data['version']) != version:
+            return None
+        return build(data)
+
+class IndexSegments:
+    """Per company type segments the index builders merge, cached by fingerprint in cache_dir if given.
+
+    A segment depends on its company type's compliances only, so with reuse a
+    cached segment of the same fingerprint and index version is taken as is, and
+    an incremental build computes the segments of changed company types only.
+    save() writes the cache files of new fingerprints and drops those of
+    fingerprints no longer built; only builds holding the TrainingLock touch them.
+    """
+
+    def __init__(self, fingerprints, cache_dir=None, reuse=True):
+        self.fingerprints = fingerprints
+        self.cache_dir = cache_dir
+        self.reuse = reuse
+        self._segments = {}
+        self._computed = set()
+
+    def _path(self, fingerprint):
+        return os.path.join(self.cache_dir, f"{fingerprint}.pkl")
+
+    def _cached(self, company_type):
+        """{index name: (version, segment)} of a company type, loaded from the cache on first use"""
+        if company_type not in self._segments:
+            fingerprint = self.fingerprints.get(company_type)
+            segments = {}
+            if self.reuse and self.cache_dir is not None and fingerprint is not None \
+                    and os.path.exists(self._path(fingerprint)):
+                with open(self._path(fingerprint), 'rb') as f:
+                    saved = pickle.load(f)
+                if saved.get('version') == INDEX_SEGMENTS_VERSION:
+                    segments = saved['segments']
+            self._segments[company_type] = segments
+        return self._segments[company_type]
+
+    def segments(self, name, version, company_compliance_map, build):
+        """build(compliances) of each company type in mapping order, for the index name at format version"""
+        result = []
+        for company_type, compliances in company_compliance_map.items():
+            cached = self._cached(company_type)
+            saved_version, segment = cached.get(name, (None, None))
+            if saved_version != version:
+                segment = build(compliances)
+                cached[name] = (version, segment)
+                self._computed.add(company_type)
+            result.append(segment)
+        return result
+
+    def save(self):
+        """Cache the segments computed by this build and drop those of fingerprints not in it"""
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for company_type in self._computed:
+            fingerprint = self.fingerprints.get(company_type)
+            if fingerprint is not None:
+                with atomic_path(self._path(fingerprint)) as tmp_path, open(tmp_path, 'wb') as f:
+                    pickle.dump({'version': INDEX_SEGMENTS_VERSION, 'segments': self._segments[company_type]}, f,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+        built = {self._path(fingerprint) for fingerprint in self.fingerprints.values()}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if path not in built:
+                os.remove(path)
+
+def save_shared_metadata(company_metadata, path=SHARED_METADATA_FILE):
+    """Save the metadata with each company type's entry pickled separately, for SharedMetadata"""
+    company_types = list(company_metadata)
+    encoded = [pickle.dumps(company_metadata[ct], protocol=pickle.HIGHEST_PROTOCOL) for ct in company_types]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    save_index(
+        path,
+        SHARED_METADATA_VERSION,
+        company_types=np.array(company_types, dtype=str),
+        offsets=offsets,
+        data=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+    )
+
+class SharedMetadata(Mapping):
+    """Read-only company type -> metadata view over a memory-mapped SHARED_METADATA_FILE.
+
+    Each company type's entry is unpickled on first access and cached.
+    """
+
+    def __init__(self, company_types, offsets, data):
+        self.company_types = list(company_types)
+        self._offsets = offsets
+        self._data = data
+        self._type_index = {ct: i for i, ct in enumerate(self.company_types)}
+        self._decoded = {}
+
+    def __getitem__(self, company_type):
+        if company_type not in self._decoded:
+            i = self._type_index[company_type]
+            self._decoded[company_type] = pickle.loads(self._data[self._offsets[i]:self._offsets[i + 1]])
+        return self._decoded[company_type]
+
+    def __contains__(self, company_type):
+        return company_type in self._type_index
+
+    def __iter__(self):
+        return iter(self.company_types)
+
+    def __len__(self):
+        return len(self.company_types)
+
+def load_shared_metadata(path=SHARED_METADATA_FILE):
+    """Map saved metadata read-only, or None if it is missing or from another version"""
+    return load_index(
+        path, SHARED_METADATA_VERSION,
+        lambda data: SharedMetadata(data['company_types'].tolist(), data['offsets'], data['data']),
+        mmap=True,
+    )
+
+def records_for_rows(model, rows):
+    """Compliance dicts at global row positions (company types in mapping order) of either model format"""
+    if isinstance(model, ColumnarModel):
+        return model.records(rows)
+    # Straight to each row's company type and position in it, without flattening the mapping
+    type_lists = list(model.values())
+    type_offsets = company_type_offsets(model)
+    rows = np.asarray(rows, dtype=np.int64)
+    types = np.searchsorted(type_offsets, rows, side='right') - 1
+    return [
+        type_lists[t][row] for t, row in zip(types.tolist(), (rows - type_offsets[types]).tolist())
+    ]
+
+def column_for_rows(model, field, rows):
+    """Values of one field at global row positions of either model format, without building records"""
+    if isinstance(model, ColumnarModel):
+        return model.column(field, rows)
+    return [record[field] for record in records_for_rows(model, rows)]
+
+class RowRecords(Sequence):
+    """Compliance dicts at global row positions, decoded only when indexed or sliced"""
+
+    def __init__(self, model, rows):
+        self.model = model
+        self.rows = np.asarray(rows, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return records_for_rows(self.model, self.rows[index])
+        return records_for_rows(self.model, [self.rows[index]])[0]
+
+def artifacts_present(artifact_dir='.'):
+    """Whether the directory has a complete enough build to open"""
+    return (all(os.path.exists(os.path.join(artifact_dir, name)) for name in ARTIFACT_FILES)
+            and artifact_version(artifact_dir) is not None)
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """Temporary path to write a file to; renamed over path on success and removed on error"""
+    root, extension = os.path.splitext(path)
+    # Same extension, so writers like np.savez don't append their own
+    tmp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class TrainingLock:
+    """Exclusive lock on an artifact directory, held by a build while it writes there.
+
+    Backed by an OS file lock, so builds in other processes wait too, and the
+    lock goes away with a process that dies mid-build.
+    """
+
+    def __init__(self, artifact_dir='.'):
+        self.path = os.path.join(artifact_dir, TRAINING_LOCK_FILE)
+        self._file = None
+
+    def _try_lock(self, f):
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self, blocking=True):
+        """Take the lock; without blocking, returns False at once if another build holds it"""
+        f = open(self.path, 'a')
+        while not self._try_lock(f):
+            if not blocking:
+                f.close()
+                return False
+            time.sleep(LOCK_POLL_SECONDS)
+        self._file = f
+        return True
+
+    def release(self):
+        """Release the lock if held"""
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+class StaleArtifactError(RuntimeError):
+    """Artifacts were replaced by another build while a reader of the previous one was loading them"""
+
+def artifact_version(artifact_dir='.'):
+    """Short hash identifying the current artifact build, or None while a new build is being published.
+
+    Based on the manifest, which train_model.py writes after every other artifact;
+    falls back to the pickles' sizes and mtimes for artifacts without one.
+    """
+    digest = hashlib.sha256()
+    manifest_path = os.path.join(artifact_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'rb') as f:
+            manifest = f.read()
+        if json.loads(manifest).get(PUBLISHING_KEY):
+            return None
+        digest.update(manifest)
+    else:
+        for name in ARTIFACT_FILES:
+            path = os.path.join(artifact_dir, name)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+def wait_for_version(artifact_dir='.', timeout=PUBLISH_WAIT_SECONDS):
+    """artifact_version, waiting for a build being published to land; raises StaleArtifactError on timeout"""
+    deadline = time.monotonic() + timeout
+    while (version := artifact_version(artifact_dir)) is None:
+        if time.monotonic() > deadline:
+            raise StaleArtifactError(f"A build of {artifact_dir} has been publishing for over {timeout:.0f}s")
+        time.sleep(LOCK_POLL_SECONDS)
+    return version
+
+def mark_publishing(artifact_dir='.'):
+    """Replace the manifest with a marker that a new build is being moved into place.
+
+    artifact_version is None from now until the new manifest replaces the
+    marker, so a reader that finds the version unchanged after loading a file
+    knows the file wasn't replaced meanwhile.
+    """
+    with atomic_path(os.path.join(artifact_dir, MANIFEST_FILE)) as path, open(path, 'w') as f:
+        json.dump({PUBLISHING_KEY: True}, f)
+
+def open_model(artifact_dir='.', mmap=True):
+    """The company type -> compliances model, preferring the columnar format over the pickle"""
+    columnar_path = os.path.join(artifact_dir, COLUMNAR_MODEL_DIR)
+    if os.path.exists(os.path.join(columnar_path, HEADER_FILE)):
+        return ColumnarModel(columnar_path, mmap=mmap)
+    with open(os.path.join(artifact_dir, 'compliance_model.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def load_company_metadata(artifact_dir='.', shared=False):
+    """Per company type metadata (totals, regulation type counts, ...).
+
+    With shared, the memory-mapped SharedMetadata is preferred over the pickle.
+    """
+    if shared:
+        metadata = load_shared_metadata(os.path.join(artifact_dir, SHARED_METADATA_FILE))
+        if metadata is not None:
+            return metadata
+    with open(os.path.join(artifact_dir, 'company_metadata.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def load_company_types(artifact_dir='.'):
+    """Company type codes in model order, the only artifact needed to render the type selector"""
+    with open(os.path.join(artifact_dir, 'company_types.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def load_model_artifacts(artifact_dir='.', mmap=True):
+    """Load (model, metadata, company_types), preferring the columnar model over the pickle"""
+    return open_model(artifact_dir, mmap), load_company_metadata(artifact_dir), load_company_types(artifact_dir)
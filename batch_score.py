@@ -0,0 +1,218 @@
+"""
+Compliance Batch Scoring
+Resolve the applicable compliances of a portfolio of entities into a long-format entity x obligation matrix
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from artifacts import available_cores, column_for_rows, is_missing
+from query_api import ComplianceQuery
+
+BATCH_CHUNK_SIZE = 2000
+DEFAULT_FIELDS = ['obligation_id']
+OUTPUT_FORMATS = ['csv', 'parquet']
+# Company types and states of one entity are listed in one cell, e.g. "BIO; COAL"
+LIST_SEPARATOR = re.compile(r'[;,|]')
+
+# Artifacts of a worker process, opened once by init_worker
+_query = None
+
+def split_list(value):
+    """Items of a list cell, stripped; missing or empty cells give an empty list"""
+    if is_missing(value):
+        return []
+    return [item.strip() for item in LIST_SEPARATOR.split(str(value)) if item.strip()]
+
+def _entity_chunks(batches, id_column, types_column, states_column):
+    """Parse the list cells of each batch of entity columns"""
+    for batch in batches:
+        states = batch.get(states_column) or [None] * len(batch[id_column])
+        yield [
+            (entity_id, split_list(types), split_list(entity_states))
+            for entity_id, types, entity_states in zip(batch[id_column], batch[types_column], states)
+        ]
+
+def read_entities(path, id_column='entity_id', types_column='company_types', states_column='states',
+                  chunk_size=BATCH_CHUNK_SIZE):
+    """Lists of (entity_id, company_types, states) from a CSV or Parquet file, chunk_size entities at a time.
+
+    Raises ValueError up front when the id or company types column is missing. The
+    states column is optional; an entity without states is scored for every state.
+    """
+    wanted = [id_column, types_column, states_column]
+    if path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        names = parquet.schema_arrow.names
+        columns = [column for column in wanted if column in names]
+        batches = (batch.to_pydict() for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns))
+    else:
+        import pandas as pd
+
+        with open(path, newline='', encoding='utf-8') as f:
+            names = next(csv.reader(f), [])
+        columns = [column for column in wanted if column in names]
+        batches = (
+            chunk.to_dict('list')
+            for chunk in pd.read_csv(path, usecols=columns, dtype=str, chunksize=chunk_size)
+        )
+
+    missing = [column for column in (id_column, types_column) if column not in names]
+    if missing:
+        raise ValueError(f"{path} has no column {', '.join(missing)}")
+    return _entity_chunks(batches, id_column, types_column, states_column)
+
+def init_worker(artifact_dir):
+    """Open the artifacts in a worker process, memory-mapped so the workers share one copy"""
+    global _query
+    _query = ComplianceQuery(artifact_dir, lazy=True, shared=True)
+
+def score_chunk(entities, fields=DEFAULT_FIELDS):
+    """Matrix rows of a chunk of entities as columns, plus (entities, unknown company type) counts"""
+    query = _query
+    all_states = query.applicability.states
+    entity_ids = []
+    rows = []
+    unknown = 0
+    for entity_id, company_types, states in entities:
+        known = [ct for ct in company_types if ct in query.model]
+        unknown += len(company_types) - len(known)
+        if not known:
+            continue
+        # No states given: every state-level obligation applies
+        matched = query.applicable_rows(known, states or all_states)
+        entity_ids.extend([entity_id] * len(matched))
+        rows.extend(matched.tolist())
+    columns = {'entity_id': entity_ids}
+    for field in fields:
+        columns[field] = column_for_rows(query.model, field, rows)
+    return columns, len(entities), unknown
+
+def bounded_map(pool, func, chunks, max_pending, *args):
+    """pool.map that submits at most max_pending chunks ahead of the one being consumed, in input order"""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(func, chunk, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class CsvMatrixWriter:
+    """Appends column chunks to a UTF-8 CSV file"""
+
+    def __init__(self, out, columns):
+        self.text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+        self.writer = csv.writer(self.text, lineterminator=os.linesep)
+        self.writer.writerow(columns)
+
+    def write(self, columns):
+        # Missing values (None / NaN) are written as empty cells
+        self.writer.writerows(zip(*(['' if v is None or v != v else v for v in values] for values in columns.values())))
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+
+class ParquetMatrixWriter:
+    """Appends column chunks to a Parquet file, one row group per chunk"""
+
+    def __init__(self, out, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.string()) for column in columns])
+        self.writer = pq.ParquetWriter(out, self.schema)
+
+    def write(self, columns):
+        table = {name: [None if v is None or v != v else str(v) for v in values] for name, values in columns.items()}
+        self.writer.write_table(self.pa.Table.from_pydict(table, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+MATRIX_WRITERS = {'csv': CsvMatrixWriter, 'parquet': ParquetMatrixWriter}
+
+def score_portfolio(entity_chunks, out, fmt='csv', fields=DEFAULT_FIELDS, artifact_dir='.', workers=1):
+    """Score chunks of entities and write the matrix one chunk at a time.
+
+    With several workers the chunks are scored in parallel and written in input
+    order, with at most two chunks per worker in flight so memory stays flat.
+    Returns (entities, matrix rows, unknown company type references).
+    """
+    writer = MATRIX_WRITERS[fmt](out, ['entity_id'] + list(fields))
+    entities = matrix_rows = unknown = 0
+    with contextlib.ExitStack() as stack:
+        stack.callback(writer.close)
+        if workers > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker, initargs=(artifact_dir,)
+            ))
+            results = bounded_map(pool, score_chunk, entity_chunks, workers * 2, fields)
+        else:
+            init_worker(artifact_dir)
+            results = (score_chunk(chunk, fields) for chunk in entity_chunks)
+        for columns, count, chunk_unknown in results:
+            writer.write(columns)
+            entities += count
+            matrix_rows += len(columns['entity_id'])
+            unknown += chunk_unknown
+    return entities, matrix_rows, unknown
+
+def main(argv=None):
+    """Score a portfolio file from the command line and report throughput"""
+    parser = argparse.ArgumentParser(description="Resolve the compliances of many entities into a long-format matrix")
+    parser.add_argument('--input', required=True, help="CSV or Parquet file with one entity per row")
+    parser.add_argument('--output', required=True, help="Matrix file to write")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        help="Output format (default: from the output extension, else csv)")
+    parser.add_argument('--id-column', default='entity_id')
+    parser.add_argument('--types-column', default='company_types',
+                        help="Column listing each entity's company types, separated by ; , or |")
+    parser.add_argument('--states-column', default='states',
+                        help="Optional column listing each entity's operating states")
+    parser.add_argument('--fields', nargs='+', default=DEFAULT_FIELDS,
+                        help="Compliance fields written for each obligation")
+    parser.add_argument('--artifact-dir', default='.', help="Directory with the model artifacts")
+    parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: available cores)")
+    parser.add_argument('--chunksize', type=int, default=BATCH_CHUNK_SIZE, help="Entities per chunk")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'csv')
+    query = ComplianceQuery(args.artifact_dir, lazy=True)
+    if query.applicability is None:
+        raise SystemExit("✗ Applicability index is missing; retrain with train_model.py")
+    record_fields = set(query.lookup(query.company_types[0])[0]) if query.company_types else set()
+    unknown_fields = set(args.fields) - record_fields
+    if unknown_fields:
+        parser.error(f"Unknown fields: {', '.join(sorted(unknown_fields))}")
+    workers = args.workers or available_cores()
+
+    try:
+        chunks = read_entities(args.input, args.id_column, args.types_column, args.states_column, args.chunksize)
+    except ValueError as e:
+        raise SystemExit(f"✗ {e}")
+    print(f"Scoring {args.input} with {workers} workers...")
+    start = time.perf_counter()
+    with open(args.output, 'wb') as out:
+        entities, matrix_rows, unknown = score_portfolio(chunks, out, fmt, args.fields, args.artifact_dir, workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"✓ Scored {entities:,} entities into {matrix_rows:,} rows in {elapsed:.2f}s "
+          f"({entities / elapsed:,.0f} entities/s, {matrix_rows / elapsed:,.0f} rows/s)")
+    if unknown:
+        print(f"⚠ Skipped {unknown:,} unknown company type references")
+    print(f"✓ Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
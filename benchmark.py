@@ -0,0 +1,200 @@
+"""
+Compliance Benchmark Suite
+Times training, artifact loading, lookup, search and export on synthetic registers scaled from mop_updated.xlsx
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+DEFAULT_SCALES = [10, 100, 1000]
+SEARCH_TERMS = ['biomass', 'renewable energy', 'registration', 'min']
+LOOKUP_SAMPLES = 200
+REGRESSION_THRESHOLD = 0.2
+# Slowdowns smaller than this are timer noise, whatever their relative size
+MIN_REGRESSION_SECONDS = 0.005
+# Run in a fresh interpreter: imports, lazy open and the first company type lookup
+COLD_START_SCRIPT = (
+    "import sys; from query_api import ComplianceQuery; "
+    "query = ComplianceQuery(sys.argv[1], lazy=sys.argv[2] == 'lazy'); "
+    "query.lookup(query.company_types[0])"
+)
+
+def generate_register(source='mop_updated.xlsx', scale=10):
+    """A register shaped like the source with `scale` copies of every row.
+
+    Copy k > 0 renames each company type to <TYPE><k> inside obligation_id, so the
+    number of company types grows with the scale as it would with real data.
+    """
+    df = pd.read_excel(source)
+    copies = [df]
+    for k in range(1, scale):
+        copy = df.copy()
+        copy['obligation_id'] = copy['obligation_id'].str.replace(r'^MOP-([A-Z0-9]+)-', rf'MOP-\g<1>{k}-', regex=True)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+def timed(stages, name, func, *args, repeat=1, **kwargs):
+    """Run func `repeat` times, record the best time and peak RSS so far under name, return its result"""
+    from train_model import peak_rss_mb
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    stages[name] = {'seconds': round(best, 6), 'peak_rss_mb': round(peak_rss_mb() or 0.0, 1)}
+    return result
+
+def cold_start(artifact_dir, mode):
+    """Start a new interpreter that opens the artifacts ('lazy' or 'eager') and looks up one company type"""
+    subprocess.run(
+        [sys.executable, '-c', COLD_START_SCRIPT, artifact_dir, mode], check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+
+def run_scale(source, scale, workdir):
+    """Benchmark every stage on one synthetic register, in a fresh process"""
+    from exporter import export_records
+    from query_api import ComplianceQuery, search_compliances
+    from train_model import create_company_compliance_mapping, load_and_preprocess_data, save_model_artifacts
+
+    data_path = os.path.join(workdir, f'register_{scale}x.csv')
+    artifact_dir = os.path.join(workdir, f'artifacts_{scale}x')
+    os.makedirs(artifact_dir, exist_ok=True)
+    generate_register(source, scale).to_csv(data_path, index=False)
+
+    stages = {}
+    # Silence the training scripts' progress output
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = timed(stages, 'load_and_preprocess_data', load_and_preprocess_data, data_path)
+        mapping = timed(stages, 'create_company_compliance_mapping', create_company_compliance_mapping, df)
+        timed(stages, 'save_model_artifacts', save_model_artifacts, mapping, df, artifact_dir)
+    rows = len(df)
+    del df, mapping
+
+    timed(stages, 'cold_start_eager', cold_start, artifact_dir, 'eager', repeat=3)
+    timed(stages, 'cold_start_lazy', cold_start, artifact_dir, 'lazy', repeat=3)
+    timed(stages, 'load_artifacts_lazy', ComplianceQuery, artifact_dir, lazy=True, repeat=3)
+    query = timed(stages, 'load_artifacts', ComplianceQuery, artifact_dir, repeat=3)
+    sample = query.company_types[::max(1, len(query.company_types) // LOOKUP_SAMPLES)][:LOOKUP_SAMPLES]
+
+    def lookup_sample():
+        for company_type in sample:
+            query.lookup(company_type)
+
+    def search_all_types():
+        return [search_compliances(query.model, query.search_index, term, lazy=True) for term in SEARCH_TERMS]
+
+    def search_per_type():
+        for company_type in sample:
+            for term in SEARCH_TERMS:
+                search_compliances(query.model, query.search_index, term, company_type=company_type)
+
+    timed(stages, 'lookup', lookup_sample, repeat=3)
+    results = timed(stages, 'search_all_types', search_all_types, repeat=3)
+    timed(stages, 'search_per_type', search_per_type, repeat=3)
+    timed(stages, 'export_csv', export_records, max(results, key=len), 'csv', io.BytesIO())
+
+    return {
+        'rows': rows,
+        'company_types': len(query.company_types),
+        'lookup_samples': len(sample),
+        'stages': stages,
+    }
+
+def git_commit():
+    """Current commit of the working tree, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(source='mop_updated.xlsx', scales=DEFAULT_SCALES):
+    """Benchmark each scale in its own process, so peak RSS is per scale"""
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scales': {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            print(f"Benchmarking {scale}x...")
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(run_scale, source, scale, workdir).result()
+            results['scales'][str(scale)] = result
+            print(f"✓ {scale}x: {result['rows']} rows, {result['company_types']} company types")
+    return results
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """(scale, stage, baseline seconds, current seconds) for stages slower by more than threshold"""
+    regressions = []
+    for scale, result in current['scales'].items():
+        previous = baseline.get('scales', {}).get(scale)
+        if previous is None:
+            continue
+        for stage, timing in result['stages'].items():
+            before = previous['stages'].get(stage, {}).get('seconds')
+            if not before:
+                continue
+            slower = timing['seconds'] - before
+            if slower > before * threshold and slower > MIN_REGRESSION_SECONDS:
+                regressions.append((scale, stage, before, timing['seconds']))
+    return regressions
+
+def print_report(results):
+    """Print a table of stage timings and peak RSS per scale"""
+    print("\n" + "=" * 60)
+    print("BENCHMARK RESULTS")
+    print("=" * 60)
+    for scale, result in results['scales'].items():
+        print(f"\n{scale}x ({result['rows']} rows, {result['company_types']} company types)")
+        for stage, timing in result['stages'].items():
+            print(f"  {stage:34} {timing['seconds'] * 1000:10.1f} ms   peak RSS {timing['peak_rss_mb']:8.1f} MB")
+
+def main(argv=None):
+    """Run the benchmarks, save them as JSON and optionally compare with a previous run"""
+    parser = argparse.ArgumentParser(description="Benchmark the compliance pipeline")
+    parser.add_argument('--data', default='mop_updated.xlsx', help="Register the synthetic data is scaled from")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the results")
+    parser.add_argument('--compare', help="Previous results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative slowdown reported as a regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.data, args.scales)
+    print_report(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regressions against {args.compare}:")
+            for scale, stage, before, after in regressions:
+                print(f"  {scale}x {stage}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+            sys.exit(1)
+        print(f"✓ No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
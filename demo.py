@@ -2,8 +2,7 @@
 Demo Script - Shows how the compliance prediction system works
 """
 
-import pickle
-import pandas as pd
+from artifacts import load_company_metadata, load_company_types, open_model
 
 print("=" * 80)
 print("COMPLIANCE PREDICTION SYSTEM - DEMO")
@@ -11,14 +10,11 @@ print("=" * 80)
 
 # Load the model
 print("\n📦 Loading trained model...")
-with open('compliance_model.pkl', 'rb') as f:
-    model = pickle.load(f)
-
-with open('company_metadata.pkl', 'rb') as f:
-    metadata = pickle.load(f)
-
-with open('company_types.pkl', 'rb') as f:
-    company_types = pickle.load(f)
+# The columnar model decodes a company type's records only when they are accessed,
+# so the counts below come from the metadata
+company_types = load_company_types()
+metadata = load_company_metadata()
+model = open_model()
 
 print(f"✓ Model loaded successfully!")
 print(f"✓ Total company types: {len(company_types)}")
@@ -28,7 +24,7 @@ print("\n" + "=" * 80)
 print("AVAILABLE COMPANY TYPES")
 print("=" * 80)
 for i, ct in enumerate(company_types, 1):
-    count = len(model[ct])
+    count = metadata[ct]['total_compliances']
     print(f"{i:2}. {ct:15} → {count:3} compliances")
 
 # Demo 2: Show detailed compliances for a specific company type
@@ -67,18 +63,18 @@ print("\n" + "=" * 80)
 print("SYSTEM STATISTICS")
 print("=" * 80)
 
-total_compliances = sum(len(comps) for comps in model.values())
-avg_compliances = total_compliances / len(model)
+total_compliances = sum(metadata[ct]['total_compliances'] for ct in company_types)
+avg_compliances = total_compliances / len(company_types)
 
-print(f"Total Company Types: {len(model)}")
+print(f"Total Company Types: {len(company_types)}")
 print(f"Total Compliances: {total_compliances}")
 print(f"Average Compliances per Type: {avg_compliances:.2f}")
 
 # Top 10 company types by compliance count
 print("\nTop 10 Company Types by Compliance Count:")
-sorted_companies = sorted(model.items(), key=lambda x: len(x[1]), reverse=True)[:10]
-for i, (company, comps) in enumerate(sorted_companies, 1):
-    print(f"{i:2}. {company:15} → {len(comps):3} compliances")
+sorted_companies = sorted(model, key=lambda ct: metadata[ct]['total_compliances'], reverse=True)[:10]
+for i, company in enumerate(sorted_companies, 1):
+    print(f"{i:2}. {company:15} → {metadata[company]['total_compliances']:3} compliances")
 
 print("\n" + "=" * 80)
 print("✨ DEMO COMPLETED!")
@@ -0,0 +1,194 @@
+"""
+Compliance Export Pipeline
+Chunked CSV, Parquet and XLSX export of compliance records, per query or for all company types
+"""
+
+import argparse
+import atexit
+import contextlib
+import csv
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+from query_api import ComplianceQuery, search_compliances, to_jsonable
+
+EXPORT_CHUNK_SIZE = 5000
+# Prepared export files an ExportFileCache keeps on disk
+EXPORT_CACHE_FILES = 8
+
+# format -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+def available_formats():
+    """Export formats whose optional dependencies are installed"""
+    formats = ['csv', 'xlsx']
+    try:
+        import pyarrow  # noqa: F401
+        formats.insert(1, 'parquet')
+    except ImportError:
+        pass
+    return formats
+
+def iter_chunks(records, chunk_size=EXPORT_CHUNK_SIZE):
+    """Consecutive slices of a record sequence; lazy sequences decode one slice at a time"""
+    for start in range(0, len(records), chunk_size):
+        yield records[start:start + chunk_size]
+
+def write_csv(records, out, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write records as UTF-8 CSV to a binary file object, one chunk at a time.
+
+    Matches DataFrame.to_csv(index=False): minimal quoting, missing values empty.
+    """
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text, lineterminator=os.linesep)
+    writer.writerow(fields)
+    for chunk in iter_chunks(records, chunk_size):
+        writer.writerows([
+            ['' if value is None else value for value in (row.get(field) for field in fields)]
+            for row in to_jsonable(chunk)
+        ])
+    text.flush()
+    text.detach()
+
+def write_parquet(records, out, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write records as Parquet to a binary file object, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(field, pa.string()) for field in fields])
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in iter_chunks(records, chunk_size):
+            rows = to_jsonable(chunk)
+            columns = {field: [row.get(field) for row in rows] for field in fields}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+def write_xlsx(records, out, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write records as an XLSX workbook to a binary file object with openpyxl's write-only mode"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Compliances')
+    sheet.append(fields)
+    for chunk in iter_chunks(records, chunk_size):
+        for row in to_jsonable(chunk):
+            sheet.append([row.get(field) for field in fields])
+    workbook.save(out)
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'xlsx': write_xlsx}
+
+def export_records(records, fmt, out, fields=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write a sequence of compliance dicts in the given format to a binary file object"""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fields is None:
+        fields = list(records[0]) if len(records) else []
+    WRITERS[fmt](records, out, fields, chunk_size)
+
+def export_all_types(query, fmt, out, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write a zip archive with one file per company type, holding one type in memory at a time"""
+    extension = EXPORT_FORMATS[fmt][1]
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for company_type in query.company_types:
+            with archive.open(f"compliance_matrix_{company_type}.{extension}", 'w', force_zip64=True) as entry:
+                export_records(query.lookup(company_type), fmt, entry, chunk_size=chunk_size)
+
+class ExportFileCache:
+    """Thread-safe LRU of prepared export files in a temporary directory.
+
+    Exports are written to disk in chunks and only read back when served, so a
+    cached export costs disk space rather than memory. Files beyond max_files,
+    and those of an older artifact version once a newer one is asked for, are
+    deleted. The directory is removed when the process exits.
+    """
+
+    def __init__(self, max_files=EXPORT_CACHE_FILES):
+        self.max_files = max_files
+        self.directory = tempfile.mkdtemp(prefix='compliance-exports-')
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        atexit.register(shutil.rmtree, self.directory, True)
+
+    def open(self, version, key, extension, write):
+        """The export file of (version, key) opened for reading, written first by write(out) on a miss.
+
+        The caller closes the file. An open file stays readable even if it is
+        evicted meanwhile.
+        """
+        cache_key = (version, key)
+        with self._lock:
+            if version != self._version:
+                self._evict([k for k in self._files if k[0] != version])
+                self._version = version
+            if cache_key in self._files:
+                self._files.move_to_end(cache_key)
+                return open(self._files[cache_key], 'rb')
+
+        # Written outside the lock, so one large export doesn't hold up the others
+        fd, path = tempfile.mkstemp(suffix=f'.{extension}', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                write(out)
+            f = open(path, 'rb')
+        except BaseException:
+            os.remove(path)
+            raise
+        with self._lock:
+            if version != self._version:
+                # The artifacts changed while writing; serve this export but don't keep it
+                os.remove(path)
+                return f
+            self._evict([cache_key] if cache_key in self._files else [])
+            self._files[cache_key] = path
+            self._evict(list(self._files)[:max(0, len(self._files) - self.max_files)])
+        return f
+
+    def _evict(self, cache_keys):
+        for cache_key in cache_keys:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._files.pop(cache_key))
+
+def main(argv=None):
+    """Export compliances from the command line"""
+    parser = argparse.ArgumentParser(description="Export compliances to CSV, Parquet or XLSX")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--output', required=True, help="Output file (a .zip archive with --all)")
+    parser.add_argument('--company-type', help="Export one company type")
+    parser.add_argument('--search', help="Only export compliances matching this query")
+    parser.add_argument('--all', action='store_true', help="Export every company type into one archive")
+    parser.add_argument('--artifact-dir', default='.', help="Directory with the model artifacts")
+    parser.add_argument('--chunksize', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    if not (args.all or args.company_type or args.search):
+        parser.error("Give --company-type, --search or --all")
+
+    query = ComplianceQuery(args.artifact_dir)
+    start = time.perf_counter()
+    with open(args.output, 'wb') as out:
+        if args.all:
+            export_all_types(query, args.format, out, args.chunksize)
+            print(f"✓ Exported {len(query.company_types)} company types to {args.output} "
+                  f"in {time.perf_counter() - start:.2f}s")
+            return
+        if args.search:
+            records = search_compliances(
+                query.model, query.search_index, args.search,
+                company_type=args.company_type, lazy=True
+            )
+        else:
+            records = query.lookup(args.company_type)
+        export_records(records, args.format, out, chunk_size=args.chunksize)
+    print(f"✓ Exported {len(records)} compliances to {args.output} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Compliance Facet Index
+Posting lists per value of the categorical compliance fields for multi-facet filtering with live counts
+"""
+
+import numpy as np
+
+from artifacts import (
+    CompanyTypeRows, company_type_offsets, concatenate, is_missing, load_index, merge_vocabularies, renumber,
+    save_index
+)
+
+FACET_INDEX_FILE = 'facet_index.npz'
+FACET_INDEX_VERSION = 1
+
+# Faceted fields, in display order
+FACET_FIELDS = ['authority', 'regulation_type', 'jurisdiction', 'state', 'mandatory']
+
+def facet_key(value):
+    """A field value as the index keys it: its string form, or None when missing"""
+    return None if is_missing(value) else str(value)
+
+class FacetIndex(CompanyTypeRows):
+    """Per facet field: sorted distinct values, one sorted posting list of global rows per value,
+    and each row's value code (-1 when missing).
+
+    Rows are numbered like the columnar model and the search index, so a
+    company type is a contiguous row range. Missing values belong to no facet value.
+    """
+
+    def __init__(self, fields, company_types, type_offsets):
+        super().__init__(company_types, type_offsets)
+        self.fields = fields
+        self._value_ids = {
+            field: {value: i for i, value in enumerate(values.tolist())}
+            for field, (values, _, _, _) in fields.items()
+        }
+
+    def values(self, field):
+        """Distinct values of a facet field, sorted"""
+        return self.fields[field][0].tolist()
+
+    def _value_rows(self, field, selected, row_range=None):
+        """Sorted rows holding any of the selected values of a field"""
+        _, offsets, postings, _ = self.fields[field]
+        parts = []
+        for value in selected:
+            # Keyed like facet_segment, so a typed value finds the rows holding it
+            i = self._value_ids[field].get(facet_key(value))
+            if i is None:
+                continue
+            rows = postings[offsets[i]:offsets[i + 1]]
+            if row_range is not None:
+                lo, hi = np.searchsorted(rows, row_range)
+                rows = rows[lo:hi]
+            parts.append(rows)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        # A row has one value per field, so the parts are disjoint
+        return np.sort(np.concatenate(parts)).astype(np.int64)
+
+    def filter(self, selections, row_range=None, rows=None):
+        """Rows matching every field's selection, where a field matches any of its selected values.
+
+        Limited to a (start, stop) row range and/or to the given rows; given rows
+        keep their order (e.g. search ranking), otherwise rows are ascending.
+        Fields with an empty selection don't filter.
+        """
+        matched = None
+        for field, selected in selections.items():
+            if not selected:
+                continue
+            field_rows = self._value_rows(field, selected, row_range)
+            matched = field_rows if matched is None else np.intersect1d(matched, field_rows, assume_unique=True)
+            if len(matched) == 0:
+                break
+
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            if row_range is not None:
+                rows = rows[(rows >= row_range[0]) & (rows < row_range[1])]
+            return rows if matched is None else rows[np.isin(rows, matched)]
+        if matched is None:
+            start, stop = row_range if row_range is not None else (0, int(self.type_offsets[-1]))
+            return np.arange(start, stop, dtype=np.int64)
+        return matched
+
+    def counts(self, selections=None, row_range=None, rows=None):
+        """Live counts per facet value: {field: {value: count}}, most frequent first.
+
+        Each field is counted under the selections of the other fields only, so
+        its unselected values show how many rows they would add.
+        """
+        selections = selections or {}
+        result = {}
+        for field, (values, _, _, codes) in self.fields.items():
+            others = {f: v for f, v in selections.items() if f != field and v}
+            if others or rows is not None:
+                field_codes = codes[self.filter(others, row_range, rows)]
+            elif row_range is not None:
+                field_codes = codes[row_range[0]:row_range[1]]
+            else:
+                field_codes = codes
+            totals = np.bincount(field_codes[field_codes >= 0], minlength=len(values))
+            present = np.flatnonzero(totals)
+            order = present[np.argsort(-totals[present], kind='stable')]
+            result[field] = {values[i]: int(totals[i]) for i in order.tolist()}
+        return result
+
+def facet_segment(compliances):
+    """Per facet field, one company type's sorted distinct values and each row's code into them (-1 when missing)"""
+    segment = {}
+    for field in FACET_FIELDS:
+        column = [facet_key(c.get(field)) for c in compliances]
+        values = sorted({value for value in column if value is not None})
+        value_ids = {value: i for i, value in enumerate(values)}
+        codes = np.array([-1 if value is None else value_ids[value] for value in column], dtype=np.int32)
+        segment[field] = (values, codes)
+    return segment
+
+def build_facet_index(company_compliance_map, segments=None):
+    """Build the posting lists from the company type -> compliances mapping.
+
+    segments, the facet_segment of each company type in mapping order, are
+    computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [facet_segment(company_compliance_map[ct]) for ct in company_types]
+    fields = {}
+    for field in FACET_FIELDS:
+        values, value_maps = merge_vocabularies([segment[field][0] for segment in segments])
+        codes = concatenate(
+            [renumber(segment[field][1], value_map) for segment, value_map in zip(segments, value_maps)], np.int32
+        )
+
+        # A stable sort by code keeps each value's rows ascending
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes[codes >= 0], minlength=len(values)), out=offsets[1:])
+        fields[field] = (np.array(values, dtype=str), offsets, order.astype(np.int32), codes)
+
+    return FacetIndex(fields, company_types, company_type_offsets(company_compliance_map))
+
+def save_facet_index(index, path=FACET_INDEX_FILE):
+    """Save each facet field's values, posting lists and row codes"""
+    arrays = {}
+    for field, (values, offsets, postings, codes) in index.fields.items():
+        arrays[f'{field}.values'] = values
+        arrays[f'{field}.offsets'] = offsets
+        arrays[f'{field}.postings'] = postings
+        arrays[f'{field}.codes'] = codes
+    save_index(
+        path,
+        FACET_INDEX_VERSION,
+        fields=np.array(list(index.fields), dtype=str),
+        company_types=np.array(index.company_types, dtype=str),
+        type_offsets=index.type_offsets,
+        **arrays,
+    )
+
+def load_facet_index(path=FACET_INDEX_FILE, mmap=False):
+    """Load saved facet posting lists, or None to rebuild them (see artifacts.load_index)"""
+    def build(data):
+        fields = {
+            field: tuple(data[f'{field}.{part}'] for part in ('values', 'offsets', 'postings', 'codes'))
+            for field in data['fields'].tolist()
+        }
+        return FacetIndex(fields, data['company_types'].tolist(), data['type_offsets'])
+    return load_index(path, FACET_INDEX_VERSION, build, mmap)
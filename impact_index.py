@@ -0,0 +1,252 @@
+"""
+Change Impact Index
+Reverse indexes from regulation names and issuing authorities to their obligations and company types
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from artifacts import (
+    CompanyTypeRows, company_type_offsets, concatenate, is_missing, load_index, renumber, save_index
+)
+from lookup_index import normalize_key
+from obligation_sets import obligation_key
+
+IMPACT_INDEX_FILE = 'impact_index.npz'
+IMPACT_INDEX_VERSION = 1
+
+# Compliance field each kind of amendment is keyed by
+IMPACT_FIELDS = {'regulation': 'regulation_name', 'authority': 'authority'}
+
+# Arrays stored per kind, in ImpactIndex.kinds tuple order
+KIND_ARRAYS = ('names', 'row_offsets', 'rows', 'type_offsets', 'types', 'type_counts', 'distinct')
+
+class ImpactIndex(CompanyTypeRows):
+    """Per kind of amendment (regulation, authority): the distinct names, each with the sorted
+    global rows of its obligations and the company types those rows belong to, with counts.
+
+    Rows are numbered like the columnar model. Names are matched by their
+    normalize_key form, so an amendment is found however it is cased or
+    punctuated; answering one name is a dict probe plus two array slices.
+    """
+
+    def __init__(self, company_types, type_offsets, kinds):
+        super().__init__(company_types, type_offsets)
+        self.kinds = kinds
+        self._name_ids = {
+            kind: {normalize_key(name): i for i, name in enumerate(arrays[0].tolist())}
+            for kind, arrays in kinds.items()
+        }
+
+    def names(self, kind):
+        """Distinct names of a kind, sorted by their normalized form"""
+        return self.kinds[kind][0].tolist()
+
+    def find(self, kind, name):
+        """Position of a name among the kind's names, or None if no obligation has it"""
+        return self._name_ids[kind].get(normalize_key(name))
+
+    def rows(self, kind, i):
+        """Sorted global rows of the obligations under the i-th name"""
+        _, row_offsets, rows, *_ = self.kinds[kind]
+        return rows[row_offsets[i]:row_offsets[i + 1]]
+
+    def impact(self, kind, name):
+        """Obligations and company types reached by an amendment to a regulation or authority.
+
+        Returns a dict with the matched name, the obligation count (distinct
+        obligation contents counted once as well) and {company type: obligations},
+        or None when no obligation has the name.
+        """
+        i = self.find(kind, name)
+        if i is None:
+            return None
+        names, row_offsets, _, type_offsets, types, type_counts, distinct = self.kinds[kind]
+        start, stop = int(type_offsets[i]), int(type_offsets[i + 1])
+        return {
+            'kind': kind,
+            'name': str(names[i]),
+            'obligations': int(row_offsets[i + 1] - row_offsets[i]),
+            'distinct_obligations': int(distinct[i]),
+            'company_types': {
+                self.company_types[t]: count
+                for t, count in zip(types[start:stop].tolist(), type_counts[start:stop].tolist())
+            },
+        }
+
+def _kind_segment(values):
+    """One company type's names {normalized name: (number, first spelling)} and each row's number, -1 if none"""
+    names = {}
+    value_codes = {}
+    codes = np.full(len(values), -1, dtype=np.int64)
+    for row, value in enumerate(values):
+        if is_missing(value):
+            continue
+        # Keyed with their type, so 1, 1.0 and True are each normalized from their own spelling
+        value_key = value if type(value) is str else (type(value), value)
+        code = value_codes.get(value_key)
+        if code is None:
+            key = normalize_key(value)
+            # The first spelling of a name is the one shown
+            code = value_codes[value_key] = names.setdefault(key, (len(names), str(value).strip()))[0] if key else -1
+        codes[row] = code
+    return names, codes
+
+def impact_segment(compliances):
+    """Per kind, the _kind_segment of one company type's compliances"""
+    return {kind: _kind_segment([c.get(field) for c in compliances]) for kind, field in IMPACT_FIELDS.items()}
+
+def _build_kind(segments, row_types, row_obligations, type_count):
+    """Arrays of one kind from its segment per company type and each global row's type and obligation number"""
+    names = {}
+    codes = []
+    for type_names, type_codes in segments:
+        numbers = np.array([names.setdefault(key, (len(names), name))[0] for key, (_, name) in type_names.items()],
+                           dtype=np.int64)
+        codes.append(renumber(type_codes, numbers))
+    codes = concatenate(codes, np.int64)
+
+    # Renumber the names in sorted key order
+    keys = sorted(names)
+    remap = np.empty(len(keys), dtype=np.int64)
+    for position, key in enumerate(keys):
+        remap[names[key][0]] = position
+    present = codes >= 0
+    codes[present] = remap[codes[present]]
+    name_count = len(keys)
+
+    # A stable sort by code keeps each name's rows ascending
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    row_offsets = np.zeros(name_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[present], minlength=name_count), out=row_offsets[1:])
+
+    # (name, company type) pairs with their row counts, sorted by name then type
+    pairs, type_counts = np.unique(codes[present] * type_count + row_types[present], return_counts=True)
+    type_offsets = np.zeros(name_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs // type_count, minlength=name_count), out=type_offsets[1:])
+
+    obligation_count = int(row_obligations.max()) + 1 if len(row_obligations) else 1
+    distinct_pairs = np.unique(codes[present] * obligation_count + row_obligations[present])
+    distinct = np.bincount(distinct_pairs // obligation_count, minlength=name_count)
+
+    return (
+        np.array([names[key][1] for key in keys], dtype=str),
+        row_offsets,
+        order.astype(np.int32),
+        type_offsets,
+        (pairs % type_count).astype(np.int32),
+        type_counts.astype(np.int32),
+        distinct.astype(np.int32),
+    )
+
+def build_impact_index(company_compliance_map, row_obligations=None, segments=None):
+    """Build the reverse indexes from the company type -> compliances mapping.
+
+    row_obligations, the obligation number of each global row as numbered by
+    obligation sets, and segments, the impact_segment of each company type in
+    mapping order, are computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [impact_segment(company_compliance_map[ct]) for ct in company_types]
+    lengths = [len(company_compliance_map[ct]) for ct in company_types]
+    row_types = np.repeat(np.arange(len(company_types), dtype=np.int64), lengths)
+
+    # Identical obligation content under several IDs counts once
+    if row_obligations is None:
+        numbers = {}
+        row_obligations = [
+            numbers.setdefault(obligation_key(c), len(numbers))
+            for company_type in company_types for c in company_compliance_map[company_type]
+        ]
+    row_obligations = np.asarray(row_obligations, dtype=np.int64)
+
+    kinds = {
+        kind: _build_kind([segment[kind] for segment in segments], row_types, row_obligations,
+                          max(len(company_types), 1))
+        for kind in IMPACT_FIELDS
+    }
+    return ImpactIndex(company_types, company_type_offsets(company_compliance_map), kinds)
+
+def save_impact_index(index, path=IMPACT_INDEX_FILE):
+    """Save each kind's names with their row and company type postings"""
+    arrays = {
+        f'{kind}.{name}': array
+        for kind, kind_arrays in index.kinds.items()
+        for name, array in zip(KIND_ARRAYS, kind_arrays)
+    }
+    save_index(
+        path,
+        IMPACT_INDEX_VERSION,
+        company_types=np.array(index.company_types, dtype=str),
+        type_offsets=index.type_offsets,
+        **arrays,
+    )
+
+def load_impact_index(path=IMPACT_INDEX_FILE, mmap=False):
+    """Load saved impact indexes, or None to rebuild them (see artifacts.load_index)"""
+    def build(data):
+        kinds = {kind: tuple(data[f'{kind}.{name}'] for name in KIND_ARRAYS) for kind in IMPACT_FIELDS}
+        return ImpactIndex(data['company_types'].tolist(), data['type_offsets'], kinds)
+    return load_index(path, IMPACT_INDEX_VERSION, build, mmap)
+
+def read_names(path):
+    """Non-empty lines of a text file, e.g. a list of amended regulations"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def print_impact(report):
+    """Print an impact report as returned by ComplianceQuery.impact"""
+    for result in report['results']:
+        label = f"{result['kind']} {result['query']!r}"
+        if result['name'] is None:
+            print(f"⚠ {label}: no obligations")
+            continue
+        entities = f", {result['entities']:,} entities" if 'entities' in result else ""
+        print(f"✓ {label} → {result['name']}: {result['obligations']} obligations "
+              f"({result['distinct_obligations']} distinct), {len(result['company_types'])} company types{entities}")
+        for company_type, count in result['company_types'].items():
+            print(f"    {company_type:15} {count:5} obligations")
+    entities = f", {report['entities']:,} of {report['entities_read']:,} entities" if 'entities' in report else ""
+    print(f"\nAffected in total: {len(report['company_types'])} company types{entities}")
+
+def main(argv=None):
+    """Report the company types (and portfolio entities) affected by amended regulations or authorities"""
+    from batch_score import read_entities
+    from query_api import ComplianceQuery
+
+    parser = argparse.ArgumentParser(description="Which company types and entities an amendment affects")
+    parser.add_argument('--regulation', action='append', default=[], help="Amended regulation name (repeatable)")
+    parser.add_argument('--authority', action='append', default=[], help="Issuing authority (repeatable)")
+    parser.add_argument('--regulations-file', help="Text file listing amended regulations, one per line")
+    parser.add_argument('--portfolio', help="CSV or Parquet file of entities, as read by batch_score.py")
+    parser.add_argument('--id-column', default='entity_id')
+    parser.add_argument('--types-column', default='company_types')
+    parser.add_argument('--states-column', default='states')
+    parser.add_argument('--artifact-dir', default='.', help="Directory with the model artifacts")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    regulations = args.regulation + (read_names(args.regulations_file) if args.regulations_file else [])
+    if not regulations and not args.authority:
+        parser.error("Give at least one --regulation, --authority or --regulations-file")
+
+    query = ComplianceQuery(args.artifact_dir, lazy=True, shared=True)
+    try:
+        entities = None
+        if args.portfolio:
+            entities = read_entities(args.portfolio, args.id_column, args.types_column, args.states_column)
+        report = query.impact(regulations, args.authority, entities)
+    except (RuntimeError, ValueError) as e:
+        raise SystemExit(f"✗ {e}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_impact(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Instrumentation
+Low-overhead stage timers and counters with per-run traces and Prometheus text export
+
+Disabled by default: timer() then returns a shared no-op context manager, so an
+instrumented stage costs one attribute check. Set COMPLIANCE_METRICS=1 to enable
+collection at import time, and COMPLIANCE_METRICS_LOG=<path> to append every
+finished trace to a JSON lines file.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+METRICS_PREFIX = 'compliance'
+TRACE_HISTORY = 20
+
+class _NullTimer:
+    """Context manager that does nothing, shared by every disabled timer and trace"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+class _Timer:
+    """Times one stage and records it on exit, even when the stage raises"""
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry._record(self.stage, self.start, time.perf_counter() - self.start)
+        return False
+
+class _Trace:
+    """Collects the stages timed on this thread between enter and exit as one structured record"""
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.record = {'trace': self.name, 'started_at': time.time(), 'seconds': None, 'stages': []}
+        self.registry._local.trace = self
+        return self
+
+    def __exit__(self, *exc):
+        self.record['seconds'] = round(time.perf_counter() - self.start, 6)
+        self.registry._local.trace = None
+        self.registry._finish_trace(self.record)
+        return False
+
+class Instrumentation:
+    """Registry of stage timings, counters and recent traces, safe to use from several threads"""
+
+    def __init__(self, enabled=False, log_path=None, trace_history=TRACE_HISTORY):
+        self.enabled = enabled
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = {}
+        self._counters = {}
+        self._traces = deque(maxlen=trace_history)
+
+    def enable(self, log_path=None):
+        """Start collecting; traces are also appended to log_path as JSON lines when given"""
+        self.enabled = True
+        if log_path is not None:
+            self.log_path = log_path
+
+    def disable(self):
+        """Stop collecting; recorded values are kept"""
+        self.enabled = False
+
+    def reset(self):
+        """Forget every recorded timing, counter and trace"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._traces.clear()
+
+    def timer(self, stage):
+        """Context manager timing one execution of a stage"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, stage)
+
+    def timed(self, stage):
+        """Decorator timing every call of a function as a stage"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self, stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def trace(self, name):
+        """Context manager grouping the stages timed on this thread into one trace, e.g. a rerun"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Trace(self, name)
+
+    def count(self, event, n=1):
+        """Add n to an event counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + n
+
+    def _record(self, stage, start, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'last_seconds': 0.0}
+            stats['count'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['last_seconds'] = seconds
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.record['stages'].append({
+                'stage': stage,
+                'offset': round(start - trace.start, 6),
+                'seconds': round(seconds, 6),
+            })
+
+    def _finish_trace(self, record):
+        with self._lock:
+            self._traces.append(record)
+            name = f"{record['trace']}_traces"
+            self._counters[name] = self._counters.get(name, 0) + 1
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def stage_stats(self):
+        """Copy of the per-stage count, total, max and last durations"""
+        with self._lock:
+            return {stage: dict(stats) for stage, stats in self._stages.items()}
+
+    def counters(self):
+        """Copy of the event counters"""
+        with self._lock:
+            return dict(self._counters)
+
+    def traces(self):
+        """The most recent finished traces, oldest first"""
+        with self._lock:
+            return list(self._traces)
+
+    def last_trace(self, name=None):
+        """The most recent finished trace, optionally of one name, or None"""
+        for record in reversed(self.traces()):
+            if name is None or record['trace'] == name:
+                return record
+        return None
+
+    def prometheus_text(self, prefix=METRICS_PREFIX):
+        """Stage timings and counters in the Prometheus text exposition format"""
+        stages = self.stage_stats()
+        counters = self.counters()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in instrumented stages.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, stats in sorted(stages.items()):
+            label = f'{{stage="{_escape_label(stage)}"}}'
+            lines.append(f"{prefix}_stage_seconds_count{label} {stats['count']}")
+            lines.append(f"{prefix}_stage_seconds_sum{label} {stats['total_seconds']:.9f}")
+        lines += [
+            f"# HELP {prefix}_stage_seconds_max Longest single execution of each stage.",
+            f"# TYPE {prefix}_stage_seconds_max gauge",
+        ]
+        for stage, stats in sorted(stages.items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{_escape_label(stage)}"}} {stats["max_seconds"]:.9f}')
+        lines += [
+            f"# HELP {prefix}_events_total Instrumented event counts.",
+            f"# TYPE {prefix}_events_total counter",
+        ]
+        for event, value in sorted(counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{_escape_label(event)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Process-wide registry used by the app, the training script and the query service
+registry = Instrumentation(
+    enabled=os.environ.get('COMPLIANCE_METRICS') == '1',
+    log_path=os.environ.get('COMPLIANCE_METRICS_LOG') or None,
+)
+timer = registry.timer
+timed = registry.timed
+trace = registry.trace
+count = registry.count
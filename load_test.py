@@ -0,0 +1,108 @@
+"""
+Query Service Load Test
+Drives query_service.py over keep-alive connections and reports latency percentiles and throughput
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+async def read_response(reader):
+    """Read one HTTP response and return (status, body)"""
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+async def worker(host, port, requests, latencies, errors):
+    """Send requests sequentially over one keep-alive connection"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for method, path, body in requests:
+            data = body.encode('utf-8') if body else b''
+            start = time.perf_counter()
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode('latin-1') + data
+            )
+            await writer.drain()
+            status, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+def build_requests(company_types, count, batch_size):
+    """A reproducible mix of lookup, metadata, search and batch requests"""
+    rng = random.Random(0)
+    terms = ['bio', 'renewable', 'ministry', 'grid', 'coal', 'transmission', 'tariff']
+    requests = []
+    for i in range(count):
+        company_type = rng.choice(company_types)
+        kind = i % 4
+        if kind == 0:
+            requests.append(('GET', f'/compliances/{company_type}', None))
+        elif kind == 1:
+            requests.append(('GET', f'/metadata/{company_type}', None))
+        elif kind == 2:
+            requests.append(('GET', f'/search?q={rng.choice(terms)}&limit=20', None))
+        else:
+            batch = [{'op': 'lookup', 'company_type': rng.choice(company_types)} for _ in range(batch_size)]
+            requests.append(('POST', '/batch', json.dumps({'requests': batch})))
+    return requests
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def run(args):
+    """Run the load test and print the report"""
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    writer.write(f"GET /company-types HTTP/1.1\r\nHost: {args.host}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    _, body = await read_response(reader)
+    writer.close()
+    company_types = json.loads(body)
+
+    requests = build_requests(company_types, args.requests, args.batch_size)
+    shares = [requests[i::args.concurrency] for i in range(args.concurrency)]
+    latencies, errors = [], []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(args.host, args.port, share, latencies, errors) for share in shares))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print("=" * 60)
+    print("QUERY SERVICE LOAD TEST")
+    print("=" * 60)
+    print(f"Requests:     {len(latencies)} over {args.concurrency} connections")
+    print(f"Errors:       {len(errors)}")
+    print(f"Elapsed:      {elapsed:.2f}s")
+    print(f"Throughput:   {len(latencies) / elapsed:,.0f} requests/sec")
+    print(f"Latency p50:  {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"Latency p99:  {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+def main(argv=None):
+    """Parse arguments and run the load test"""
+    parser = argparse.ArgumentParser(description="Load test the compliance query service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8601)
+    parser.add_argument('--requests', type=int, default=20000, help="Total requests to send")
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent keep-alive connections")
+    parser.add_argument('--batch-size', type=int, default=10, help="Lookups per /batch request")
+    asyncio.run(run(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
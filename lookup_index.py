@@ -0,0 +1,391 @@
+"""
+Compliance Lookup Index
+Sorted-key index over company type codes, regulation names and obligation IDs with prefix and typo-tolerant lookup
+"""
+
+import re
+
+import numpy as np
+
+from artifacts import (
+    CompanyTypeRows, company_type_offsets, concatenate, csr_gather, load_index, merge_vocabularies, save_index
+)
+
+LOOKUP_INDEX_FILE = 'lookup_index.npz'
+LOOKUP_INDEX_VERSION = 1
+
+# Entry kinds, in the order matches of equal quality are listed
+KINDS = ['company_type', 'regulation', 'obligation']
+COMPANY_TYPE, REGULATION, OBLIGATION = range(len(KINDS))
+
+WORD_PATTERN = re.compile(r'[^\W_]+')
+GRAM_SIZE = 3
+# Key rank = (kind, word-start match) * RANK_SCALE + label length; lower ranks are listed first
+RANK_SCALE = 10000
+# Candidates fetched per wanted result, so entries matched by several keys still fill the limit
+PREFIX_OVERFETCH = 4
+# Most candidates checked by edit distance, the ones sharing the most trigrams with the query
+FUZZY_CANDIDATES = 64
+
+def normalize_key(text):
+    """Case-, punctuation- and whitespace-insensitive form of a lookup key, e.g. 'MOP-BIO-001' -> 'mop bio 001'"""
+    return ' '.join(WORD_PATTERN.findall(str(text).casefold()))
+
+def key_grams(key):
+    """Distinct character trigrams of a normalized key"""
+    return {key[i:i + GRAM_SIZE] for i in range(len(key) - GRAM_SIZE + 1)}
+
+def default_max_distance(query):
+    """Edits tolerated for a query of this length: none for very short queries, up to 2 for long ones"""
+    length = len(normalize_key(query))
+    return 0 if length < 4 else 1 if length < 8 else 2
+
+def prefix_distance(query, key, max_distance):
+    """Fewest edits turning query into some prefix of key, or None when that takes more than max_distance"""
+    key = key[:len(query) + max_distance]
+    previous = list(range(len(key) + 1))
+    for i, q in enumerate(query, 1):
+        current = [i]
+        for j, k in enumerate(key, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (q != k)))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    best = min(previous)
+    return best if best <= max_distance else None
+
+class _SortedKeys:
+    """Sorted UTF-8 keys with the entry and rank of each, searched by binary search"""
+
+    def __init__(self, keys, entries, ranks):
+        self.keys = keys
+        self.entries = entries
+        self.ranks = ranks
+
+    def span(self, key):
+        """Range of keys starting with a normalized key"""
+        encoded = key.encode('utf-8')
+        lo = int(np.searchsorted(self.keys, encoded, side='left'))
+        hi = int(np.searchsorted(self.keys, encoded + b'\xff', side='left'))
+        return lo, hi
+
+def _sorted_keys(keys, entries, ranks):
+    encoded = np.array([key.encode('utf-8') for key in keys], dtype=bytes)
+    order = np.argsort(encoded, kind='stable')
+    return _SortedKeys(encoded[order], np.array(entries, dtype=np.int32)[order], np.array(ranks, dtype=np.int32)[order])
+
+class LookupIndex(CompanyTypeRows):
+    """Typeahead index of company types, regulation names and obligation IDs.
+
+    Names and obligation IDs are kept in two sorted key arrays, so the long
+    regulation names don't widen the 100k+ ID keys. Names are also keyed from
+    every word start, so 'amendment rules' finds 'Electricity (Amendment)
+    Rules'. Typos are caught through trigram posting lists: the entries sharing
+    most trigrams with the query are checked by edit distance.
+    """
+
+    def __init__(self, company_types, type_offsets, kinds, targets, label_offsets, label_data,
+                 regulation_offsets, regulation_types, names, ids, grams, gram_offsets, gram_entries):
+        super().__init__(company_types, type_offsets)
+        self.kinds = kinds
+        self.targets = targets
+        self.label_offsets = label_offsets
+        self.label_data = label_data
+        self.regulation_offsets = regulation_offsets
+        self.regulation_types = regulation_types
+        self.names = names
+        self.ids = ids
+        self.grams = grams
+        self.gram_offsets = gram_offsets
+        self.gram_entries = gram_entries
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def label(self, entry):
+        """Display text of an entry: the type code, regulation name or obligation ID"""
+        return bytes(self.label_data[self.label_offsets[entry]:self.label_offsets[entry + 1]]).decode('utf-8')
+
+    def _entry_keys(self, entry):
+        """Normalized keys an entry is found under"""
+        words = normalize_key(self.label(entry)).split()
+        starts = range(min(len(words), 2)) if self.kinds[entry] == OBLIGATION else range(len(words))
+        return [' '.join(words[start:]) for start in starts]
+
+    def describe(self, entry, distance=0):
+        """Match dict of an entry: kind, label, the company types it leads to and, for obligations, its row"""
+        kind, target = int(self.kinds[entry]), int(self.targets[entry])
+        if kind == COMPANY_TYPE:
+            company_types = [self.company_types[target]]
+        elif kind == REGULATION:
+            type_ids = self.regulation_types[self.regulation_offsets[target]:self.regulation_offsets[target + 1]]
+            company_types = [self.company_types[t] for t in type_ids.tolist()]
+        else:
+            company_types = [self.company_types[int(np.searchsorted(self.type_offsets, target, side='right')) - 1]]
+        return {
+            'kind': KINDS[kind],
+            'label': self.label(entry),
+            'company_types': company_types,
+            'row': target if kind == OBLIGATION else None,
+            'distance': distance,
+        }
+
+    def prefix(self, query, limit=10):
+        """Entries with a key starting with the query, exact matches first, then by kind and length"""
+        key = normalize_key(query)
+        if not key:
+            return []
+        candidates = []
+        for keys in (self.names, self.ids):
+            lo, hi = keys.span(key)
+            if hi == lo:
+                continue
+            ranks = keys.ranks[lo:hi]
+            take = limit * PREFIX_OVERFETCH
+            if take < hi - lo:
+                # The best ranks, ties broken by key order like the rest of the listing
+                threshold = np.partition(ranks, take - 1)[take - 1]
+                better = np.flatnonzero(ranks < threshold)
+                top = np.concatenate([better, np.flatnonzero(ranks == threshold)[:take - len(better)]])
+                # An exact match sorts first in the span and is always listed
+                top = np.append(top, 0)
+            else:
+                top = np.arange(hi - lo)
+            exact = key.encode('utf-8')
+            candidates.extend(
+                (keys.keys[lo + i] != exact, int(ranks[i]), lo + i, int(keys.entries[lo + i])) for i in top.tolist()
+            )
+        candidates.sort()
+        return list(dict.fromkeys(entry for *_, entry in candidates))[:limit]
+
+    def fuzzy(self, query, max_distance=2, limit=10):
+        """(entry, edits) of entries whose keys start with the query up to max_distance edits, closest first"""
+        key = normalize_key(query)
+        grams = key_grams(key)
+        if not grams or max_distance <= 0:
+            return []
+        found = np.searchsorted(self.grams, sorted(grams))
+        found = [g for g, gram in zip(found.tolist(), sorted(grams)) if g < len(self.grams) and self.grams[g] == gram]
+        if not found:
+            return []
+        postings = np.concatenate([self.gram_entries[self.gram_offsets[g]:self.gram_offsets[g + 1]] for g in found])
+        counts = np.bincount(postings, minlength=len(self))
+        # Each edit can destroy at most GRAM_SIZE of the query's trigrams
+        candidates = np.flatnonzero(counts >= max(1, len(grams) - GRAM_SIZE * max_distance))
+        if len(candidates) > FUZZY_CANDIDATES:
+            candidates = candidates[np.argpartition(-counts[candidates], FUZZY_CANDIDATES - 1)[:FUZZY_CANDIDATES]]
+
+        matches = []
+        for entry in candidates.tolist():
+            distances = [d for d in (prefix_distance(key, k, max_distance) for k in self._entry_keys(entry)) if d is not None]
+            if distances:
+                matches.append((min(distances), -int(counts[entry]), int(self.kinds[entry]), entry))
+        matches.sort()
+        return [(entry, distance) for distance, _, _, entry in matches[:limit]]
+
+    def lookup(self, query, limit=10, max_distance=None):
+        """Match dicts for a typeahead query: prefix matches, then close misspellings to fill the limit"""
+        if max_distance is None:
+            max_distance = default_max_distance(query)
+        entries = self.prefix(query, limit)
+        matches = [self.describe(entry) for entry in entries]
+        if len(matches) < limit and max_distance > 0:
+            seen = set(entries)
+            for entry, distance in self.fuzzy(query, max_distance, limit + len(seen)):
+                if entry not in seen and distance > 0 and len(matches) < limit:
+                    matches.append(self.describe(entry, distance))
+        return matches
+
+    def obligation_row(self, obligation_id):
+        """Global model row of an obligation ID; raises KeyError if it isn't indexed"""
+        key = normalize_key(obligation_id)
+        lo, hi = self.ids.span(key)
+        if hi > lo and self.ids.keys[lo] == key.encode('utf-8'):
+            return int(self.targets[self.ids.entries[lo]])
+        raise KeyError(obligation_id)
+
+def _label_keys(label, kind, key):
+    """Keys an entry is found under with the rank of each, and the trigrams of its normalized label key"""
+    words = key.split()
+    if kind == OBLIGATION:
+        # IDs are also found without their prefix, e.g. 'BIO-001' for MOP-BIO-001
+        keys = [' '.join(words[start:]) for start in range(min(len(words), 2))]
+    else:
+        # Names are also found from each later word
+        keys = [' '.join(words[start:]) for start in range(len(words))]
+    length = min(len(label), RANK_SCALE - 1)
+    ranks = [(kind * 2 + (start > 0)) * RANK_SCALE + length for start in range(len(keys))]
+    return keys, ranks, key_grams(' '.join(words))
+
+def _entry_segment(labels, kinds, label_keys):
+    """CSR keys, ranks and trigrams of entries, the trigrams numbered into their sorted vocabulary"""
+    entry_keys = [_label_keys(*entry) for entry in zip(labels, kinds, label_keys)]
+    grams = sorted({gram for _, _, entry_grams in entry_keys for gram in entry_grams})
+    gram_ids = {gram: i for i, gram in enumerate(grams)}
+    key_offsets = np.zeros(len(entry_keys) + 1, dtype=np.int64)
+    np.cumsum([len(keys) for keys, _, _ in entry_keys], out=key_offsets[1:])
+    gram_offsets = np.zeros(len(entry_keys) + 1, dtype=np.int64)
+    np.cumsum([len(entry_grams) for _, _, entry_grams in entry_keys], out=gram_offsets[1:])
+    return (
+        key_offsets,
+        [key for keys, _, _ in entry_keys for key in keys],
+        np.array([rank for _, ranks, _ in entry_keys for rank in ranks], dtype=np.int32),
+        grams,
+        gram_offsets,
+        np.array([gram_ids[gram] for _, _, entry_grams in entry_keys for gram in entry_grams], dtype=np.int32),
+    )
+
+def lookup_segment(compliances):
+    """One company type's regulations and obligations, as merged by build_lookup_index.
+
+    Regulations map normalized names to their first spelling and obligations map
+    IDs to their first row; the _entry_segment of the obligations follows.
+    """
+    regulations = {}
+    obligations = {}
+    obligation_keys = []
+    for row, compliance in enumerate(compliances):
+        obligation_id = compliance.get('obligation_id')
+        if isinstance(obligation_id, str) and obligation_id not in obligations:
+            key = normalize_key(obligation_id)
+            if key:
+                # An ID listed twice points at its first row
+                obligations[obligation_id] = row
+                obligation_keys.append(key)
+        name = compliance.get('regulation_name')
+        if isinstance(name, str):
+            key = normalize_key(name)
+            if key and key not in regulations:
+                regulations[key] = ' '.join(name.split())
+    return (regulations, obligations,
+            *_entry_segment(list(obligations), [OBLIGATION] * len(obligations), obligation_keys))
+
+def build_lookup_index(company_compliance_map, segments=None):
+    """Build the index from the company type -> compliances mapping.
+
+    segments, the lookup_segment of each company type in mapping order, are
+    computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [lookup_segment(company_compliance_map[ct]) for ct in company_types]
+    type_offsets = company_type_offsets(company_compliance_map)
+
+    # Regulations and obligations are numbered in order of first appearance and kept from that company type
+    regulations = {}
+    regulation_numbers = []
+    obligations = {}
+    obligation_rows = []
+    new_obligations = []
+    for i, (type_regulations, type_obligations, *_) in enumerate(segments):
+        for key, label in type_regulations.items():
+            regulation_numbers.append(regulations.setdefault(key, (len(regulations), label))[0])
+        first = len(obligations)
+        numbers = np.array([obligations.setdefault(key, len(obligations)) for key in type_obligations], dtype=np.int64)
+        new = np.flatnonzero(numbers >= first)
+        rows = np.fromiter(type_obligations.values(), dtype=np.int64, count=len(type_obligations))
+        obligation_rows.append(rows[new] + type_offsets[i])
+        new_obligations.append((new, numbers[new]))
+
+    # Entries: company types, then regulations, then obligations; the first two make one more segment
+    type_count, regulation_count = len(company_types), len(regulations)
+    named = type_count + regulation_count
+    regulation_labels = [label for _, label in regulations.values()]
+    entry_segments = [_entry_segment(
+        company_types + regulation_labels,
+        [COMPANY_TYPE] * type_count + [REGULATION] * regulation_count,
+        [normalize_key(company_type) for company_type in company_types] + list(regulations),
+    )]
+    selected = [(np.arange(named), np.arange(named))]
+    for segment, (new, numbers) in zip(segments, new_obligations):
+        entry_segments.append(segment[2:])
+        selected.append((new, named + numbers))
+    grams, gram_maps = merge_vocabularies([segment[3] for segment in entry_segments])
+
+    keys, key_entries, ranks, gram_ids, gram_entries = [], [], [], [], []
+    for (key_offsets, type_keys, type_ranks, _, gram_offsets, type_grams), gram_map, (local, entries) in zip(
+            entry_segments, gram_maps, selected):
+        gather, lengths = csr_gather(key_offsets, local)
+        keys.extend(type_keys[k] for k in gather.tolist())
+        key_entries.append(np.repeat(entries, lengths))
+        ranks.append(type_ranks[gather])
+        gather, lengths = csr_gather(gram_offsets, local)
+        gram_ids.append(gram_map[type_grams[gather]])
+        gram_entries.append(np.repeat(entries, lengths))
+
+    # Obligations come last and each segment's new ones are numbered in order, so keys are in entry order
+    key_entries = concatenate(key_entries, np.int64)
+    ranks = concatenate(ranks, np.int32)
+    split = int(np.searchsorted(key_entries, named))
+
+    # Each trigram's entries ascending
+    gram_ids = concatenate(gram_ids, np.int64)
+    gram_entries = concatenate(gram_entries, np.int64)
+    order = np.lexsort((gram_entries, gram_ids))
+    gram_offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(gram_ids, minlength=len(grams)), out=gram_offsets[1:])
+
+    regulation_numbers = np.array(regulation_numbers, dtype=np.int64)
+    regulation_types = np.repeat(np.arange(len(segments)), [len(segment[0]) for segment in segments])
+    # Segments are in company type order, so a stable sort keeps each regulation's types ascending
+    regulation_types = regulation_types[np.argsort(regulation_numbers, kind='stable')]
+    regulation_offsets = np.zeros(regulation_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(regulation_numbers, minlength=regulation_count), out=regulation_offsets[1:])
+
+    labels = company_types + regulation_labels + list(obligations)
+    encoded = [label.encode('utf-8') for label in labels]
+    label_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=label_offsets[1:])
+    label_data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    kinds = np.repeat(np.array([COMPANY_TYPE, REGULATION, OBLIGATION], dtype=np.int8),
+                      [type_count, regulation_count, len(obligations)])
+    targets = np.concatenate([np.arange(type_count), np.arange(regulation_count), *obligation_rows]).astype(np.int64)
+    return LookupIndex(
+        company_types, type_offsets, kinds, targets,
+        label_offsets, label_data, regulation_offsets, regulation_types.astype(np.int32),
+        _sorted_keys(keys[:split], key_entries[:split], ranks[:split]),
+        _sorted_keys(keys[split:], key_entries[split:], ranks[split:]),
+        np.array(grams, dtype=str), gram_offsets, gram_entries[order].astype(np.int32),
+    )
+
+def save_lookup_index(index, path=LOOKUP_INDEX_FILE):
+    """Save the labels, sorted keys and trigram postings"""
+    save_index(
+        path,
+        LOOKUP_INDEX_VERSION,
+        company_types=np.array(index.company_types, dtype=str),
+        type_offsets=index.type_offsets,
+        kinds=index.kinds,
+        targets=index.targets,
+        label_offsets=index.label_offsets,
+        label_data=index.label_data,
+        regulation_offsets=index.regulation_offsets,
+        regulation_types=index.regulation_types,
+        name_keys=index.names.keys,
+        name_entries=index.names.entries,
+        name_ranks=index.names.ranks,
+        id_keys=index.ids.keys,
+        id_entries=index.ids.entries,
+        id_ranks=index.ids.ranks,
+        grams=index.grams,
+        gram_offsets=index.gram_offsets,
+        gram_entries=index.gram_entries,
+    )
+
+def load_lookup_index(path=LOOKUP_INDEX_FILE, mmap=False):
+    """Load a saved lookup index, or None to rebuild it (see artifacts.load_index)"""
+    return load_index(path, LOOKUP_INDEX_VERSION, lambda data: LookupIndex(
+        data['company_types'].tolist(),
+        data['type_offsets'],
+        data['kinds'],
+        data['targets'],
+        data['label_offsets'],
+        data['label_data'],
+        data['regulation_offsets'],
+        data['regulation_types'],
+        _SortedKeys(data['name_keys'], data['name_entries'], data['name_ranks']),
+        _SortedKeys(data['id_keys'], data['id_entries'], data['id_ranks']),
+        data['grams'],
+        data['gram_offsets'],
+        data['gram_entries'],
+    ), mmap)
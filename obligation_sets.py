@@ -0,0 +1,122 @@
+"""
+Obligation Set Engine
+Precomputed per company type bitsets for union, intersection and diff queries
+"""
+
+import numpy as np
+
+from artifacts import company_type_offsets, concatenate, is_missing, load_index, save_index
+
+OBLIGATION_SETS_FILE = 'obligation_sets.npz'
+OBLIGATION_SETS_VERSION = 1
+
+def obligation_key(compliance):
+    """Content identity of an obligation: every field except its type-specific ID"""
+    return tuple(
+        None if is_missing(value) else value
+        for field, value in compliance.items()
+        if field != 'obligation_id'
+    )
+
+class ObligationSets:
+    """One packed bitset per company type over obligation numbers.
+
+    Obligations with identical content are given the same number, wherever they
+    appear. first_rows maps each number to the global model row of its first
+    occurrence and row_obligations maps every global row to its number.
+    """
+
+    def __init__(self, company_types, bitsets, first_rows, row_obligations):
+        self.company_types = list(company_types)
+        self.bitsets = bitsets
+        self.first_rows = first_rows
+        self.row_obligations = row_obligations
+        self.obligation_count = len(first_rows)
+        self._type_index = {ct: i for i, ct in enumerate(self.company_types)}
+
+    def _bits(self, company_types):
+        """Packed bitsets of the given company types; raises KeyError for unknown types"""
+        return self.bitsets[[self._type_index[ct] for ct in company_types]]
+
+    def _numbers(self, packed):
+        """Obligation numbers set in a packed bitset"""
+        return np.flatnonzero(np.unpackbits(packed, count=self.obligation_count))
+
+    def union(self, company_types):
+        """Deduplicated obligations of any of the company types"""
+        return self._numbers(np.bitwise_or.reduce(self._bits(company_types), axis=0))
+
+    def intersection(self, company_types):
+        """Obligations shared by all of the company types"""
+        return self._numbers(np.bitwise_and.reduce(self._bits(company_types), axis=0))
+
+    def diff(self, company_types):
+        """Per company type, the obligations none of the other selected types have"""
+        bits = self._bits(company_types)
+        result = {}
+        for i, company_type in enumerate(company_types):
+            others = np.bitwise_or.reduce(np.delete(bits, i, axis=0), axis=0, initial=0)
+            result[company_type] = self._numbers(bits[i] & ~others)
+        return result
+
+    def obligations_for_rows(self, rows):
+        """Obligation numbers of global model rows"""
+        return np.unique(self.row_obligations[np.asarray(rows, dtype=np.int64)])
+
+def obligation_segment(compliances):
+    """One company type's distinct obligation keys in order of first appearance and each row's number among them"""
+    keys = {}
+    rows = [keys.setdefault(obligation_key(compliance), len(keys)) for compliance in compliances]
+    return list(keys), np.array(rows, dtype=np.int64)
+
+def build_obligation_sets(company_compliance_map, segments=None):
+    """Number distinct obligations and build each company type's bitset.
+
+    segments, the obligation_segment of each company type in mapping order, are
+    computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [obligation_segment(company_compliance_map[ct]) for ct in company_types]
+    type_offsets = company_type_offsets(company_compliance_map)
+    numbers = {}
+    first_rows = []
+    row_obligations = []
+    type_numbers = []
+    for i, (keys, rows) in enumerate(segments):
+        first = len(numbers)
+        current = np.array([numbers.setdefault(key, len(numbers)) for key in keys], dtype=np.int64)
+        new = np.flatnonzero(current >= first)
+        first_rows.append(np.unique(rows, return_index=True)[1][new] + type_offsets[i])
+        row_obligations.append(current[rows])
+        type_numbers.append(current)
+
+    membership = np.zeros((len(company_types), len(numbers)), dtype=bool)
+    for i, current in enumerate(type_numbers):
+        membership[i, current] = True
+    return ObligationSets(
+        company_types,
+        np.packbits(membership, axis=1),
+        concatenate(first_rows, np.int64),
+        concatenate(row_obligations, np.int64),
+    )
+
+def save_obligation_sets(sets, path=OBLIGATION_SETS_FILE):
+    """Save the packed bitsets and the obligation numbering"""
+    save_index(
+        path,
+        OBLIGATION_SETS_VERSION,
+        company_types=np.array(sets.company_types, dtype=str),
+        bitsets=sets.bitsets,
+        first_rows=sets.first_rows,
+        row_obligations=sets.row_obligations,
+    )
+
+def load_obligation_sets(path=OBLIGATION_SETS_FILE, mmap=False):
+    """Load saved bitsets, or None to rebuild them (see artifacts.load_index)"""
+    return load_index(path, OBLIGATION_SETS_VERSION, lambda data: ObligationSets(
+        data['company_types'].tolist(),
+        data['bitsets'],
+        data['first_rows'],
+        data['row_obligations'],
+    ), mmap)
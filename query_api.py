@@ -0,0 +1,400 @@
+"""
+Compliance Query API
+Lookup, filter, search and metadata over the trained artifacts, independent of Streamlit
+"""
+
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+from applicability import APPLICABILITY_FILE, load_applicability_index, normalize_state, obligation_states
+from artifacts import (
+    RowRecords, StaleArtifactError, artifact_version, column_for_rows, load_company_metadata, load_company_types,
+    open_model, records_for_rows, wait_for_version
+)
+from facet_index import FACET_FIELDS, FACET_INDEX_FILE, load_facet_index
+from obligation_sets import OBLIGATION_SETS_FILE, load_obligation_sets
+from search_index import SEARCH_INDEX_FILE, load_search_index
+from impact_index import IMPACT_INDEX_FILE, load_impact_index
+from instrumentation import timer
+from lookup_index import LOOKUP_INDEX_FILE, load_lookup_index
+from similarity import SIMILARITY_FILE, load_similarity_index
+
+# Company type embedded in an obligation ID, e.g. MOP-BIO-001 -> BIO
+OBLIGATION_ID_PATTERN = re.compile(r'MOP-([A-Z0-9]+)-')
+
+def search_compliances(model, search_index, search_term, company_type=None, limit=None, lazy=False):
+    """Compliances matching the search term, ranked, within one company type or across all.
+
+    With lazy=True the indexed results are returned as a RowRecords sequence that
+    decodes records only when they are accessed.
+    """
+    if search_index is None:
+        # Artifacts built before the search index existed: plain substring scan
+        term = search_term.lower()
+        company_types = [company_type] if company_type else list(model)
+        matches = [
+            c for ct in company_types for c in model[ct]
+            if term in c['title'].lower() or term in c['description'].lower()
+        ]
+        return matches[:limit] if limit is not None else matches
+
+    rows, _ = search_index.search(search_term, company_type=company_type, limit=limit)
+    if lazy:
+        return RowRecords(model, rows)
+    return records_for_rows(model, rows)
+
+def to_jsonable(value):
+    """Copy of a record, list or metadata dict with missing (NaN) values replaced by None"""
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+class _LazyArtifact:
+    """ComplianceQuery attribute loaded from the artifact directory on first access.
+
+    The loaded value is stored in the instance __dict__, which takes precedence
+    over this descriptor, so later accesses are plain attribute lookups. A value
+    that may come from a build published after the query opened its own raises
+    StaleArtifactError instead of being kept.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, query, owner=None):
+        if query is None:
+            return self
+        with query._load_lock:
+            if self.name not in query.__dict__:
+                with timer(f'load_{self.name}'):
+                    value = self.loader(query.artifact_dir, query.shared)
+                query.check_version(self.name)
+                query.__dict__[self.name] = value
+        return query.__dict__[self.name]
+
+class ComplianceQuery:
+    """Query interface over one loaded set of model artifacts.
+
+    With lazy=True only the company types are read up front; the model,
+    metadata and indexes are loaded the first time they are used, and the
+    columnar model decodes each company type's records on first access.
+    With shared=True the indexes and metadata are memory-mapped read-only
+    rather than read into memory, so worker processes serving the same
+    artifact directory share one copy of them in the page cache.
+    """
+
+    # Loaders take (artifact_dir, shared); the columnar model is memory-mapped either way
+    model = _LazyArtifact(lambda d, shared: open_model(d))
+    metadata = _LazyArtifact(load_company_metadata)
+    search_index = _LazyArtifact(lambda d, shared: load_search_index(os.path.join(d, SEARCH_INDEX_FILE), shared))
+    facets = _LazyArtifact(lambda d, shared: load_facet_index(os.path.join(d, FACET_INDEX_FILE), shared))
+    obligation_sets = _LazyArtifact(
+        lambda d, shared: load_obligation_sets(os.path.join(d, OBLIGATION_SETS_FILE), shared)
+    )
+    similarity = _LazyArtifact(lambda d, shared: load_similarity_index(os.path.join(d, SIMILARITY_FILE), shared))
+    applicability = _LazyArtifact(
+        lambda d, shared: load_applicability_index(os.path.join(d, APPLICABILITY_FILE), shared)
+    )
+    lookup_index = _LazyArtifact(lambda d, shared: load_lookup_index(os.path.join(d, LOOKUP_INDEX_FILE), shared))
+    impact_index = _LazyArtifact(lambda d, shared: load_impact_index(os.path.join(d, IMPACT_INDEX_FILE), shared))
+
+    # Artifact file of each optional index, for has_artifact()
+    INDEX_FILES = {
+        'search_index': SEARCH_INDEX_FILE,
+        'facets': FACET_INDEX_FILE,
+        'obligation_sets': OBLIGATION_SETS_FILE,
+        'similarity': SIMILARITY_FILE,
+        'applicability': APPLICABILITY_FILE,
+        'lookup_index': LOOKUP_INDEX_FILE,
+        'impact_index': IMPACT_INDEX_FILE,
+    }
+
+    def __init__(self, artifact_dir='.', lazy=False, shared=False):
+        self.artifact_dir = artifact_dir
+        self.shared = shared
+        self._load_lock = threading.RLock()
+        self.version = wait_for_version(artifact_dir)
+        self.company_types = load_company_types(artifact_dir)
+        self.check_version('company_types')
+        if not lazy:
+            self.load_all()
+
+    def check_version(self, loaded):
+        """Raise StaleArtifactError if the directory no longer holds this query's build.
+
+        Publishing marks the manifest before it replaces any file, so an unchanged
+        version after a load means what was just loaded belongs to self.version.
+        """
+        current = artifact_version(self.artifact_dir)
+        if current != self.version:
+            raise StaleArtifactError(
+                f"Artifacts in {self.artifact_dir} were replaced while loading {loaded} "
+                f"(build {self.version}, now {current or 'publishing'}); open them again"
+            )
+
+    def load_all(self):
+        """Load every artifact not loaded yet"""
+        for name in ('model', 'metadata', *self.INDEX_FILES):
+            getattr(self, name)
+        return self
+
+    def has_artifact(self, name):
+        """Whether an optional index is available, without loading it if it hasn't been"""
+        if name in self.__dict__:
+            return self.__dict__[name] is not None
+        return os.path.exists(os.path.join(self.artifact_dir, self.INDEX_FILES[name]))
+
+    def lookup(self, company_type):
+        """All compliances of a company type; raises KeyError for unknown types"""
+        if company_type not in self.model:
+            raise KeyError(company_type)
+        return self.model[company_type]
+
+    def filter(self, company_type, **criteria):
+        """Compliances of a company type whose fields equal the given values.
+
+        A criterion may be a single value or a list/tuple/set of accepted values.
+        """
+        accepted = {
+            field: set(value) if isinstance(value, (list, tuple, set)) else {value}
+            for field, value in criteria.items()
+        }
+        if self.facets is not None and criteria and all(field in FACET_FIELDS for field in accepted):
+            # Intersect the facet posting lists instead of scanning the type's records
+            if company_type not in self.model:
+                raise KeyError(company_type)
+            rows = self.facets.filter(accepted, self.facets.row_range(company_type))
+            return records_for_rows(self.model, rows)
+        return [
+            c for c in self.lookup(company_type)
+            if all(c.get(field) in values for field, values in accepted.items())
+        ]
+
+    def search(self, query, company_type=None, limit=None):
+        """Ranked compliances matching a keyword query"""
+        if company_type is not None and company_type not in self.model:
+            raise KeyError(company_type)
+        return search_compliances(self.model, self.search_index, query, company_type, limit)
+
+    def facet_counts(self, company_type=None, **selections):
+        """Live {field: {value: count}} of the facet fields, for one company type or all.
+
+        Each field is counted under the other fields' selections; a selection may
+        be a single value or a list of accepted values.
+        """
+        if self.facets is None:
+            raise RuntimeError("Facet index is missing; retrain with train_model.py")
+        selections = {
+            field: list(value) if isinstance(value, (list, tuple, set)) else [value]
+            for field, value in selections.items()
+        }
+        unknown = set(selections) - set(FACET_FIELDS)
+        if unknown:
+            raise ValueError(f"Not a facet field: {', '.join(sorted(unknown))}")
+        row_range = None
+        if company_type is not None:
+            if company_type not in self.model:
+                raise KeyError(company_type)
+            row_range = self.facets.row_range(company_type)
+        return self.facets.counts(selections, row_range)
+
+    def get_metadata(self, company_type):
+        """Metadata of a company type; raises KeyError for unknown types"""
+        return self.metadata[company_type]
+
+    def combine(self, company_types, mode='union', search_term=None):
+        """Deduplicated compliances of several company types combined by set operation.
+
+        mode is 'union', 'intersection' or 'diff'; 'diff' returns a dict of the
+        compliances unique to each type. With a search term, only obligations
+        matching it are kept.
+        """
+        sets = self.obligation_sets
+        if sets is None:
+            raise RuntimeError("Obligation sets are missing; retrain with train_model.py")
+        company_types = list(dict.fromkeys(company_types))
+        if not company_types:
+            raise ValueError("At least one company type is required")
+        for company_type in company_types:
+            self.lookup(company_type)
+
+        matched = None
+        if search_term and self.search_index is not None:
+            rows, _ = self.search_index.search(search_term)
+            matched = sets.obligations_for_rows(rows)
+
+        def records(numbers):
+            if matched is not None:
+                numbers = numbers[np.isin(numbers, matched)]
+            found = records_for_rows(self.model, sets.first_rows[numbers])
+            if search_term and self.search_index is None:
+                term = search_term.lower()
+                found = [c for c in found if term in c['title'].lower() or term in c['description'].lower()]
+            return found
+
+        if mode == 'union':
+            return records(sets.union(company_types))
+        if mode == 'intersection':
+            return records(sets.intersection(company_types))
+        if mode == 'diff':
+            return {ct: records(numbers) for ct, numbers in sets.diff(company_types).items()}
+        raise ValueError(f"Unknown combine mode: {mode}")
+
+    def applicable_rows(self, company_types, states):
+        """Global model rows of the obligations applicable to the company types in the given states.
+
+        Nationwide obligations always apply, state-level ones only in their states.
+        With several company types, obligations with identical content are listed
+        once, under the first of the types that has them.
+        """
+        index = self.applicability
+        if index is None:
+            raise RuntimeError("Applicability index is missing; retrain with train_model.py")
+        company_types = list(dict.fromkeys(company_types))
+        if not company_types:
+            raise ValueError("At least one company type is required")
+        if len(company_types) == 1 or self.obligation_sets is None:
+            return index.applicable_rows(company_types, states)
+        rows = np.concatenate([index.applicable_rows([ct], states) for ct in company_types])
+        _, first = np.unique(self.obligation_sets.row_obligations[rows], return_index=True)
+        return rows[np.sort(first)]
+
+    def applicable(self, company_types, states):
+        """Obligations of the company types that apply to a company operating in the given states"""
+        return records_for_rows(self.model, self.applicable_rows(company_types, states))
+
+    def _require_similarity(self):
+        """The similarity index, or an error if these artifacts were built without one"""
+        if self.similarity is None:
+            raise RuntimeError("Similarity index is missing; retrain with train_model.py")
+        return self.similarity
+
+    def typeahead(self, text, limit=10):
+        """Company types, regulations and obligation IDs matching partly typed text, typos tolerated.
+
+        Each match is {'kind', 'label', 'company_types', 'row', 'distance'}; 'row'
+        is the global model row of an obligation, distance the edits it took.
+        """
+        if self.lookup_index is None:
+            raise RuntimeError("Lookup index is missing; retrain with train_model.py")
+        return self.lookup_index.lookup(text, limit)
+
+    def find_row(self, obligation_id):
+        """Global model row of an obligation ID; raises KeyError if it doesn't exist"""
+        if self.lookup_index is not None:
+            return self.lookup_index.obligation_row(obligation_id)
+        similarity = self._require_similarity()
+        match = OBLIGATION_ID_PATTERN.match(obligation_id)
+        if match is None or match.group(1) not in self.model:
+            raise KeyError(obligation_id)
+        company_type = match.group(1)
+        for position, compliance in enumerate(self.lookup(company_type)):
+            if compliance['obligation_id'] == obligation_id:
+                return similarity.row_range(company_type)[0] + position
+        raise KeyError(obligation_id)
+
+    def _scored_records(self, rows, scores):
+        """Records at global rows, each with its similarity score"""
+        return [
+            dict(compliance, similarity=round(float(score), 4))
+            for compliance, score in zip(records_for_rows(self.model, rows), scores)
+        ]
+
+    def similar(self, obligation_id, limit=10):
+        """Obligations whose text is most similar to the given one, best first"""
+        rows, scores = self._require_similarity().similar_rows([self.find_row(obligation_id)], limit)[0]
+        return self._scored_records(rows, scores)
+
+    def similar_to_text(self, text, limit=10):
+        """Obligations whose text is most similar to a free-text query, best first"""
+        rows, scores = self._require_similarity().similar_to_texts([text], limit)[0]
+        return self._scored_records(rows, scores)
+
+    def predict_company_types(self, description, limit=5):
+        """Company types whose obligations best match a free-text company description"""
+        matches = self._require_similarity().predict_company_types([description], limit)[0]
+        return [{'company_type': ct, 'score': round(score, 4)} for ct, score in matches]
+
+    def impact_scope(self, kind, name):
+        """{company type: states} an amendment's obligations are limited to; None states means nationwide"""
+        index = self.impact_index
+        i = index.find(kind, name)
+        if i is None:
+            return {}
+        rows = index.rows(kind, i)
+        types = np.searchsorted(index.type_offsets, rows, side='right') - 1
+        scope = {}
+        for t, value in zip(types.tolist(), column_for_rows(self.model, 'state', rows)):
+            company_type = index.company_types[t]
+            states = obligation_states(value)
+            if states is None:
+                scope[company_type] = None
+            elif company_type not in scope:
+                scope[company_type] = set(states)
+            elif scope[company_type] is not None:
+                scope[company_type] |= states
+        return scope
+
+    def impact(self, regulations=(), authorities=(), entities=None):
+        """Company types (and entities) affected by amendments to regulations or issuing authorities.
+
+        Each name is answered from the impact index in one lookup. The report lists
+        one result per name (name None when no obligation has it) and the union of
+        affected company types. Given entity chunks as read by
+        batch_score.read_entities, it also counts the entities reached: those with
+        an affected company type in a state where one of the obligations applies.
+        """
+        index = self.impact_index
+        if index is None:
+            raise RuntimeError("Impact index is missing; retrain with train_model.py")
+        queries = [('regulation', name) for name in regulations] + [('authority', name) for name in authorities]
+        if not queries:
+            raise ValueError("At least one regulation or authority is required")
+        results = []
+        for kind, name in queries:
+            result = index.impact(kind, name) or {
+                'kind': kind, 'name': None, 'obligations': 0, 'distinct_obligations': 0, 'company_types': {},
+            }
+            results.append(dict(result, query=name))
+        affected = {ct for result in results for ct in result['company_types']}
+        report = {
+            'results': results,
+            'company_types': [ct for ct in index.company_types if ct in affected],
+        }
+        if entities is not None:
+            # Company type -> (result position, states its obligations there are limited to)
+            reach = {}
+            for k, result in enumerate(results):
+                if result['name'] is not None:
+                    for company_type, scope in self.impact_scope(result['kind'], result['name']).items():
+                        reach.setdefault(company_type, []).append((k, scope))
+            counts = [0] * len(results)
+            reached = read = 0
+            for chunk in entities:
+                for _, company_types, states in chunk:
+                    read += 1
+                    # No states given: the entity operates in every state
+                    states = {normalize_state(state) for state in states}
+                    hits = {
+                        k for company_type in company_types for k, scope in reach.get(company_type, ())
+                        if scope is None or not states or not scope.isdisjoint(states)
+                    }
+                    for k in hits:
+                        counts[k] += 1
+                    reached += bool(hits)
+            for result, count in zip(results, counts):
+                result['entities'] = count
+            report['entities'] = reached
+            report['entities_read'] = read
+        return report
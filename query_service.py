@@ -0,0 +1,353 @@
+"""
+Compliance Query Service
+Lightweight asyncio HTTP/1.1 JSON service over the compliance query API
+
+Endpoints:
+    GET  /health
+    GET  /metrics   (Prometheus text format; stage timings need COMPLIANCE_METRICS=1 or --metrics)
+    GET  /company-types
+    GET  /compliances/<company_type>?<field>=<value>&...
+    GET  /metadata/<company_type>
+    GET  /facets[/<company_type>][?<field>=<value>&...]
+    GET  /search?q=<query>[&company_type=<type>][&limit=<n>]
+    GET  /similar/<obligation_id>[?limit=<n>]
+    GET  /similar?q=<text>[&limit=<n>]
+    GET  /predict-types?q=<company description>[&limit=<n>]
+    GET  /applicable?company_types=<type>,<type>&states=<state>,<state>
+    GET  /typeahead?q=<partial type code, regulation name or obligation ID>[&limit=<n>]
+    GET  /impact?regulation=<name>[&regulation=<name>...][&authority=<name>...]
+    POST /batch   {"requests": [{"op": "lookup", "company_type": "BIO"}, ...]}
+
+Batch operations: company_types, lookup, metadata, facets, search, similar, predict_types, combine
+({"op": "combine", "company_types": [...], "mode": "union" | "intersection" | "diff"}), applicable
+({"op": "applicable", "company_types": [...], "states": [...]}), typeahead, impact
+({"op": "impact", "regulations": [...], "authorities": [...]}).
+
+Each worker runs the queries on a pool of --threads threads, so a slow request doesn't hold up
+the other connections' reads and writes. Query work in Python still shares one interpreter
+lock, so CPU-bound throughput scales with --workers: the artifacts are memory-mapped once and
+N forked worker processes accept connections on the same socket. Each worker has its own
+result cache and /metrics counters.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import signal
+import socket
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from instrumentation import count, registry, timer
+from query_api import ComplianceQuery, to_jsonable
+from result_cache import ResultCache
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH_SIZE = 1000
+# Threads per worker process running the queries off the event loop
+DEFAULT_QUERY_THREADS = 4
+
+# Results of these operations are cached per artifact version and parameters
+CACHED_OPERATIONS = {
+    'lookup', 'metadata', 'facets', 'search', 'similar', 'predict_types', 'combine', 'applicable', 'typeahead',
+    'impact'
+}
+result_cache = ResultCache()
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class QueryError(Exception):
+    """A request that can't be answered, with the HTTP status to report"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def require(params, name):
+    """A required request parameter"""
+    if params.get(name) is None:
+        raise QueryError(400, f"Missing parameter: {name}")
+    return params[name]
+
+def run_operation(query, op, params):
+    """Run one named operation and return its JSON-ready result"""
+    with timer(f'query_{op}'):
+        if op not in CACHED_OPERATIONS:
+            return _run_operation(query, op, params)
+        key = (op, json.dumps(params, sort_keys=True, default=str))
+        return result_cache.get_or_compute(query.version, key, lambda: _run_operation(query, op, params))
+
+def _run_operation(query, op, params):
+    try:
+        if op == 'company_types':
+            return query.company_types
+        if op == 'lookup':
+            company_type = require(params, 'company_type')
+            criteria = params.get('filters') or {}
+            return to_jsonable(query.filter(company_type, **criteria) if criteria else query.lookup(company_type))
+        if op == 'metadata':
+            return to_jsonable(query.get_metadata(require(params, 'company_type')))
+        if op == 'facets':
+            return query.facet_counts(params.get('company_type'), **(params.get('filters') or {}))
+        if op == 'search':
+            limit = params.get('limit')
+            return to_jsonable(query.search(
+                require(params, 'q'),
+                company_type=params.get('company_type'),
+                limit=int(limit) if limit is not None else None
+            ))
+        if op == 'similar':
+            limit = int(params.get('limit', 10))
+            if params.get('obligation_id') is not None:
+                try:
+                    return to_jsonable(query.similar(params['obligation_id'], limit))
+                except KeyError:
+                    raise QueryError(404, f"Unknown obligation: {params['obligation_id']}")
+            return to_jsonable(query.similar_to_text(require(params, 'q'), limit))
+        if op == 'predict_types':
+            return query.predict_company_types(require(params, 'q'), int(params.get('limit', 5)))
+        if op == 'combine':
+            combined = query.combine(require(params, 'company_types'), params.get('mode', 'union'), params.get('q'))
+            return to_jsonable(combined)
+        if op == 'applicable':
+            return to_jsonable(query.applicable(require(params, 'company_types'), params.get('states') or []))
+        if op == 'typeahead':
+            return query.typeahead(require(params, 'q'), int(params.get('limit', 10)))
+        if op == 'impact':
+            return query.impact(params.get('regulations') or [], params.get('authorities') or [])
+    except KeyError as e:
+        raise QueryError(404, f"Unknown company type: {e.args[0]}")
+    except (TypeError, ValueError) as e:
+        raise QueryError(400, str(e))
+    raise QueryError(400, f"Unknown operation: {op}")
+
+def handle_request(query, method, target, body):
+    """Route one HTTP request, returning (status, payload)"""
+    url = urlsplit(target)
+    parts = [unquote(p) for p in url.path.split('/') if p]
+    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    if method == 'POST' and parts == ['batch']:
+        try:
+            requests = json.loads(body or b'{}').get('requests', [])
+        except (ValueError, AttributeError):
+            raise QueryError(400, "Body must be a JSON object with a 'requests' list")
+        if not isinstance(requests, list) or len(requests) > MAX_BATCH_SIZE:
+            raise QueryError(400, f"'requests' must be a list of at most {MAX_BATCH_SIZE} items")
+        results = []
+        for item in requests:
+            try:
+                results.append({'status': 200, 'result': run_operation(query, item.get('op'), item)})
+            except QueryError as e:
+                results.append({'status': e.status, 'error': str(e)})
+            except AttributeError:
+                results.append({'status': 400, 'error': "Each request must be a JSON object"})
+        return 200, {'results': results}
+
+    if method != 'GET':
+        raise QueryError(405, f"{method} not supported for {url.path}")
+    if parts == ['health']:
+        return 200, {'status': 'ok', 'company_types': len(query.company_types), 'result_cache': result_cache.stats()}
+    if parts == ['metrics']:
+        return 200, registry.prometheus_text()
+    if parts == ['company-types']:
+        return 200, run_operation(query, 'company_types', params)
+    if len(parts) == 2 and parts[0] == 'compliances':
+        return 200, run_operation(query, 'lookup', {'company_type': parts[1], 'filters': params})
+    if len(parts) == 2 and parts[0] == 'metadata':
+        return 200, run_operation(query, 'metadata', {'company_type': parts[1]})
+    if parts and parts[0] == 'facets' and len(parts) <= 2:
+        return 200, run_operation(query, 'facets', {'company_type': parts[1] if len(parts) == 2 else None, 'filters': params})
+    if parts == ['search']:
+        return 200, run_operation(query, 'search', params)
+    if parts == ['similar']:
+        return 200, run_operation(query, 'similar', params)
+    if len(parts) == 2 and parts[0] == 'similar':
+        return 200, run_operation(query, 'similar', {**params, 'obligation_id': parts[1]})
+    if parts == ['typeahead']:
+        return 200, run_operation(query, 'typeahead', params)
+    if parts == ['impact']:
+        # Names may contain commas, so each one is a separate parameter
+        names = parse_qs(url.query)
+        return 200, run_operation(query, 'impact', {
+            'regulations': names.get('regulation', []), 'authorities': names.get('authority', [])
+        })
+    if parts == ['predict-types']:
+        return 200, run_operation(query, 'predict_types', params)
+    if parts == ['applicable']:
+        return 200, run_operation(query, 'applicable', {
+            name: [value for value in params[name].split(',') if value] if name in params else None
+            for name in ('company_types', 'states')
+        })
+    raise QueryError(404, f"No route for {url.path}")
+
+def encode_response(status, payload):
+    """(status, content type, body bytes) of a response payload"""
+    count(f'http_{status}')
+    if isinstance(payload, str):
+        return status, 'text/plain; version=0.0.4', payload.encode('utf-8')
+    return status, 'application/json', json.dumps(payload).encode('utf-8')
+
+def respond(query, method, target, body):
+    """Encoded response to one request; runs on a query thread"""
+    try:
+        status, payload = handle_request(query, method, target, body)
+    except QueryError as e:
+        status, payload = e.status, {'error': str(e)}
+    except Exception as e:
+        status, payload = 500, {'error': str(e)}
+    return encode_response(status, payload)
+
+async def serve_connection(query, reader, writer, executor=None):
+    """Serve requests on one connection until the client closes it or asks to.
+
+    Each request is answered on executor (the loop's default one if None), so the
+    event loop keeps serving other connections meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+            length = int(headers.get('content-length', 0) or 0)
+            if length > MAX_BODY_BYTES:
+                keep_alive = False
+                status, content_type, data = encode_response(413, {'error': "Request body too large"})
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, content_type, data = await loop.run_in_executor(
+                    executor, respond, query, method, target, body
+                )
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def run_server(query, host=None, port=None, sock=None, threads=DEFAULT_QUERY_THREADS):
+    """Serve on host and port, or on an already listening socket, until cancelled.
+
+    Queries run on a pool of threads started here, so forked workers each start their own.
+    """
+    with ThreadPoolExecutor(threads, thread_name_prefix='query') as executor:
+        server = await asyncio.start_server(
+            lambda r, w: serve_connection(query, r, w, executor), host, port, sock=sock
+        )
+        if sock is None:
+            print(f"✓ Serving {len(query.company_types)} company types on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def listen(host, port):
+    """Listening TCP socket the worker processes accept on"""
+    sock = socket.create_server((host, port))
+    sock.setblocking(False)
+    return sock
+
+def serve_workers(query, sock, workers, threads=DEFAULT_QUERY_THREADS):
+    """Fork workers serving the listening socket and wait for them; SIGTERM stops them all.
+
+    The artifacts are opened before forking, so the workers start serving at
+    once and share the memory-mapped indexes and the parent's loaded objects.
+    """
+    # Keep the collector from touching (and so copying) the parent's objects in every worker
+    gc.freeze()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                asyncio.run(run_server(query, sock=sock, threads=threads))
+            except KeyboardInterrupt:
+                pass
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    print(f"✓ Serving {len(query.company_types)} company types on http://{sock.getsockname()[0]}:"
+          f"{sock.getsockname()[1]} with {workers} workers")
+
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the whole process group; wait for the workers to wind down
+        stop(signal.SIGINT, None)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+def main(argv=None):
+    """Load the artifacts once and serve them"""
+    parser = argparse.ArgumentParser(description="Serve the compliance model over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8601)
+    parser.add_argument('--artifact-dir', default='.', help="Directory with the model artifacts")
+    parser.add_argument('--metrics', action='store_true', help="Time every operation for /metrics")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes sharing the listening socket and the artifacts (implies --shared)")
+    parser.add_argument('--threads', type=int, default=DEFAULT_QUERY_THREADS,
+                        help="Threads per worker running the queries off the event loop")
+    parser.add_argument('--shared', action='store_true',
+                        help="Memory-map the indexes and metadata read-only instead of loading them")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.workers > 1 and not hasattr(os, 'fork'):
+        parser.error("--workers needs a platform with fork()")
+    if args.metrics:
+        registry.enable()
+
+    start = time.perf_counter()
+    query = ComplianceQuery(args.artifact_dir, shared=args.shared or args.workers > 1)
+    print(f"✓ {'Mapped' if query.shared else 'Loaded'} artifacts in {(time.perf_counter() - start) * 1000:.1f} ms")
+    if args.workers > 1:
+        serve_workers(query, listen(args.host, args.port), args.workers, args.threads)
+        return
+    try:
+        asyncio.run(run_server(query, args.host, args.port, threads=args.threads))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
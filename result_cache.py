@@ -0,0 +1,110 @@
+"""
+Query Result Cache
+Bounded LRU cache of query results shared across sessions, keyed by artifact version
+"""
+
+import threading
+from collections import OrderedDict
+
+from instrumentation import count
+
+DEFAULT_MAX_ENTRIES = 256
+# Total size of the cached results, in records (or rows for lazy result sequences)
+DEFAULT_MAX_COST = 2_000_000
+# Superseded artifact versions remembered, so their late requests can't evict the newest version's entries
+RETIRED_VERSIONS = 64
+
+def result_cost(result):
+    """Approximate size of a result: records in a sequence, summed over a dict of sequences"""
+    if isinstance(result, dict):
+        return sum(result_cost(value) for value in result.values())
+    try:
+        return max(1, len(result))
+    except TypeError:
+        return 1
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by entry count and total result cost.
+
+    Keys combine the artifact version with the query parameters, so a rebuilt
+    model never serves stale results. The first lookup of a new version drops
+    the entries of the versions before it; sessions still on an older version
+    during a reload are computed without caching, so they don't evict the
+    newest version's entries.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_cost=DEFAULT_MAX_COST):
+        self.max_entries = max_entries
+        self.max_cost = max_cost
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._retired = OrderedDict()
+        self.cost = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, version, key, compute):
+        """Cached result of compute() for (version, key), computing and storing it on a miss.
+
+        compute runs outside the lock, so concurrent misses for the same key may
+        both compute; the last one stored wins.
+        """
+        cache_key = (version, key)
+        with self._lock:
+            if version != self._version and version not in self._retired:
+                self._drop_older_versions(version)
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                count('result_cache_hits')
+                return self._entries[cache_key][0]
+            self.misses += 1
+        count('result_cache_misses')
+
+        result = compute()
+        cost = result_cost(result)
+        if cost > self.max_cost:
+            return result
+        with self._lock:
+            if version != self._version:
+                # A retired version, or the artifacts changed while computing; don't keep an outdated result
+                return result
+            if cache_key in self._entries:
+                self.cost -= self._entries.pop(cache_key)[1]
+            self._entries[cache_key] = (result, cost)
+            self.cost += cost
+            while len(self._entries) > self.max_entries or self.cost > self.max_cost:
+                _, (_, evicted_cost) = self._entries.popitem(last=False)
+                self.cost -= evicted_cost
+                self.evictions += 1
+                count('result_cache_evictions')
+        return result
+
+    def _drop_older_versions(self, version):
+        """Make a version never looked up before the newest, retiring the current one and its entries"""
+        if self._version is not None:
+            self._retired[self._version] = None
+            if len(self._retired) > RETIRED_VERSIONS:
+                self._retired.popitem(last=False)
+        for cache_key in [k for k in self._entries if k[0] != version]:
+            self.cost -= self._entries.pop(cache_key)[1]
+        self._version = version
+
+    def clear(self):
+        """Drop every entry; counters are kept"""
+        with self._lock:
+            self._entries.clear()
+            self.cost = 0
+
+    def stats(self):
+        """Entry count, total cost and hit / miss / eviction counters"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'cost': self.cost,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,207 @@
+"""
+Compliance Search Index
+Inverted full-text index over the compliance model with token and prefix lookup
+"""
+
+import math
+import re
+
+import numpy as np
+
+from artifacts import (
+    CompanyTypeRows, company_type_offsets, concatenate, load_index, merge_vocabularies, save_index
+)
+
+SEARCH_INDEX_FILE = 'search_index.npz'
+SEARCH_INDEX_VERSION = 1
+
+# Indexed fields and the weight of a token occurrence in each
+SEARCH_FIELDS = {
+    'title': 3.0,
+    'regulation_name': 2.0,
+    'authority': 1.0,
+    'description': 1.0,
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """Lower-case alphanumeric tokens of a text"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class SearchIndex(CompanyTypeRows):
+    """Inverted index from tokens to weighted posting lists of global row positions.
+
+    Rows are numbered in the same order as the columnar model: company types in
+    mapping order, each type's compliances contiguous. The vocabulary is sorted,
+    so all tokens sharing a prefix occupy one contiguous run of postings.
+    """
+
+    def __init__(self, vocabulary, token_offsets, posting_rows, posting_scores, company_types, type_offsets):
+        super().__init__(company_types, type_offsets)
+        self.vocabulary = vocabulary
+        self.token_offsets = token_offsets
+        self.posting_rows = posting_rows
+        self.posting_scores = posting_scores
+
+    def _token_span(self, token, prefix):
+        """Range of vocabulary entries matched by a query token"""
+        lo = int(np.searchsorted(self.vocabulary, token, side='left'))
+        if prefix:
+            hi = int(np.searchsorted(self.vocabulary, token + '\uffff', side='left'))
+        else:
+            hi = lo + 1 if lo < len(self.vocabulary) and self.vocabulary[lo] == token else lo
+        return lo, hi
+
+    def _match(self, span, row_range=None, candidates=None):
+        """Sorted unique rows and summed scores for one vocabulary span.
+
+        When candidates (sorted rows) are given, the result may be limited to them.
+        """
+        lo, hi = span
+        first, last = self.token_offsets[lo], self.token_offsets[hi]
+        rows = self.posting_rows[first:last]
+        scores = self.posting_scores[first:last]
+        if hi - lo <= 1:
+            # Postings of a single token are already sorted and unique
+            if row_range is not None:
+                first, last = np.searchsorted(rows, row_range)
+                rows, scores = rows[first:last], scores[first:last]
+            return rows, scores
+
+        # Union of several tokens' postings: accumulate scores densely, no sort
+        start, stop = row_range if row_range is not None else (0, int(self.type_offsets[-1]))
+        if row_range is not None:
+            keep = (rows >= start) & (rows < stop)
+            rows, scores = rows[keep], scores[keep]
+        totals = np.bincount(rows - start, weights=scores, minlength=stop - start)
+        if candidates is not None:
+            hits = candidates[totals[candidates - start] > 0]
+        else:
+            hits = np.flatnonzero(totals) + start
+        return hits, totals[hits - start].astype(np.float32)
+
+    def search(self, query, company_type=None, limit=None):
+        """Rank rows matching every query token, the last one as a prefix.
+
+        Returns (rows, scores) sorted by descending score, restricted to one
+        company type when given.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        row_range = self.row_range(company_type) if company_type is not None else None
+        spans = [self._token_span(token, prefix=(i == len(tokens) - 1)) for i, token in enumerate(tokens)]
+        # Intersect the shortest posting lists first to keep candidate sets small
+        spans.sort(key=lambda span: self.token_offsets[span[1]] - self.token_offsets[span[0]])
+
+        rows = scores = None
+        for span in spans:
+            token_rows, token_scores = self._match(span, row_range, rows)
+            if rows is None:
+                rows, scores = token_rows, token_scores
+            else:
+                rows, left, right = np.intersect1d(rows, token_rows, assume_unique=True, return_indices=True)
+                scores = scores[left] + token_scores[right]
+            if len(rows) == 0:
+                break
+
+        if limit is not None and limit < len(rows):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            order = top[np.lexsort((rows[top], -scores[top]))]
+        else:
+            # Rows are ascending, so a stable sort keeps ties in model order
+            order = np.argsort(-scores, kind='stable')
+        return rows[order].astype(np.int64), scores[order]
+
+    def locate(self, rows):
+        """(company_type, position within type) for each global row"""
+        type_ids = np.searchsorted(self.type_offsets, rows, side='right') - 1
+        return [
+            (self.company_types[t], int(row - self.type_offsets[t]))
+            for t, row in zip(type_ids.tolist(), np.asarray(rows).tolist())
+        ]
+
+def search_segment(compliances):
+    """One company type's weighted tokens: its sorted vocabulary and CSR (token, weight) postings per row"""
+    row_weights = []
+    for compliance in compliances:
+        weights = {}
+        for field, weight in SEARCH_FIELDS.items():
+            value = compliance.get(field)
+            if not isinstance(value, str):
+                continue
+            for token in tokenize(value):
+                weights[token] = weights.get(token, 0.0) + weight
+        row_weights.append(weights)
+    vocabulary = sorted({token for weights in row_weights for token in weights})
+    token_ids = {token: i for i, token in enumerate(vocabulary)}
+    row_offsets = np.zeros(len(row_weights) + 1, dtype=np.int64)
+    np.cumsum([len(weights) for weights in row_weights], out=row_offsets[1:])
+    return (
+        vocabulary,
+        row_offsets,
+        np.array([token_ids[token] for weights in row_weights for token in weights], dtype=np.int32),
+        # Sums of the field weights, exact in float32
+        np.array([weight for weights in row_weights for weight in weights.values()], dtype=np.float32),
+    )
+
+def build_search_index(company_compliance_map, segments=None):
+    """Build the inverted index from the company type -> compliances mapping.
+
+    segments, the search_segment of each company type in mapping order, are
+    computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [search_segment(company_compliance_map[ct]) for ct in company_types]
+    type_offsets = company_type_offsets(company_compliance_map)
+    vocabulary, token_maps = merge_vocabularies([segment[0] for segment in segments])
+    tokens = concatenate([token_maps[i][segment[2]] for i, segment in enumerate(segments)], np.int64)
+    rows = concatenate([
+        np.repeat(np.arange(type_offsets[i], type_offsets[i + 1], dtype=np.int32), np.diff(segment[1]))
+        for i, segment in enumerate(segments)
+    ], np.int32)
+    weights = concatenate([segment[3] for segment in segments], np.float64)
+
+    # Segments are in row order, so a stable sort by token keeps each token's rows ascending
+    order = np.argsort(tokens, kind='stable')
+    counts = np.bincount(tokens, minlength=len(vocabulary))
+    token_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(counts, out=token_offsets[1:])
+    total_rows = int(type_offsets[-1])
+    idf = np.array([math.log(1 + total_rows / count) for count in counts.tolist()], dtype=np.float64)
+
+    return SearchIndex(
+        np.array(vocabulary, dtype=str),
+        token_offsets,
+        rows[order],
+        (weights[order] * idf[tokens[order]]).astype(np.float32),
+        company_types,
+        type_offsets,
+    )
+
+def save_search_index(index, path=SEARCH_INDEX_FILE):
+    """Save the vocabulary with its weighted posting lists"""
+    save_index(
+        path,
+        SEARCH_INDEX_VERSION,
+        vocabulary=index.vocabulary,
+        token_offsets=index.token_offsets,
+        posting_rows=index.posting_rows,
+        posting_scores=index.posting_scores,
+        company_types=np.array(index.company_types, dtype=str),
+        type_offsets=index.type_offsets,
+    )
+
+def load_search_index(path=SEARCH_INDEX_FILE, mmap=False):
+    """Load a saved inverted index, or None to rebuild it (see artifacts.load_index)"""
+    return load_index(path, SEARCH_INDEX_VERSION, lambda data: SearchIndex(
+        data['vocabulary'],
+        data['token_offsets'],
+        data['posting_rows'],
+        data['posting_scores'],
+        data['company_types'].tolist(),
+        data['type_offsets'],
+    ), mmap)
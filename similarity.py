@@ -0,0 +1,313 @@
+"""
+Compliance Similarity Engine
+TF-IDF vectors over the compliance text for similar obligation and company type matching
+"""
+
+import hashlib
+
+import numpy as np
+
+from artifacts import (
+    CompanyTypeRows, company_type_offsets, concatenate, csr_gather, load_index, merge_vocabularies, save_index
+)
+from search_index import tokenize
+
+SIMILARITY_FILE = 'similarity.npz'
+SIMILARITY_VERSION = 1
+
+# Fields joined, in order, into an obligation's text; the one definition of it
+SIMILARITY_TEXT_FIELDS = ['title', 'description', 'regulation_name', 'regulation_type']
+
+# Bytes of the digest identical texts are recognized by across company types
+TEXT_DIGEST_SIZE = 16
+
+# Upper bound on queries x documents scored in one batched product
+MAX_SCORE_CELLS = 4_000_000
+
+def compliance_text(compliance):
+    """The text of a compliance: title | description | regulation name | type"""
+    return ' | '.join(
+        value if isinstance(value, str) else ''
+        for value in (compliance.get(field) for field in SIMILARITY_TEXT_FIELDS)
+    )
+
+def _transpose(offsets, columns, weights, column_count):
+    """Column-major (postings) copy of a CSR matrix: (offsets, row ids, weights)"""
+    rows = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+    order = np.argsort(columns, kind='stable')
+    column_offsets = np.zeros(column_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(columns, minlength=column_count), out=column_offsets[1:])
+    return column_offsets, rows[order], weights[order]
+
+def _normalize(offsets, weights):
+    """L2-normalize each CSR row in place"""
+    lengths = np.diff(offsets)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=len(lengths)))
+    norms[norms == 0] = 1.0
+    weights /= norms[rows].astype(weights.dtype)
+    return weights
+
+class SimilarityIndex(CompanyTypeRows):
+    """L2-normalized TF-IDF vectors of the distinct obligation texts and of each company type.
+
+    Identical texts share one document; row_documents maps every global model row
+    to its document and document_rows maps each document to its first row. A
+    company type's vector is the normalized sum of its rows' vectors. Both
+    matrices are kept as term postings, so scoring a batch of sparse queries is
+    one gather plus one bincount. The postings are transposed on construction
+    unless given, as they are when loaded from a file that stores them.
+    """
+
+    def __init__(self, vocabulary, idf, document_offsets, document_terms, document_weights,
+                 type_term_offsets, type_terms, type_weights, row_documents, document_rows,
+                 company_types, type_offsets, document_postings=None, type_postings=None):
+        super().__init__(company_types, type_offsets)
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.document_offsets = document_offsets
+        self.document_terms = document_terms
+        self.document_weights = document_weights
+        self.type_term_offsets = type_term_offsets
+        self.type_terms = type_terms
+        self.type_weights = type_weights
+        self.row_documents = row_documents
+        self.document_rows = document_rows
+        self._term_ids = {token: i for i, token in enumerate(vocabulary.tolist())}
+        if document_postings is None:
+            document_postings = _transpose(document_offsets, document_terms, document_weights, len(vocabulary))
+        if type_postings is None:
+            type_postings = _transpose(type_term_offsets, type_terms, type_weights, len(vocabulary))
+        self._document_postings = document_postings
+        self._type_postings = type_postings
+
+    def vectorize(self, texts):
+        """Sparse TF-IDF query vectors (offsets, terms, weights) of free texts; unknown words are ignored"""
+        offsets = [0]
+        terms = []
+        counts = []
+        for text in texts:
+            text_counts = {}
+            for token in tokenize(text):
+                term = self._term_ids.get(token)
+                if term is not None:
+                    text_counts[term] = text_counts.get(term, 0) + 1
+            terms.extend(sorted(text_counts))
+            counts.extend(text_counts[term] for term in sorted(text_counts))
+            offsets.append(len(terms))
+        offsets = np.array(offsets, dtype=np.int64)
+        terms = np.array(terms, dtype=np.int32)
+        weights = ((1 + np.log(np.array(counts, dtype=np.float64))) * self.idf[terms]).astype(np.float32)
+        return offsets, terms, _normalize(offsets, weights)
+
+    def _document_vectors(self, documents):
+        """CSR rows of the given documents"""
+        documents = np.asarray(documents, dtype=np.int64)
+        starts = self.document_offsets[documents]
+        lengths = self.document_offsets[documents + 1] - starts
+        offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return offsets, self.document_terms[gather], self.document_weights[gather]
+
+    def _top_k(self, postings, target_count, queries, limit, exclude=None):
+        """Cosine top-k targets for each query vector, as a list of (targets, scores).
+
+        Scores are computed for a batch of queries at a time as one sparse-dense
+        product; exclude optionally gives one target per query to leave out.
+        """
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        offsets, terms, weights = queries
+        term_offsets, posting_targets, posting_weights = postings
+        query_count = len(offsets) - 1
+        batch = max(1, MAX_SCORE_CELLS // max(target_count, 1))
+        results = []
+        for first in range(0, query_count, batch):
+            last = min(first + batch, query_count)
+            lo, hi = offsets[first], offsets[last]
+            query_ids = np.repeat(np.arange(last - first), np.diff(offsets[first:last + 1]))
+            starts = term_offsets[terms[lo:hi]]
+            lengths = term_offsets[terms[lo:hi] + 1] - starts
+            ends = np.cumsum(lengths)
+            gather = np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+            cells = posting_targets[gather] + np.repeat(query_ids * target_count, lengths)
+            products = posting_weights[gather] * np.repeat(weights[lo:hi], lengths)
+            scores = np.bincount(cells, weights=products, minlength=(last - first) * target_count)
+            scores = scores.reshape(last - first, target_count)
+            if exclude is not None:
+                scores[np.arange(last - first), exclude[first:last]] = 0.0
+
+            k = min(limit, target_count)
+            if k < target_count:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(target_count), (last - first, 1))
+            for row_scores, candidates in zip(scores, top):
+                order = candidates[np.lexsort((candidates, -row_scores[candidates]))]
+                order = order[row_scores[order] > 0]
+                results.append((order, row_scores[order].astype(np.float32)))
+        return results
+
+    def similar_rows(self, rows, limit=10):
+        """For each global row, the first rows of the most similar other obligation texts with scores"""
+        documents = self.row_documents[np.asarray(rows, dtype=np.int64)]
+        queries = self._document_vectors(documents)
+        results = self._top_k(self._document_postings, len(self.document_rows), queries, limit, exclude=documents)
+        return [(self.document_rows[docs].astype(np.int64), scores) for docs, scores in results]
+
+    def similar_to_texts(self, texts, limit=10):
+        """For each free text, the first rows of the most similar obligation texts with scores"""
+        results = self._top_k(self._document_postings, len(self.document_rows), self.vectorize(texts), limit)
+        return [(self.document_rows[docs].astype(np.int64), scores) for docs, scores in results]
+
+    def predict_company_types(self, texts, limit=5):
+        """For each free-text company description, the best matching company types with scores"""
+        results = self._top_k(self._type_postings, len(self.company_types), self.vectorize(texts), limit)
+        return [
+            [(self.company_types[t], float(score)) for t, score in zip(types.tolist(), scores.tolist())]
+            for types, scores in results
+        ]
+
+def similarity_segment(compliances):
+    """One company type's distinct texts with their CSR term counts, as merged by build_similarity_index.
+
+    Texts are given by digest, with the text number of each row; terms are
+    numbered into the type's sorted vocabulary.
+    """
+    texts = {}
+    row_texts = [texts.setdefault(compliance_text(compliance), len(texts)) for compliance in compliances]
+    token_counts = []
+    for text in texts:
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        token_counts.append(counts)
+    vocabulary = sorted({token for counts in token_counts for token in counts})
+    term_ids = {token: i for i, token in enumerate(vocabulary)}
+
+    offsets = np.zeros(len(token_counts) + 1, dtype=np.int64)
+    np.cumsum([len(counts) for counts in token_counts], out=offsets[1:])
+    return (
+        [hashlib.blake2b(text.encode('utf-8'), digest_size=TEXT_DIGEST_SIZE).digest() for text in texts],
+        np.array(row_texts, dtype=np.int64),
+        vocabulary,
+        offsets,
+        np.array([term_ids[token] for counts in token_counts for token in sorted(counts)], dtype=np.int32),
+        np.array([counts[token] for counts in token_counts for token in sorted(counts)], dtype=np.int32),
+    )
+
+def build_similarity_index(company_compliance_map, segments=None):
+    """Build TF-IDF document and company type vectors from the company type -> compliances mapping.
+
+    segments, the similarity_segment of each company type in mapping order, are
+    computed here when not given.
+    """
+    company_types = list(company_compliance_map)
+    if segments is None:
+        segments = [similarity_segment(company_compliance_map[ct]) for ct in company_types]
+    type_offsets = company_type_offsets(company_compliance_map)
+    vocabulary, term_maps = merge_vocabularies([segment[2] for segment in segments])
+
+    # Texts are numbered globally in order of first appearance; each is kept from its first company type
+    documents = {}
+    document_rows = []
+    row_documents = []
+    document_lengths = []
+    document_terms = []
+    term_frequencies = []
+    for i, (digests, row_texts, _, offsets, terms, counts) in enumerate(segments):
+        first = len(documents)
+        numbers = np.array([documents.setdefault(digest, len(documents)) for digest in digests], dtype=np.int64)
+        row_documents.append(numbers[row_texts])
+        new = np.flatnonzero(numbers >= first)
+        first_rows = np.unique(row_texts, return_index=True)[1]
+        document_rows.append(first_rows[new] + type_offsets[i])
+        gather, lengths = csr_gather(offsets, new)
+        document_lengths.append(lengths)
+        # The renumbering keeps term order, so each text's terms stay sorted
+        document_terms.append(term_maps[i][terms[gather]])
+        term_frequencies.append(counts[gather])
+
+    document_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    np.cumsum(concatenate(document_lengths, np.int64), out=document_offsets[1:])
+    document_terms = concatenate(document_terms, np.int32)
+    term_frequencies = concatenate(term_frequencies, np.float64)
+    # Smoothed IDF over distinct texts and sublinear term frequency
+    document_frequency = np.bincount(document_terms, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    document_weights = ((1 + np.log(term_frequencies)) * idf[document_terms]).astype(np.float32)
+    _normalize(document_offsets, document_weights)
+
+    row_documents = concatenate(row_documents, np.int32)
+    type_term_offsets = [0]
+    type_terms = []
+    type_weights = []
+    for i in range(len(company_types)):
+        gather, _ = csr_gather(document_offsets, row_documents[type_offsets[i]:type_offsets[i + 1]])
+        terms, inverse = np.unique(document_terms[gather], return_inverse=True)
+        type_terms.append(terms)
+        type_weights.append(np.bincount(inverse, weights=document_weights[gather]))
+        type_term_offsets.append(type_term_offsets[-1] + len(terms))
+    type_term_offsets = np.array(type_term_offsets, dtype=np.int64)
+    type_weights = concatenate(type_weights, np.float32)
+    type_terms = concatenate(type_terms, np.int32)
+    _normalize(type_term_offsets, type_weights)
+
+    return SimilarityIndex(
+        np.array(vocabulary, dtype=str),
+        idf.astype(np.float32),
+        document_offsets,
+        document_terms,
+        document_weights,
+        type_term_offsets,
+        type_terms,
+        type_weights,
+        row_documents,
+        concatenate(document_rows, np.int64),
+        company_types,
+        type_offsets,
+    )
+
+def save_similarity_index(index, path=SIMILARITY_FILE):
+    """Save the document and company type vectors with their term postings"""
+    save_index(
+        path,
+        SIMILARITY_VERSION,
+        vocabulary=index.vocabulary,
+        idf=index.idf,
+        document_offsets=index.document_offsets,
+        document_terms=index.document_terms,
+        document_weights=index.document_weights,
+        type_term_offsets=index.type_term_offsets,
+        type_terms=index.type_terms,
+        type_weights=index.type_weights,
+        row_documents=index.row_documents,
+        document_rows=index.document_rows,
+        company_types=np.array(index.company_types, dtype=str),
+        type_offsets=index.type_offsets,
+        **{f'document_postings.{i}': array for i, array in enumerate(index._document_postings)},
+        **{f'type_postings.{i}': array for i, array in enumerate(index._type_postings)},
+    )
+
+def load_similarity_index(path=SIMILARITY_FILE, mmap=False):
+    """Load saved TF-IDF vectors, or None to rebuild them (see artifacts.load_index)"""
+    return load_index(path, SIMILARITY_VERSION, lambda data: SimilarityIndex(
+        data['vocabulary'],
+        data['idf'],
+        data['document_offsets'],
+        data['document_terms'],
+        data['document_weights'],
+        data['type_term_offsets'],
+        data['type_terms'],
+        data['type_weights'],
+        data['row_documents'],
+        data['document_rows'],
+        data['company_types'].tolist(),
+        data['type_offsets'],
+        # Files written before the postings were stored transpose them on load
+        *(
+            tuple(data[f'{name}.{i}'] for i in range(3)) if f'{name}.0' in data else None
+            for name in ('document_postings', 'type_postings')
+        ),
+    ), mmap)
@@ -0,0 +1,50 @@
+"""
+Query API Tests
+Checks that the index-backed query paths agree with scanning the records
+"""
+
+import contextlib
+import io
+import os
+import pickle
+import tempfile
+import unittest
+
+import train_model
+from query_api import ComplianceQuery
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class FacetFilterTest(unittest.TestCase):
+    """filter() returns the same records through the facet index as through a scan"""
+
+    def setUp(self):
+        with open(os.path.join(REPO_DIR, 'compliance_model.pkl'), 'rb') as f:
+            company_compliance_map = pickle.load(f)
+        with open(os.path.join(REPO_DIR, 'company_metadata.pkl'), 'rb') as f:
+            company_metadata = pickle.load(f)
+        # Mandatory flags typed as the columnar model keeps them, e.g. from a boolean source column
+        for i, compliance in enumerate(company_compliance_map['EA']):
+            compliance['mandatory'] = i % 2 == 0
+        output_dir = self.enterContext(tempfile.TemporaryDirectory())
+        fingerprints = {company_type: company_type for company_type in company_compliance_map}
+        with contextlib.redirect_stdout(io.StringIO()):
+            train_model.write_model_artifacts(company_compliance_map, company_metadata, fingerprints, output_dir)
+        self.query = ComplianceQuery(output_dir)
+        self.scan = ComplianceQuery(output_dir)
+        self.scan.facets = None
+
+    def test_typed_criteria_match_like_a_scan(self):
+        for company_type, criteria in [
+            ('EA', {'mandatory': True}),
+            ('EA', {'mandatory': [False]}),
+            ('EA', {'mandatory': True, 'jurisdiction': 'Central'}),
+            ('RCO', {'mandatory': 'Mandatory'}),
+        ]:
+            with self.subTest(company_type=company_type, criteria=criteria):
+                expected = self.scan.filter(company_type, **criteria)
+                self.assertTrue(expected)
+                self.assertEqual(self.query.filter(company_type, **criteria), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+Result Cache Tests
+Checks that sessions on two artifact versions during a reload don't empty each other's cache
+"""
+
+import unittest
+
+from result_cache import ResultCache
+
+class ReloadTest(unittest.TestCase):
+    """Requests interleaved across an old and a new version keep the new version's entries"""
+
+    def test_interleaved_versions_keep_the_newest_entries(self):
+        cache = ResultCache()
+        computed = []
+
+        def lookup(version, key):
+            return cache.get_or_compute(version, key, lambda: computed.append((version, key)) or f"{version}:{key}")
+
+        lookup('old', 'a')
+        for _ in range(3):
+            self.assertEqual(lookup('new', 'a'), 'new:a')
+            self.assertEqual(lookup('old', 'a'), 'old:a')
+            self.assertEqual(lookup('new', 'b'), 'new:b')
+
+        # The new version computed each key once; the old one, retired, computes without caching
+        self.assertEqual(computed.count(('new', 'a')), 1)
+        self.assertEqual(computed.count(('new', 'b')), 1)
+        self.assertEqual(computed.count(('old', 'a')), 4)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
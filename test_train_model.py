@@ -0,0 +1,112 @@
+"""
+Training Regression Tests
+Rebuilds the artifacts from mop_updated.xlsx and checks them against the committed pickles and their readers
+"""
+
+import contextlib
+import io
+import os
+import pickle
+import tempfile
+import unittest
+
+import pandas as pd
+
+import train_model
+from artifacts import StaleArtifactError
+from query_api import ComplianceQuery
+from validation import VALIDATION_REPORT_FILE, load_validation_report
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_FILE = os.path.join(REPO_DIR, 'mop_updated.xlsx')
+
+# Pickles a build must reproduce byte for byte
+COMPARED_FILES = ['compliance_model.pkl', 'company_metadata.pkl', 'company_types.pkl']
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+class TrainingTestCase(unittest.TestCase):
+
+    def build(self, *extra_args, source=SOURCE_FILE, output_dir=None):
+        """Train from the source into output_dir (a new temporary directory by default) and return its path"""
+        output_dir = output_dir or self.enterContext(tempfile.TemporaryDirectory())
+        args = ['--data', source, '--output-dir', output_dir, '--no-snapshot', *extra_args]
+        with contextlib.redirect_stdout(io.StringIO()):
+            train_model.main(args)
+        return output_dir
+
+class TrainModelRegressionTest(TrainingTestCase):
+    """Both ingestion modes rebuild the committed pickles exactly"""
+
+    def assert_matches_committed(self, output_dir):
+        for name in COMPARED_FILES:
+            with self.subTest(artifact=name):
+                self.assertEqual(
+                    read_bytes(os.path.join(output_dir, name)),
+                    read_bytes(os.path.join(REPO_DIR, name)),
+                    f"{name} differs from the committed artifact",
+                )
+
+    def test_full_build_matches_committed_pickles(self):
+        self.assert_matches_committed(self.build())
+
+    def test_stream_build_matches_committed_pickles(self):
+        self.assert_matches_committed(self.build('--stream', '--chunksize', '50'))
+
+class ValidationTest(TrainingTestCase):
+    """Validation gives the same records however the source is chunked, and keeps what it cannot normalize"""
+
+    def write_source(self, frame):
+        source = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'source.csv')
+        frame.to_csv(source, index=False)
+        return source
+
+    def test_stream_and_whole_file_builds_write_the_same_records(self):
+        df = pd.read_excel(SOURCE_FILE)
+        # A spelling seen first in the first chunk, then twice more in another case in a later one
+        variants = df.iloc[[0, 0]].assign(
+            obligation_id=['MOP-EA-901', 'MOP-EA-902'], obligation_title=df['obligation_title'].iloc[0].upper()
+        )
+        source = self.write_source(pd.concat([df, variants], ignore_index=True))
+
+        whole = self.build(source=source)
+        stream = self.build('--stream', '--chunksize', '50', source=source)
+        self.assertEqual(
+            read_bytes(os.path.join(stream, 'compliance_model.pkl')),
+            read_bytes(os.path.join(whole, 'compliance_model.pkl')),
+        )
+        with open(os.path.join(whole, 'compliance_model.pkl'), 'rb') as f:
+            titles = {c['title'] for c in pickle.load(f)['EA']}
+        self.assertNotIn(df['obligation_title'].iloc[0].upper(), titles)
+
+    def test_unrecognized_mandatory_flag_is_kept_and_reported(self):
+        df = pd.read_excel(SOURCE_FILE)
+        df.loc[0, 'legal_mandatory_flag'] = 'Conditional'
+        output_dir = self.build(source=self.write_source(df))
+        with open(os.path.join(output_dir, 'compliance_model.pkl'), 'rb') as f:
+            self.assertEqual(pickle.load(f)['EA'][0]['mandatory'], 'Conditional')
+        report = load_validation_report(os.path.join(output_dir, VALIDATION_REPORT_FILE))
+        self.assertEqual(report['mandatory_flags']['malformed'], {'Conditional': 1})
+
+class PublishTest(TrainingTestCase):
+    """A query never mixes artifacts of the build it opened with a build published later"""
+
+    def test_lazy_query_refuses_indexes_of_a_newer_build(self):
+        source_dir = self.enterContext(tempfile.TemporaryDirectory())
+        older_source = os.path.join(source_dir, 'older.csv')
+        pd.read_excel(SOURCE_FILE).iloc[:-20].to_csv(older_source, index=False)
+        output_dir = self.build(source=older_source)
+
+        query = ComplianceQuery(output_dir, lazy=True)
+        self.assertIsNotNone(query.facets)
+        self.build('--incremental', output_dir=output_dir)
+        with self.assertRaises(StaleArtifactError):
+            query.search_index
+        # Loaded before the new build landed, so still from the query's own build
+        self.assertIsNotNone(query.facets)
+        self.assertIsNotNone(ComplianceQuery(output_dir, lazy=True).search_index)
+
+if __name__ == '__main__':
+    unittest.main()
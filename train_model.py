@@ -7,117 +7,672 @@ import pandas as pd
 import pickle
 import re
 import numpy as np
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-def load_and_preprocess_data(excel_path='mop_updated.xlsx'):
-    """Load and preprocess the compliance data"""
-    print("Loading data from Excel...")
-    df = pd.read_excel(excel_path)
+from applicability import (
+    APPLICABILITY_FILE, APPLICABILITY_VERSION, applicability_segment, build_applicability_index,
+    save_applicability_index
+)
+from artifact_store import ARTIFACT_STORE_DIR, commit_snapshot
+from artifacts import (
+    COLUMNAR_MODEL_DIR, COLUMNAR_VERSION, INDEX_SEGMENTS_DIR, MANIFEST_FILE, SHARED_METADATA_FILE, IndexSegments,
+    TrainingLock, artifacts_present, atomic_path, available_cores, columnar_segment, save_shared_metadata,
+    write_columnar_model
+)
+from facet_index import FACET_INDEX_FILE, FACET_INDEX_VERSION, build_facet_index, facet_segment, save_facet_index
+from impact_index import IMPACT_INDEX_FILE, IMPACT_INDEX_VERSION, build_impact_index, impact_segment, save_impact_index
+from instrumentation import registry, timed, timer, trace
+from lookup_index import LOOKUP_INDEX_FILE, LOOKUP_INDEX_VERSION, build_lookup_index, lookup_segment, save_lookup_index
+from obligation_sets import (
+    OBLIGATION_SETS_FILE, OBLIGATION_SETS_VERSION, build_obligation_sets, obligation_segment, save_obligation_sets
+)
+from search_index import SEARCH_INDEX_FILE, SEARCH_INDEX_VERSION, build_search_index, save_search_index, search_segment
+from similarity import (
+    SIMILARITY_FILE, SIMILARITY_VERSION, build_similarity_index, save_similarity_index, similarity_segment
+)
+from training_job import publish_artifacts, staging_directory
+from validation import VALIDATION_REPORT_FILE, SourceValidator, print_validation_report, save_validation_report
+
+MANIFEST_VERSION = 1
+
+# Stages of write_model_artifacts in order, with the label shown while each one runs
+ARTIFACT_STAGES = {
+    'write_model_pickle': 'Writing compliance model',
+    'write_columnar_model': 'Writing columnar model',
+    'build_search_index': 'Building search index',
+    'build_facet_index': 'Building facet index',
+    'build_obligation_sets': 'Building obligation sets',
+    'build_applicability_index': 'Building applicability index',
+    'build_similarity_index': 'Building similarity index',
+    'build_lookup_index': 'Building lookup index',
+    'build_impact_index': 'Building impact index',
+    'write_index_segments': 'Saving index segments',
+    'write_metadata': 'Writing metadata',
+    'commit_snapshot': 'Committing snapshot',
+}
+
+# Source columns that feed the compliance mapping, keyed by output field
+COMPLIANCE_FIELDS = {
+    'obligation_id': 'obligation_id',
+    'title': 'obligation_title',
+    'description': 'obligation_description',
+    'regulation_name': 'regulation_name',
+    'regulation_type': 'regulation_type',
+    'authority': 'issuing_authority',
+    'mandatory': 'legal_mandatory_flag',
+    'jurisdiction': 'jurisdiction_level',
+    'state': 'state_name',
+}
+
+# Declared column subset and dtypes for streaming ingestion
+SOURCE_DTYPES = {column: 'object' for column in COMPLIANCE_FIELDS.values()}
+
+# File types picked up when --data names a directory
+SOURCE_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+# How an obligation_id that appears in several sources with different content is resolved
+CONFLICT_POLICIES = ['error', 'first']
+
+def resolve_sources(data):
+    """Source files named by a path, a directory or a glob pattern, in sorted order"""
+    if os.path.isdir(data):
+        paths = [os.path.join(data, name) for name in os.listdir(data)
+                 if name.lower().endswith(SOURCE_EXTENSIONS) and not name.startswith('~$')]
+    elif glob.has_magic(data):
+        paths = glob.glob(data)
+    else:
+        return [data]
+    if not paths:
+        raise FileNotFoundError(f"No source workbooks found for {data}")
+    return sorted(paths)
+
+def read_source(path):
+    """Read one workbook or CSV and keep the rows a company type can be extracted from"""
+    if path.lower().endswith('.csv'):
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path)
+    return extract_company_type(df)
+
+def resolve_conflicts(df, on_conflict='error'):
+    """Drop repeats of an obligation_id from later sources and detect conflicting ones.
+
+    An obligation_id found in several sources with identical content is kept from
+    the first source only. With different content it is a conflict: raise, or with
+    on_conflict='first' keep the first source's rows.
+    """
+    first_source = df.groupby('obligation_id', sort=False)['source_file'].transform('first')
+    repeated = df['source_file'] != first_source
+    if not repeated.any():
+        return df
     
-    # Extract company type from obligation_id
-    df['company_type'] = df['obligation_id'].str.extract(r'MOP-([A-Z0-9]+)-')[0]
+    shared_ids = df.loc[repeated, 'obligation_id'].unique()
+    shared = df[df['obligation_id'].isin(shared_ids)]
+    row_hashes = hash_source_rows(shared)
+    # Compare each source's rows for an ID as a whole, so repeats within a file are allowed
+    per_source = row_hashes.groupby([shared['obligation_id'].values, shared['source_file'].values], sort=False).agg(tuple)
+    variants = per_source.groupby(level=0, sort=False).nunique()
+    conflicts = variants[variants > 1].index.tolist()
     
-    # Remove rows where company_type couldn't be extracted
-    df = df.dropna(subset=['company_type'])
-    
-    # Create a comprehensive compliance description
-    df['compliance_full'] = (
-        df['obligation_title'].fillna('') + ' | ' +
-        df['obligation_description'].fillna('') + ' | ' +
-        df['regulation_name'].fillna('') + ' | ' +
-        df['regulation_type'].fillna('')
+    if conflicts and on_conflict == 'error':
+        details = []
+        for obligation_id in conflicts[:10]:
+            sources = shared.loc[shared['obligation_id'] == obligation_id, 'source_file'].unique()
+            details.append(f"{obligation_id} ({', '.join(sources)})")
+        more = f" and {len(conflicts) - 10} more" if len(conflicts) > 10 else ""
+        raise ValueError(f"{len(conflicts)} obligation_ids differ between sources: "
+                         f"{'; '.join(details)}{more}")
+    
+    print(f"Dropped {int(repeated.sum())} rows repeated from earlier sources "
+          f"({len(conflicts)} conflicting obligation_ids resolved to the first source)")
+    return df[~repeated].reset_index(drop=True)
+
+def load_sources(paths, workers=None, on_conflict='error'):
+    """Parse several sources in parallel and merge them in path order"""
+    workers = min(workers or available_cores(), len(paths))
+    print(f"Loading {len(paths)} sources with {workers} worker process(es)...")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(read_source, paths))
+    else:
+        frames = [read_source(path) for path in paths]
+    
+    for path, frame in zip(paths, frames):
+        print(f"  {path}: {len(frame)} records")
+    df = pd.concat(
+        [frame.assign(source_file=os.path.basename(path)) for path, frame in zip(paths, frames)],
+        ignore_index=True
     )
+    return resolve_conflicts(df, on_conflict)
+
+def source_validator():
+    """A SourceValidator over the mapped source columns"""
+    return SourceValidator(COMPLIANCE_FIELDS.values())
+
+@timed('load_and_preprocess_data')
+def load_and_preprocess_data(excel_path='mop_updated.xlsx', workers=None, on_conflict='error', validator=None):
+    """Load and preprocess the compliance data.
+
+    excel_path may also be a directory or glob of workbooks, which are parsed in
+    parallel by `workers` processes (default: one per core) and merged. The rows
+    are then checked and deduplicated by validator (a new source_validator() if
+    not given), whose report() describes them afterwards.
+    """
+    paths = resolve_sources(excel_path)
+    if len(paths) > 1:
+        df = load_sources(paths, workers, on_conflict)
+    elif excel_path.lower().endswith('.csv'):
+        print("Loading data from CSV...")
+        df = read_source(paths[0])
+    else:
+        print("Loading data from Excel...")
+        df = read_source(paths[0])
+    
+    validator = validator or source_validator()
+    with timer('validate_source'):
+        df = validator.validate(df).reset_index(drop=True)
+    print_validation_report(validator.report())
     
     print(f"Total records: {len(df)}")
     print(f"Unique company types: {df['company_type'].nunique()}")
     
     return df
 
-def create_company_compliance_mapping(df):
-    """Create a mapping of company types to their compliances"""
-    company_compliance_map = {}
+def extract_company_type(df):
+    """Add the company_type column and drop rows it can't be extracted from"""
+    # Extract company type from obligation_id
+    df = df.assign(company_type=df['obligation_id'].str.extract(r'MOP-([A-Z0-9]+)-')[0])
     
-    for company_type in df['company_type'].unique():
-        company_data = df[df['company_type'] == company_type]
-        
-        compliances = []
-        for _, row in company_data.iterrows():
-            compliance_info = {
-                'obligation_id': row['obligation_id'],
-                'title': row['obligation_title'],
-                'description': row['obligation_description'],
-                'regulation_name': row['regulation_name'],
-                'regulation_type': row['regulation_type'],
-                'authority': row['issuing_authority'],
-                'mandatory': row['legal_mandatory_flag'],
-                'jurisdiction': row['jurisdiction_level'],
-                'state': row['state_name'] if pd.notna(row['state_name']) else 'All India'
-            }
-            compliances.append(compliance_info)
-        
-        company_compliance_map[company_type] = compliances
+    # Remove rows where company_type couldn't be extracted
+    return df.dropna(subset=['company_type'])
+
+def iter_source_chunks(path, chunksize=5000):
+    """Yield the declared source columns in chunks without loading the whole file.
+
+    CSV files are read with pandas in chunks; workbooks are iterated row by row
+    with openpyxl in read-only mode.
+    """
+    columns = list(SOURCE_DTYPES)
+    if path.lower().endswith('.csv'):
+        for chunk in pd.read_csv(path, usecols=columns, dtype=SOURCE_DTYPES, chunksize=chunksize):
+            yield chunk[columns]
+        return
     
-    return company_compliance_map
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows)
+        positions = [header.index(column) for column in columns]
+        buffer = []
+        for row in rows:
+            buffer.append([np.nan if row[i] is None else row[i] for i in positions])
+            if len(buffer) == chunksize:
+                yield pd.DataFrame(buffer, columns=columns).astype(SOURCE_DTYPES)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns).astype(SOURCE_DTYPES)
+    finally:
+        workbook.close()
 
-def save_model_artifacts(company_compliance_map, df):
-    """Save the model artifacts"""
-    print("\nSaving model artifacts...")
+def share_values(values, shared):
+    """A column's values as an object array where equal values are one object, the one kept in shared"""
+    codes, uniques = pd.factorize(values)
+    # Code -1 (missing) picks the trailing NaN
+    return np.array([shared.setdefault(value, value) for value in uniques] + [np.nan], dtype=object)[codes]
+
+@timed('create_company_compliance_mapping')
+def create_company_compliance_mapping(df, shared=None):
+    """Create a mapping of company types to their compliances.
+
+    Equal field values are the same object across all records (and across calls
+    given the same shared dict), so an obligation repeated under several company
+    types is pickled once and each copy costs only references.
+    """
+    shared = {} if shared is None else shared
+    columns = []
+    for field, column in COMPLIANCE_FIELDS.items():
+        values = df[column].fillna('All India') if field == 'state' else df[column]
+        columns.append(share_values(values, shared))
     
-    # Save the main mapping
-    with open('compliance_model.pkl', 'wb') as f:
-        pickle.dump(company_compliance_map, f)
+    # One pass over the rows, grouped in first-appearance order of company type
+    fields = list(COMPLIANCE_FIELDS)
+    company_compliance_map = {}
+    for company_type, row in zip(df['company_type'].values, zip(*columns)):
+        company_compliance_map.setdefault(company_type, []).append(dict(zip(fields, row)))
     
-    # Save company type metadata
+    return company_compliance_map
+
+@timed('build_company_metadata')
+def build_company_metadata(df):
+    """Build per company type metadata from the preprocessed data"""
     company_metadata = {}
-    for company_type in df['company_type'].unique():
-        company_data = df[df['company_type'] == company_type]
+    for company_type, company_data in df.groupby('company_type', sort=False):
         company_metadata[company_type] = {
             'total_compliances': len(company_data),
             'regulation_types': company_data['regulation_type'].value_counts().to_dict(),
             'authorities': company_data['issuing_authority'].unique().tolist()
         }
+    return company_metadata
+
+def merge_company_metadata(company_metadata, df):
+    """Fold the metadata of one chunk into the running per company type metadata"""
+    for company_type, count in df.groupby('company_type', sort=False).size().items():
+        meta = company_metadata.setdefault(company_type, {
+            'total_compliances': 0,
+            'regulation_types': {},
+            'authorities': []
+        })
+        meta['total_compliances'] += int(count)
+    
+    reg_counts = df.groupby(['company_type', 'regulation_type'], sort=False).size()
+    for (company_type, reg_type), count in reg_counts.items():
+        reg_types = company_metadata[company_type]['regulation_types']
+        reg_types[reg_type] = reg_types.get(reg_type, 0) + int(count)
+    
+    pairs = df[['company_type', 'issuing_authority']].drop_duplicates()
+    for company_type, authority in zip(pairs['company_type'].values, pairs['issuing_authority'].values):
+        authorities = company_metadata[company_type]['authorities']
+        if pd.isna(authority):
+            if not any(pd.isna(a) for a in authorities):
+                authorities.append(authority)
+        elif authority not in authorities:
+            authorities.append(authority)
+    return company_metadata
+
+@timed('stream_build')
+def stream_build(path, chunksize=5000, validator=None):
+    """Build the mapping, metadata and fingerprints from the source in bounded-size chunks.
+
+    Each chunk is checked by validator (a new source_validator() if not given),
+    which carries what it has seen over to the next chunk.
+    """
+    print(f"Streaming data from {path} in chunks of {chunksize} rows...")
+    validator = validator or source_validator()
+    shared = {}
+    company_compliance_map = {}
+    company_metadata = {}
+    hashers = {}
+    total_rows = 0
+    
+    for chunk in iter_source_chunks(path, chunksize):
+        chunk = validator.validate(extract_company_type(chunk))
+        total_rows += len(chunk)
+        
+        for company_type, compliances in create_company_compliance_mapping(chunk, shared).items():
+            company_compliance_map.setdefault(company_type, []).extend(compliances)
+        merge_company_metadata(company_metadata, chunk)
+        
+        row_hashes = hash_source_rows(chunk)
+        for company_type, hashes in row_hashes.groupby(chunk['company_type'].values, sort=False):
+            hashers.setdefault(company_type, hashlib.sha256()).update(hashes.values.tobytes())
+    
+    # Match value_counts ordering: most frequent first, ties in order of appearance
+    for meta in company_metadata.values():
+        meta['regulation_types'] = dict(sorted(meta['regulation_types'].items(), key=lambda x: x[1], reverse=True))
+    
+    print(f"Total records: {total_rows}")
+    print(f"Unique company types: {len(company_compliance_map)}")
+    print_validation_report(validator.report())
+    
+    fingerprints = {company_type: hasher.hexdigest() for company_type, hasher in hashers.items()}
+    return company_compliance_map, company_metadata, fingerprints, total_rows
+
+def hash_source_rows(df):
+    """Hash each source row over the mapped columns"""
+    source_columns = list(COMPLIANCE_FIELDS.values())
+    return pd.util.hash_pandas_object(df[source_columns].astype(object), index=False)
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+@timed('fingerprint_company_types')
+def fingerprint_company_types(df):
+    """Hash the source rows of each company type, in row order"""
+    row_hashes = hash_source_rows(df)
+    fingerprints = {}
+    for company_type, hashes in row_hashes.groupby(df['company_type'].values, sort=False):
+        fingerprints[company_type] = hashlib.sha256(hashes.values.tobytes()).hexdigest()
+    return fingerprints
+
+def load_manifest(output_dir='.'):
+    """Load the artifact manifest, or None if missing or from another format version"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def _stage(stage, progress=None):
+    """timer() for one stage of write_model_artifacts, reported to progress(stage) first when given"""
+    if progress is not None:
+        progress(stage)
+    return timer(stage)
+
+def write_model_artifacts(company_compliance_map, company_metadata, fingerprints, output_dir='.', store_dir=None,
+                          progress=None, validation_report=None, segment_dir=None, reuse_segments=False):
+    """Write the three pickles and the manifest describing them, and snapshot them into store_dir if given.
+
+    validation_report, if given, is saved alongside. Every file is written to a temporary name and renamed into place, so a reader
+    never opens a partly written artifact. progress, if given, is called with each
+    ARTIFACT_STAGES key as that stage starts. The indexes' per company type
+    segments are cached in segment_dir if given, and with reuse_segments those
+    cached by earlier builds are reused for company types whose fingerprint is unchanged.
+    """
+    segments = IndexSegments(fingerprints, segment_dir, reuse_segments)
+    
+    def segments_of(name, version, build):
+        return segments.segments(name, version, company_compliance_map, build)
+    
+    with _stage('write_model_pickle', progress):
+        with atomic_path(os.path.join(output_dir, 'compliance_model.pkl')) as path, open(path, 'wb') as f:
+            pickle.dump(company_compliance_map, f)
+    
+    # Compact columnar copy of the mapping, used by the app and demo loaders
+    with _stage('write_columnar_model', progress):
+        write_columnar_model(company_compliance_map, os.path.join(output_dir, COLUMNAR_MODEL_DIR),
+                             segments_of('columnar', COLUMNAR_VERSION, columnar_segment))
+    
+    # Inverted index for the app's search box
+    with _stage('build_search_index', progress), atomic_path(os.path.join(output_dir, SEARCH_INDEX_FILE)) as path:
+        save_search_index(build_search_index(
+            company_compliance_map, segments_of('search', SEARCH_INDEX_VERSION, search_segment)
+        ), path)
+    
+    # Posting lists per authority / regulation type / jurisdiction / state / mandatory value
+    with _stage('build_facet_index', progress), atomic_path(os.path.join(output_dir, FACET_INDEX_FILE)) as path:
+        save_facet_index(build_facet_index(
+            company_compliance_map, segments_of('facet', FACET_INDEX_VERSION, facet_segment)
+        ), path)
+    
+    # Per company type bitsets for multi-type union / intersection / diff
+    with _stage('build_obligation_sets', progress), atomic_path(os.path.join(output_dir, OBLIGATION_SETS_FILE)) as path:
+        obligation_sets = build_obligation_sets(
+            company_compliance_map, segments_of('obligation_sets', OBLIGATION_SETS_VERSION, obligation_segment)
+        )
+        save_obligation_sets(obligation_sets, path)
+    
+    # Nationwide rows and (state, company type) postings for operating-state applicability
+    with _stage('build_applicability_index', progress), atomic_path(os.path.join(output_dir, APPLICABILITY_FILE)) as path:
+        save_applicability_index(build_applicability_index(
+            company_compliance_map, segments_of('applicability', APPLICABILITY_VERSION, applicability_segment)
+        ), path)
+    
+    # TF-IDF vectors of similarity.compliance_text for similarity and company type matching
+    with _stage('build_similarity_index', progress), atomic_path(os.path.join(output_dir, SIMILARITY_FILE)) as path:
+        save_similarity_index(build_similarity_index(
+            company_compliance_map, segments_of('similarity', SIMILARITY_VERSION, similarity_segment)
+        ), path)
     
-    with open('company_metadata.pkl', 'wb') as f:
-        pickle.dump(company_metadata, f)
+    # Sorted keys and trigram postings of type codes, regulation names and obligation IDs for typeahead
+    with _stage('build_lookup_index', progress), atomic_path(os.path.join(output_dir, LOOKUP_INDEX_FILE)) as path:
+        save_lookup_index(build_lookup_index(
+            company_compliance_map, segments_of('lookup', LOOKUP_INDEX_VERSION, lookup_segment)
+        ), path)
     
-    # Save all unique company types for the UI
-    company_types = sorted(df['company_type'].unique().tolist())
-    with open('company_types.pkl', 'wb') as f:
-        pickle.dump(company_types, f)
+    # Regulation and authority -> obligations -> company types, for change impact analysis
+    with _stage('build_impact_index', progress), atomic_path(os.path.join(output_dir, IMPACT_INDEX_FILE)) as path:
+        save_impact_index(build_impact_index(
+            company_compliance_map, obligation_sets.row_obligations,
+            segments_of('impact', IMPACT_INDEX_VERSION, impact_segment)
+        ), path)
+    
+    # Kept for the next incremental build, which recomputes only the changed company types' segments
+    with _stage('write_index_segments', progress):
+        segments.save()
+    
+    with _stage('write_metadata', progress):
+        with atomic_path(os.path.join(output_dir, 'company_metadata.pkl')) as path, open(path, 'wb') as f:
+            pickle.dump(company_metadata, f)
+        # Memory-mappable copy for processes serving the artifacts shared
+        with atomic_path(os.path.join(output_dir, SHARED_METADATA_FILE)) as path:
+            save_shared_metadata(company_metadata, path)
+        
+        # Save all unique company types for the UI
+        company_types = sorted(company_compliance_map.keys())
+        with atomic_path(os.path.join(output_dir, 'company_types.pkl')) as path, open(path, 'wb') as f:
+            pickle.dump(company_types, f)
+        
+        if validation_report is not None:
+            with atomic_path(os.path.join(output_dir, VALIDATION_REPORT_FILE)) as path:
+                save_validation_report(validation_report, path)
+        
+        # Written last: its hash is the artifact version hot-reloading readers watch
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'company_types': fingerprints,
+        }
+        with atomic_path(os.path.join(output_dir, MANIFEST_FILE)) as path, open(path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
     
     print(f"✓ Saved compliance model with {len(company_compliance_map)} company types")
     print(f"✓ Saved metadata for {len(company_metadata)} company types")
     print(f"✓ Saved {len(company_types)} unique company types")
+    if validation_report is not None:
+        print(f"✓ Saved validation report to {VALIDATION_REPORT_FILE}")
+    
+    if store_dir is not None:
+        with _stage('commit_snapshot', progress):
+            snapshot_id, created = commit_snapshot(
+                company_compliance_map, company_metadata, store_dir, fingerprints=fingerprints
+            )
+        print(f"✓ {'Committed' if created else 'Unchanged since'} snapshot {snapshot_id} in {store_dir}")
 
-def main():
-    """Main training function"""
-    print("=" * 60)
-    print("COMPLIANCE PREDICTION MODEL TRAINING")
-    print("=" * 60)
+def save_model_artifacts(company_compliance_map, df, output_dir='.', store_dir=None, validation_report=None,
+                         segment_dir=None):
+    """Save the model artifacts"""
+    print("\nSaving model artifacts...")
+    company_metadata = build_company_metadata(df)
+    write_model_artifacts(company_compliance_map, company_metadata, fingerprint_company_types(df), output_dir, store_dir,
+                          validation_report=validation_report, segment_dir=segment_dir)
+
+def incremental_build(df, output_dir='.', store_dir=None, validation_report=None, staging_dir=None):
+    """Rebuild only the company types whose source rows changed since the last build.
+
+    The previous build is read from output_dir and the new one written to
+    staging_dir (output_dir itself if not given); nothing is written when no
+    company type changed. Falls back to a full build when the manifest or any
+    artifact is missing. Returns the set of company types that were regenerated.
+    """
+    staging_dir = staging_dir or output_dir
+    segment_dir = os.path.join(output_dir, INDEX_SEGMENTS_DIR)
+    manifest = load_manifest(output_dir)
+    fingerprints = fingerprint_company_types(df)
+    
+    if manifest is None or not artifacts_present(output_dir):
+        print("No usable manifest found, running a full build...")
+        company_compliance_map = create_company_compliance_mapping(df)
+        save_model_artifacts(company_compliance_map, df, staging_dir, store_dir, validation_report, segment_dir)
+        return set(company_compliance_map)
+    
+    previous = manifest['company_types']
+    changed = {ct for ct, digest in fingerprints.items() if previous.get(ct) != digest}
+    removed = set(previous) - set(fingerprints)
+    print(f"Changed company types: {len(changed)}, removed: {len(removed)}, "
+          f"unchanged: {len(fingerprints) - len(changed)}")
+    
+    if not changed and not removed:
+        print("✓ Artifacts are up to date, nothing to rebuild")
+        return set()
     
-    # Load and preprocess data
-    df = load_and_preprocess_data()
+    with open(os.path.join(output_dir, 'compliance_model.pkl'), 'rb') as f:
+        old_map = pickle.load(f)
+    with open(os.path.join(output_dir, 'company_metadata.pkl'), 'rb') as f:
+        old_metadata = pickle.load(f)
     
-    # Create company-compliance mapping
-    print("\nCreating company-compliance mapping...")
-    company_compliance_map = create_company_compliance_mapping(df)
+    changed_df = df[df['company_type'].isin(changed)]
+    new_map = create_company_compliance_mapping(changed_df)
+    new_metadata = build_company_metadata(changed_df)
     
-    # Display statistics
+    # Keep the first-appearance order of a full build
+    company_compliance_map = {}
+    company_metadata = {}
+    for company_type in fingerprints:
+        if company_type in changed:
+            company_compliance_map[company_type] = new_map[company_type]
+            company_metadata[company_type] = new_metadata[company_type]
+        else:
+            company_compliance_map[company_type] = old_map[company_type]
+            company_metadata[company_type] = old_metadata[company_type]
+    
+    # The indexes are merged from per company type segments, only the changed types' computed anew
+    print("\nSaving model artifacts...")
+    write_model_artifacts(company_compliance_map, company_metadata, fingerprints, staging_dir, store_dir,
+                          validation_report=validation_report, segment_dir=segment_dir, reuse_segments=True)
+    return changed
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Train the compliance prediction model")
+    parser.add_argument('--data', default='mop_updated.xlsx',
+                        help="Source workbook or CSV, or a directory or glob of them")
+    parser.add_argument('--output-dir', default='.', help="Directory for the model artifacts")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help="Only regenerate company types whose source rows changed")
+    mode.add_argument('--stream', action='store_true',
+                      help="Ingest the source in bounded-size chunks instead of loading it whole")
+    parser.add_argument('--chunksize', type=int, default=5000, help="Rows per chunk in --stream mode")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes parsing multiple sources (default: one per core)")
+    parser.add_argument('--on-conflict', choices=CONFLICT_POLICIES, default='error',
+                        help="When an obligation_id differs between sources: fail, or keep the first source's rows")
+    parser.add_argument('--store', help=f"Snapshot store directory (default: {ARTIFACT_STORE_DIR} in the output directory)")
+    parser.add_argument('--no-snapshot', action='store_true', help="Don't record this build in the snapshot store")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="Time each training stage and write the timings to PATH in Prometheus text format")
+    args = parser.parse_args(argv)
+    if args.stream and len(resolve_sources(args.data)) > 1:
+        parser.error("--stream takes a single source file")
+    return args
+
+def print_statistics(company_compliance_map):
+    """Print the number of compliances per company type"""
     print("\n" + "=" * 60)
     print("TRAINING STATISTICS")
     print("=" * 60)
     for company_type, compliances in sorted(company_compliance_map.items()):
         print(f"{company_type:15} → {len(compliances):3} compliances")
+
+def print_ingestion_report(total_rows, elapsed):
+    """Print ingestion throughput and peak memory"""
+    rate = total_rows / elapsed if elapsed > 0 else float('inf')
+    peak = peak_rss_mb()
+    peak_text = f"{peak:.1f} MB" if peak is not None else "n/a"
+    print(f"\nIngested {total_rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec), peak RSS {peak_text}")
+
+def print_stage_timings(record):
+    """Print the stages of an instrumentation trace"""
+    print("\n" + "=" * 60)
+    print("STAGE TIMINGS")
+    print("=" * 60)
+    for stage in record['stages']:
+        print(f"{stage['stage']:34} {stage['seconds'] * 1000:10.1f} ms")
+    print(f"{'total':34} {record['seconds'] * 1000:10.1f} ms")
+
+def main(argv=None):
+    """Main training function"""
+    args = parse_args(argv)
+    if args.metrics:
+        registry.enable()
+    # One build per artifact directory at a time, including the app's background builds
+    os.makedirs(args.output_dir, exist_ok=True)
+    lock = TrainingLock(args.output_dir)
+    if not lock.acquire(blocking=False):
+        print("Waiting for another build of these artifacts to finish...")
+        lock.acquire()
+    try:
+        with trace('training'):
+            train(args)
+    finally:
+        lock.release()
     
-    # Save model artifacts
-    save_model_artifacts(company_compliance_map, df)
+    if args.metrics:
+        print_stage_timings(registry.last_trace('training'))
+        with open(args.metrics, 'w') as f:
+            f.write(registry.prometheus_text())
+        print(f"\n✓ Saved stage timings to {args.metrics}")
+
+def train(args):
+    """Build the artifacts as the parsed command line asks"""
+    print("=" * 60)
+    print("COMPLIANCE PREDICTION MODEL TRAINING")
+    print("=" * 60)
+    
+    store_dir = None if args.no_snapshot else (args.store or os.path.join(args.output_dir, ARTIFACT_STORE_DIR))
+    segment_dir = os.path.join(args.output_dir, INDEX_SEGMENTS_DIR)
+    validator = source_validator()
+    start = time.perf_counter()
+    # Built aside and published in one step, like the app's background builds, so readers never see a mix
+    with staging_directory(args.output_dir) as staging_dir:
+        if args.stream:
+            company_compliance_map, company_metadata, fingerprints, total_rows = stream_build(
+                args.data, args.chunksize, validator
+            )
+            print_ingestion_report(total_rows, time.perf_counter() - start)
+            print_statistics(company_compliance_map)
+            print("\nSaving model artifacts...")
+            write_model_artifacts(company_compliance_map, company_metadata, fingerprints, staging_dir, store_dir,
+                                  validation_report=validator.report(), segment_dir=segment_dir)
+        else:
+            # Load and preprocess data
+            try:
+                df = load_and_preprocess_data(args.data, args.workers, args.on_conflict, validator)
+            except ValueError as e:
+                raise SystemExit(f"✗ {e}")
+            
+            if args.incremental:
+                print("\nRunning incremental build...")
+                rebuilt = incremental_build(df, args.output_dir, store_dir, validator.report(), staging_dir)
+                print(f"\n✓ Regenerated {len(rebuilt)} company types")
+            else:
+                # Create company-compliance mapping
+                print("\nCreating company-compliance mapping...")
+                company_compliance_map = create_company_compliance_mapping(df)
+                print_ingestion_report(len(df), time.perf_counter() - start)
+                print_statistics(company_compliance_map)
+                
+                # Save model artifacts
+                save_model_artifacts(company_compliance_map, df, staging_dir, store_dir, validator.report(),
+                                     segment_dir)
+        
+        if publish_artifacts(staging_dir, args.output_dir):
+            print(f"✓ Published the new build to {args.output_dir}")
     
     print("\n" + "=" * 60)
     print("✓ MODEL TRAINING COMPLETED SUCCESSFULLY!")
     print("=" * 60)
     print("\nGenerated files:")
     print("  • compliance_model.pkl")
+    print(f"  • {COLUMNAR_MODEL_DIR}/")
+    print(f"  • {SEARCH_INDEX_FILE}")
+    print(f"  • {FACET_INDEX_FILE}")
+    print(f"  • {OBLIGATION_SETS_FILE}")
+    print(f"  • {APPLICABILITY_FILE}")
+    print(f"  • {SIMILARITY_FILE}")
+    print(f"  • {LOOKUP_INDEX_FILE}")
+    print(f"  • {IMPACT_INDEX_FILE}")
     print("  • company_metadata.pkl")
+    print(f"  • {SHARED_METADATA_FILE}")
     print("  • company_types.pkl")
+    print(f"  • {VALIDATION_REPORT_FILE}")
+    print(f"  • {MANIFEST_FILE}")
     print("\nYou can now run the Streamlit app with: streamlit run app.py")
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+"""
+Background Training Job
+Single-flight model training on a worker thread, with stage progress and an atomic swap to the new artifacts
+"""
+
+import contextlib
+import os
+import shutil
+import threading
+import time
+
+from artifact_store import ARTIFACT_STORE_DIR
+from artifacts import (
+    COLUMNAR_MODEL_DIR, HEADER_FILE, INDEX_SEGMENTS_DIR, MANIFEST_FILE, TrainingLock, artifacts_present,
+    mark_publishing
+)
+
+STAGING_DIR_PREFIX = '.staging-'
+
+def training_stages():
+    """Stages of a background build in order, with the label shown while each one runs"""
+    from train_model import ARTIFACT_STAGES
+
+    return {
+        'waiting': 'Waiting for another build to finish',
+        'load_data': 'Loading and validating source data',
+        'build_mapping': 'Building compliance mapping',
+        'build_metadata': 'Building company metadata',
+        **ARTIFACT_STAGES,
+        'publish': 'Publishing new artifacts',
+    }
+
+@contextlib.contextmanager
+def staging_directory(artifact_dir='.'):
+    """Empty directory inside artifact_dir to build into before publish_artifacts, removed afterwards.
+
+    The caller must hold the directory's TrainingLock.
+    """
+    # Left behind by builds that died midway; holding the lock means none of them is still running
+    for name in os.listdir(artifact_dir):
+        if name.startswith(STAGING_DIR_PREFIX):
+            shutil.rmtree(os.path.join(artifact_dir, name), ignore_errors=True)
+    staging_dir = os.path.join(artifact_dir, f"{STAGING_DIR_PREFIX}{os.getpid()}")
+    os.makedirs(staging_dir)
+    try:
+        yield staging_dir
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def publish_artifacts(staging_dir, artifact_dir='.'):
+    """Move a staged build over the live artifacts, one atomic rename per file; returns whether it did.
+
+    A staging directory without a manifest (an incomplete or skipped build) is
+    left unpublished. The live manifest is first marked as publishing and the new
+    one moves last, so a reader that finds artifact_version unchanged after
+    loading a file has read it from the build it opened, never from a mix.
+    """
+    if not os.path.exists(os.path.join(staging_dir, MANIFEST_FILE)):
+        return False
+    mark_publishing(artifact_dir)
+    staged_columns = os.path.join(staging_dir, COLUMNAR_MODEL_DIR)
+    if os.path.isdir(staged_columns):
+        columns = os.path.join(artifact_dir, COLUMNAR_MODEL_DIR)
+        os.makedirs(columns, exist_ok=True)
+        for name in sorted(os.listdir(staged_columns), key=lambda name: name == HEADER_FILE):
+            os.replace(os.path.join(staged_columns, name), os.path.join(columns, name))
+    for name in sorted(os.listdir(staging_dir), key=lambda name: name == MANIFEST_FILE):
+        if name != COLUMNAR_MODEL_DIR:
+            os.replace(os.path.join(staging_dir, name), os.path.join(artifact_dir, name))
+    return True
+
+class TrainingJob:
+    """Builds the artifacts of a directory on a background thread, one build at a time.
+
+    start() while a build is running joins it instead of starting another, and
+    a file lock makes builds in other processes wait their turn. The new build is
+    written to a staging directory and published once complete, so readers keep
+    serving the previous artifacts until then. status() reports the current stage.
+    """
+
+    def __init__(self, source='mop_updated.xlsx', artifact_dir='.', store_dir=None):
+        self.source = source
+        self.artifact_dir = artifact_dir
+        self.store_dir = store_dir if store_dir is not None else os.path.join(artifact_dir, ARTIFACT_STORE_DIR)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {'state': 'idle', 'stage': None, 'label': None, 'progress': 0.0,
+                        'error': None, 'started_at': None, 'seconds': None}
+
+    def status(self):
+        """Copy of the job state: 'idle', 'running', 'done' or 'failed', plus stage, label and progress"""
+        with self._lock:
+            return dict(self._status)
+
+    def running(self):
+        """Whether a build is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, only_if_missing=False):
+        """Start a build unless one is already running; returns the job.
+
+        With only_if_missing, a build that finds complete artifacts once it holds
+        the lock (another process built them meanwhile) finishes without building.
+        """
+        with self._lock:
+            if self.running():
+                return self
+            self._status = {'state': 'running', 'stage': None, 'label': 'Starting', 'progress': 0.0,
+                            'error': None, 'started_at': time.time(), 'seconds': None}
+            self._thread = threading.Thread(
+                target=self._run, args=(only_if_missing,), name='training-job', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Block until the running build finishes; returns the final status"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.status()
+
+    def _report(self, stage):
+        stages = list(self._stages)
+        with self._lock:
+            self._status.update({
+                'stage': stage,
+                'label': self._stages[stage],
+                'progress': stages.index(stage) / len(stages),
+            })
+
+    def _run(self, only_if_missing):
+        start = time.perf_counter()
+        lock = TrainingLock(self.artifact_dir)
+        try:
+            self._stages = training_stages()
+            if not lock.acquire(blocking=False):
+                self._report('waiting')
+                lock.acquire()
+            if not (only_if_missing and artifacts_present(self.artifact_dir)):
+                self._build()
+        except Exception as e:
+            outcome = {'state': 'failed', 'error': f"{type(e).__name__}: {e}"}
+        else:
+            outcome = {'state': 'done', 'progress': 1.0, 'label': 'Done'}
+        finally:
+            lock.release()
+        with self._lock:
+            self._status.update(outcome, seconds=time.perf_counter() - start)
+
+    def _build(self):
+        """Full build of the source into a staging directory, then published over the live artifacts"""
+        from train_model import (
+            build_company_metadata, create_company_compliance_mapping, fingerprint_company_types,
+            load_and_preprocess_data, source_validator, write_model_artifacts,
+        )
+
+        with staging_directory(self.artifact_dir) as staging_dir:
+            self._report('load_data')
+            validator = source_validator()
+            df = load_and_preprocess_data(self.source, validator=validator)
+            self._report('build_mapping')
+            company_compliance_map = create_company_compliance_mapping(df)
+            self._report('build_metadata')
+            company_metadata = build_company_metadata(df)
+            fingerprints = fingerprint_company_types(df)
+            write_model_artifacts(
+                company_compliance_map, company_metadata, fingerprints, staging_dir, self.store_dir,
+                progress=self._report, validation_report=validator.report(),
+                segment_dir=os.path.join(self.artifact_dir, INDEX_SEGMENTS_DIR)
+            )
+            self._report('publish')
+            publish_artifacts(staging_dir, self.artifact_dir)
@@ -0,0 +1,305 @@
+"""
+Source Validation
+Checks and deduplicates the source rows before they are mapped, and reports what it found
+"""
+
+import bisect
+import itertools
+import json
+import os
+import pickle
+import re
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+VALIDATION_REPORT_FILE = 'validation_report.json'
+VALIDATION_REPORT_VERSION = 1
+
+ID_COLUMN = 'obligation_id'
+MANDATORY_COLUMN = 'legal_mandatory_flag'
+
+# Accepted spellings of the mandatory flag, keyed by their lowercase letters and digits
+MANDATORY_FLAGS = {
+    'mandatory': 'Mandatory', 'yes': 'Mandatory', 'y': 'Mandatory', 'true': 'Mandatory', '1': 'Mandatory',
+    'advisory': 'Advisory', 'no': 'Advisory', 'n': 'Advisory', 'false': 'Advisory', '0': 'Advisory',
+}
+
+# Obligation IDs listed per finding in the report
+REPORT_EXAMPLES = 10
+
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+def normalize_text(values):
+    """Casefolded values of a column with runs of punctuation and whitespace collapsed to one space.
+
+    Each distinct value is normalized once; missing values give ''.
+    """
+    codes, uniques = pd.factorize(values)
+    normalized = [NON_WORD_PATTERN.sub(' ', str(value).casefold()).strip() for value in uniques]
+    # Code -1 (missing) picks the trailing ''
+    return np.array(normalized + [''], dtype=object)[codes]
+
+def hash_rows(frame):
+    """Hash each row of a frame over all its columns"""
+    return pd.util.hash_pandas_object(frame.astype(object), index=False).values
+
+def _extend_examples(examples, items):
+    """Append items to a report's examples, keeping at most REPORT_EXAMPLES"""
+    examples.extend(itertools.islice(items, max(REPORT_EXAMPLES - len(examples), 0)))
+
+class SourceValidator:
+    """Validates source rows one frame or chunk at a time, remembering the chunks before.
+
+    validate() normalizes the mandatory flag, rewrites near duplicates (the same
+    content up to case, whitespace and punctuation, under any obligation_id) to
+    the first spelling in file order so every copy shares one record, and drops exact
+    duplicate rows. report() summarizes the findings over all chunks.
+
+    What is carried over between chunks is hashes and obligation IDs. The
+    canonical records' values, needed only to rewrite a variant met in a later
+    chunk, are kept for the latest chunk and spilled to a temporary file after.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.content_columns = [column for column in self.columns if column != ID_COLUMN]
+        self._content_positions = None
+        # Normalized content hash -> (content hash, obligation_id, position in the spill file) of its canonical row
+        self._canonical = {}
+        # Content values of the canonical rows first seen in the latest chunk, not spilled yet
+        self._unspilled = {}
+        self._spill = None
+        # Each chunk's values are spilled as one block: its first position and file offset
+        self._block_starts = [0]
+        self._block_offsets = []
+        self._key_types = {}
+        self._shared_keys = set()
+        self._key_rows = Counter()
+        self._seen_rows = set()
+        # obligation_id -> whether it was repeated with different content
+        self._seen_ids = {}
+        self._repeated_ids = 0
+        self._repeated_examples = []
+        self._rows_checked = 0
+        self._rows_kept = 0
+        self._duplicates = 0
+        self._duplicate_examples = []
+        self._rewritten = 0
+        self._rewritten_examples = []
+        self._respelled_flags = Counter()
+        self._malformed_flags = Counter()
+        self._missing_flags = 0
+        self._missing = Counter()
+
+    def _spill_canonical(self):
+        """Move the values of the latest chunk's canonical rows to the spill file as one block"""
+        if not self._unspilled:
+            return
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix='validation-')
+        self._block_offsets.append(self._spill.seek(0, os.SEEK_END))
+        for position, key in enumerate(self._unspilled, start=self._block_starts[-1]):
+            content_key, obligation_id, _ = self._canonical[key]
+            self._canonical[key] = (content_key, obligation_id, position)
+        self._block_starts.append(self._block_starts[-1] + len(self._unspilled))
+        pickle.dump(list(self._unspilled.values()), self._spill, protocol=pickle.HIGHEST_PROTOCOL)
+        self._unspilled = {}
+
+    def _canonical_values(self, keys):
+        """Content values of the canonical rows of normalized content hashes.
+
+        Spilled blocks are read once each, one at a time.
+        """
+        values = [None] * len(keys)
+        wanted = {}
+        for i, key in enumerate(keys):
+            if key in self._unspilled:
+                values[i] = self._unspilled[key]
+                continue
+            position = self._canonical[key][2]
+            block = bisect.bisect_right(self._block_starts, position) - 1
+            wanted.setdefault(block, []).append((i, position - self._block_starts[block]))
+        for block, items in wanted.items():
+            self._spill.seek(self._block_offsets[block])
+            records = pickle.load(self._spill)
+            for i, j in items:
+                values[i] = records[j]
+        return values
+
+    def validate(self, df):
+        """The valid, deduplicated rows of a frame with a company_type column"""
+        self._spill_canonical()
+        self._rows_checked += len(df)
+        df = df.assign(**{MANDATORY_COLUMN: self._normalize_flags(df[MANDATORY_COLUMN])})
+        if self._content_positions is None:
+            self._content_positions = [df.columns.get_loc(column) for column in self.content_columns]
+
+        content = df[self.content_columns]
+        content_keys = hash_rows(content)
+        normalized = pd.DataFrame({column: normalize_text(content[column]) for column in self.content_columns})
+        keys = hash_rows(normalized)
+
+        # The first spelling of a normalized content in file order is its canonical record,
+        # so chunked and whole-file builds agree
+        firsts = pd.Series(keys).drop_duplicates()
+        firsts = firsts[[key not in self._canonical for key in firsts.tolist()]]
+        rows = firsts.index.values
+        ids = df[ID_COLUMN].values
+        for key, content_key, values, obligation_id in zip(
+            firsts.tolist(), content_keys[rows], content.iloc[rows].itertuples(index=False, name=None), ids[rows]
+        ):
+            self._canonical[key] = (content_key, obligation_id, None)
+            self._unspilled[key] = values
+        canonical_keys = np.fromiter(
+            (self._canonical[key][0] for key in keys.tolist()), dtype=np.uint64, count=len(keys)
+        )
+        variants = np.flatnonzero(canonical_keys != content_keys)
+        if len(variants):
+            df = df.copy()
+            df.iloc[variants, self._content_positions] = np.array(
+                self._canonical_values(keys[variants].tolist()), dtype=object
+            )
+            self._rewritten += len(variants)
+            _extend_examples(
+                self._rewritten_examples, ((ids[i], self._canonical[keys[i].item()][1]) for i in variants)
+            )
+
+        # Exact duplicates, of an earlier row of this chunk or of an earlier chunk
+        row_keys = hash_rows(df[self.columns]).tolist()
+        seen_rows = self._seen_rows
+        duplicate = np.zeros(len(row_keys), dtype=bool)
+        for i, row_key in enumerate(row_keys):
+            if row_key in seen_rows:
+                duplicate[i] = True
+            else:
+                seen_rows.add(row_key)
+        if duplicate.any():
+            self._duplicates += int(duplicate.sum())
+            _extend_examples(self._duplicate_examples, ids[duplicate])
+            df = df[~duplicate]
+            keys = keys[~duplicate]
+        self._rows_kept += len(df)
+
+        # Remaining repeats of an obligation_id differ in content, e.g. one row per state
+        seen_ids = self._seen_ids
+        for obligation_id in df[ID_COLUMN].values:
+            repeated = seen_ids.get(obligation_id)
+            if repeated is None:
+                seen_ids[obligation_id] = False
+            elif not repeated:
+                seen_ids[obligation_id] = True
+                self._repeated_ids += 1
+                _extend_examples(self._repeated_examples, [obligation_id])
+
+        pairs = pd.DataFrame({'key': keys, 'company_type': df['company_type'].values}).drop_duplicates()
+        for key, company_type in zip(pairs['key'].tolist(), pairs['company_type'].values):
+            if self._key_types.setdefault(key, company_type) != company_type:
+                self._shared_keys.add(key)
+        self._key_rows.update(Counter(keys.tolist()))
+
+        self._missing.update(df[self.columns].isna().sum().to_dict())
+        return df
+
+    def _normalize_flags(self, flags):
+        """Flags in their accepted spelling; unrecognized ones are kept as they are and reported"""
+        codes, uniques = pd.factorize(flags)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        self._missing_flags += int((codes < 0).sum())
+        canonical = []
+        for value, count in zip(uniques, counts):
+            flag = MANDATORY_FLAGS.get(NON_WORD_PATTERN.sub('', str(value).casefold()))
+            if flag is None:
+                self._malformed_flags[str(value)] += int(count)
+            elif flag != value:
+                self._respelled_flags[str(value)] += int(count)
+            canonical.append(flag if flag is not None else value)
+        return np.array(canonical + [np.nan], dtype=object)[codes]
+
+    def report(self):
+        """Summary of the findings over every chunk validated so far"""
+        return {
+            'version': VALIDATION_REPORT_VERSION,
+            'rows_checked': self._rows_checked,
+            'rows_kept': self._rows_kept,
+            'distinct_obligations': len(self._canonical),
+            'exact_duplicates': {
+                'rows_dropped': self._duplicates,
+                'examples': [str(i) for i in self._duplicate_examples],
+            },
+            'near_duplicates': {
+                'rows_rewritten': self._rewritten,
+                'examples': [{'obligation_id': str(i), 'canonical_id': str(c)} for i, c in self._rewritten_examples],
+            },
+            'shared_across_types': {
+                'obligations': len(self._shared_keys),
+                'rows': sum(self._key_rows[key] for key in self._shared_keys),
+            },
+            'repeated_ids': {
+                'count': self._repeated_ids,
+                'examples': [str(i) for i in self._repeated_examples],
+            },
+            'mandatory_flags': {
+                'respelled': dict(self._respelled_flags),
+                'malformed': dict(self._malformed_flags),
+                'missing': self._missing_flags,
+            },
+            'missing_values': {column: int(self._missing[column]) for column in self.columns if self._missing[column]},
+        }
+
+def print_validation_report(report):
+    """Print the findings of a validation report"""
+    print("\n" + "=" * 60)
+    print("VALIDATION REPORT")
+    print("=" * 60)
+    print(f"Rows checked: {report['rows_checked']}, kept: {report['rows_kept']}, "
+          f"distinct obligations: {report['distinct_obligations']}")
+
+    duplicates = report['exact_duplicates']
+    if duplicates['rows_dropped']:
+        print(f"⚠ Dropped {duplicates['rows_dropped']} exact duplicate rows "
+              f"(e.g. {', '.join(duplicates['examples'][:3])})")
+    else:
+        print("✓ No exact duplicate rows")
+
+    near = report['near_duplicates']
+    if near['rows_rewritten']:
+        examples = ', '.join(f"{e['obligation_id']} → {e['canonical_id']}" for e in near['examples'][:3])
+        print(f"⚠ Rewrote {near['rows_rewritten']} near-duplicate rows to their canonical spelling (e.g. {examples})")
+    else:
+        print("✓ No near-duplicate spellings")
+
+    shared = report['shared_across_types']
+    print(f"✓ {shared['obligations']} obligations shared across company types ({shared['rows']} rows)")
+
+    repeated = report['repeated_ids']
+    if repeated['count']:
+        print(f"⚠ {repeated['count']} obligation_ids repeated with different content "
+              f"(e.g. {', '.join(repeated['examples'][:3])})")
+
+    flags = report['mandatory_flags']
+    if flags['respelled']:
+        print(f"⚠ Normalized mandatory flags: {', '.join(f'{v!r} × {n}' for v, n in flags['respelled'].items())}")
+    if flags['malformed']:
+        print(f"⚠ Unrecognized mandatory flags kept as is: {', '.join(f'{v!r} × {n}' for v, n in flags['malformed'].items())}")
+    if flags['missing']:
+        print(f"⚠ {flags['missing']} rows without a mandatory flag")
+    if not (flags['respelled'] or flags['malformed'] or flags['missing']):
+        print("✓ All mandatory flags valid")
+
+def save_validation_report(report, path=VALIDATION_REPORT_FILE):
+    """Write a validation report as JSON"""
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def load_validation_report(path=VALIDATION_REPORT_FILE):
+    """Load a validation report, or None if missing or from another format version"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        report = json.load(f)
+    if report.get('version') != VALIDATION_REPORT_VERSION:
+        return None
+    return report